@@ -2,14 +2,18 @@
 
 from django.contrib import admin
 from .forms import OrderPreferenceSelect2WidgetForm
+from .pagination import CachedCountPaginator
 
 
 class OrderPreferenceAdmin(admin.ModelAdmin):
     """Register Order Preferences model."""
 
     list_display = ['order_number', 'created', 'user', 'course', 'fee_paid', 'get_author']
+    # `get_author` reads the course author.
+    list_select_related = ('user', 'course__author')
     search_fields = ['course__title']
-    filter_horizontal = ('tutor_suggestion',)
+    paginator = CachedCountPaginator
+    show_full_result_count = False
     form = OrderPreferenceSelect2WidgetForm
 
     def has_add_permission(self, request, obj=None):
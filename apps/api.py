@@ -0,0 +1,136 @@
+"""Read API over visible IPs.
+
+Responses select only the requested columns through `values()`, page with
+keyset cursors, and are encoded and compressed row by row as they stream
+out, so no model instance is built and no page is held in memory twice.
+"""
+
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from modeltranslation.settings import DEFAULT_LANGUAGE
+from modeltranslation.utils import build_localized_fieldname, get_language
+
+from .managers import name_field
+from .models import IP_I18N_FIELDS
+from .pagination import KeysetPaginator
+
+API_FIELDS = ('id', 'company_name', 'address1', 'address2', 'contact_name', 'description', 'email',
+              'contact_number', 'website', 'post_url', 'twitter_username', 'facebook_username', 'fb_fan_page',
+              'default_ticket_fee', 'default_ticket_fee_percentage')
+DEFAULT_FIELDS = ('id', 'company_name', 'website')
+ENCODINGS = ('br', 'gzip')
+
+
+def parse_fields(value):
+    """Return the requested fields, `id` first; raise ValueError for unknown ones."""
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = ['id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in API_FIELDS:
+            raise ValueError('Unknown field: %s.' % name)
+        fields.append(name)
+    return fields
+
+
+def projection(fields, language):
+    """Return `(name, columns)` pairs: translated fields fall back to the default language."""
+    pairs = []
+    for name in fields:
+        if name in IP_I18N_FIELDS:
+            columns = [build_localized_fieldname(name, code) for code in [language, DEFAULT_LANGUAGE]]
+            pairs.append((name, sorted(set(columns), key=columns.index)))
+        else:
+            pairs.append((name, [name]))
+    return pairs
+
+
+def _first(row, columns):
+    """Return the first non empty value of some columns."""
+    for column in columns:
+        if row[column] not in (None, ''):
+            return row[column]
+    return row[columns[0]]
+
+
+def _encode(rows, pairs, paginator, per_page, encoder):
+    """Yield the JSON of a page in chunks of `API_STREAM_ROWS` rows."""
+    yield '{"results":['
+    buffer, count, last, has_next = [], 0, None, False
+    for row in rows:
+        if count == per_page:
+            has_next = True
+            break
+        buffer.append(encoder.encode(dict((name, _first(row, columns)) for name, columns in pairs)))
+        last, count = row, count + 1
+        if len(buffer) >= settings.API_STREAM_ROWS:
+            yield (',' if count > len(buffer) else '') + ','.join(buffer)
+            buffer = []
+    if buffer:
+        yield (',' if count > len(buffer) else '') + ','.join(buffer)
+    yield '],"next":%s}' % json.dumps(paginator.cursor_for(last) if has_next else None)
+
+
+def stream_page(queryset, fields, cursor=None, per_page=None, language=None):
+    """Return an iterator of the JSON chunks of the page following `cursor`.
+
+    The cursor is decoded right away, so an invalid one raises before the
+    response starts.
+    """
+    language = language or get_language()
+    per_page = min(per_page or settings.IP_LIST_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+    key = name_field(language)
+    pairs = projection(fields, language)
+    columns = set([key, 'id']).union(*[columns for __, columns in pairs])
+    paginator = KeysetPaginator(queryset.values(*columns), key, per_page)
+    rows = paginator.rows_after(cursor, per_page + 1, chunked=True)
+    return _encode(rows, pairs, paginator, per_page, DjangoJSONEncoder(separators=(',', ':')))
+
+
+def _brotli():
+    """Return the brotli module when it is installed."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def negotiate_encoding(accept_encoding):
+    """Return the preferred supported content coding of an Accept-Encoding header, or None."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, __, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, 0) > 0 and (encoding != 'br' or _brotli() is not None):
+            return encoding
+    return None
+
+
+def compress_stream(chunks, encoding):
+    """Compress text chunks on the fly with `br` or `gzip`."""
+    if encoding == 'br':
+        compressor = _brotli().Compressor(quality=settings.API_BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(settings.API_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield finish()
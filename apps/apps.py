@@ -1,5 +1,58 @@
 from django.apps import AppConfig
+from django.db import connections, router
+from django.db.models.signals import post_migrate
+
+
+def create_search_schema(sender, using, **kwargs):
+    """Create the full-text structures of the user search index after migrate."""
+    from .models import IP
+    from .search import ensure_schema
+    if router.allow_migrate_model(using, IP):
+        ensure_schema(using)
+
+
+def create_event_index(sender, using, **kwargs):
+    """Index the events table owned by the events app for upcoming event lookups by IP."""
+    from .models import IP
+    ip_field = IP._meta.get_field('events').field
+    opts = ip_field.model._meta
+    connection = connections[using]
+    # MySQL has no CREATE INDEX IF NOT EXISTS; replicas receive the index from the primary.
+    if connection.vendor not in ('sqlite', 'postgresql') or not router.allow_migrate_model(using, ip_field.model):
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s, %s)' % (
+            quote('ip_upcoming_events_idx'), quote(opts.db_table), quote(ip_field.column),
+            quote(opts.get_field('session_earliest_starts').column)))
+
+
+def create_course_title_index(sender, using, **kwargs):
+    """Back the order admin search on course titles with a trigram index on PostgreSQL."""
+    from orders.models import OrderPreference
+    course_model = OrderPreference._meta.get_field('course').related_model
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not router.allow_migrate_model(using, course_model):
+        return
+    opts = course_model._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING gin (UPPER(%s) gin_trgm_ops)' % (
+            quote('course_title_trgm_idx'), quote(opts.db_table), quote(opts.get_field('title').column)))
 
 
 class AppsConfig(AppConfig):
     name = 'apps'
+
+    def ready(self):
+        from . import autocomplete, graphs, memberships, page_cache, portals, principal
+        post_migrate.connect(create_search_schema, sender=self)
+        post_migrate.connect(create_event_index, sender=self)
+        post_migrate.connect(create_course_title_index, sender=self)
+        memberships.connect_signals()
+        principal.connect_signals()
+        portals.connect_signals()
+        page_cache.connect_signals()
+        autocomplete.connect_signals()
+        graphs.connect_signals()
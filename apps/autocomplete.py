@@ -0,0 +1,118 @@
+"""Cached, column-projected results for the select2 autocomplete widgets.
+
+A widget fetches only `(id, label, haystack)` rows for a term, where the
+haystack is what the widget needs to match the term again in Python. The
+rows of a term are cached under the widget's namespace version and a
+fingerprint of the queryset it searches, so widgets over differently
+filtered querysets of one model never share results. When the
+rows of a shorter prefix are cached and complete, a longer term is answered
+by filtering them in memory: typing "jo", "joh", "john" scans once.
+Pages are slices of the cached rows.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models.signals import post_delete, post_save
+
+from . import routers
+from .cache_versions import bump_versions_on_commit, get_version
+
+AUTOCOMPLETE_NAMESPACE = 'autocomplete_%s'
+
+
+def _cache_key(namespace, scope, version, term):
+    """Return the cache key of the rows of a term."""
+    return 'autocomplete_%s_%s_%s_%s' % (namespace, scope, version, hashlib.md5(term.encode('utf-8')).hexdigest())
+
+
+def queryset_scope(queryset):
+    """Return a short fingerprint of the SQL of a queryset."""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 'none'
+    return hashlib.md5((u'%s%r' % (sql, params)).encode('utf-8')).hexdigest()[:16]
+
+
+def get_rows(widget, term):
+    """Return the cached or fetched rows matching a normalized term."""
+    namespace = widget.autocomplete_namespace
+    scope = queryset_scope(widget.get_queryset())
+    version = get_version(AUTOCOMPLETE_NAMESPACE % namespace)
+    prefixes = [term[:length] for length in range(len(term), settings.AUTOCOMPLETE_MIN_PREFIX - 1, -1)]
+    if '' not in prefixes:
+        prefixes.append('')
+    keys = [_cache_key(namespace, scope, version, prefix) for prefix in prefixes]
+    found = cache.get_many(keys)
+    if keys[0] in found:
+        return found[keys[0]]['rows']
+    for key in keys[1:]:
+        entry = found.get(key)
+        if entry is not None and entry['complete']:
+            entry = {'rows': [row for row in entry['rows'] if widget.row_matches(row[2], term)], 'complete': True}
+            break
+    else:
+        limit = settings.AUTOCOMPLETE_MAX_CANDIDATES
+        with routers.primary_reads():
+            rows = widget.search_rows(term, limit + 1)
+        entry = {'rows': rows[:limit], 'complete': len(rows) <= limit}
+    cache.set(keys[0], entry, settings.AUTOCOMPLETE_CACHE_EXPIRY)
+    return entry['rows']
+
+
+class CachedAutocompleteMixin(object):
+    """Serve a select2 widget's autocomplete from cached projected rows.
+
+    Widgets set `autocomplete_namespace` and implement `normalize_term`,
+    `search_rows` and `row_matches`; rows are `(pk, label, haystack)`.
+    """
+
+    autocomplete_namespace = None
+    data_view = 'autocomplete'
+
+    def normalize_term(self, term):
+        """Return the canonical form of a term, so equivalent terms share cache entries."""
+        return u' '.join(term.lower().split())
+
+    def search_rows(self, term, limit):
+        """Return up to `limit` rows matching a normalized term, in display order."""
+        raise NotImplementedError('Widgets must fetch their rows.')
+
+    def row_matches(self, haystack, term):
+        """Return whether a row matches a normalized term, as `search_rows` would decide."""
+        raise NotImplementedError('Widgets must match their rows.')
+
+    def autocomplete_page(self, term, page):
+        """Return the `(pk, label)` results of a page and whether more pages follow."""
+        rows = get_rows(self, self.normalize_term(term))
+        start = (page - 1) * self.max_results
+        end = start + self.max_results
+        return [(pk, label) for pk, label, __ in rows[start:end]], end < len(rows)
+
+
+def invalidate_autocomplete(namespace):
+    """Drop the cached rows of every widget in a namespace."""
+    bump_versions_on_commit([AUTOCOMPLETE_NAMESPACE % namespace])
+
+
+def _invalidate_receiver(namespace):
+    """Return a signal receiver invalidating a namespace."""
+    def receiver(**kwargs):
+        invalidate_autocomplete(namespace)
+    return receiver
+
+
+_receivers = {}
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    from ghana_location_api.models import Regions
+    from .models import UserSearchDocument
+    for namespace, model in (('users', UserSearchDocument), ('regions', Regions)):
+        receiver = _receivers.setdefault(namespace, _invalidate_receiver(namespace))
+        post_save.connect(receiver, sender=model, dispatch_uid='autocomplete_saved_%s' % namespace)
+        post_delete.connect(receiver, sender=model, dispatch_uid='autocomplete_deleted_%s' % namespace)
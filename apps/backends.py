@@ -0,0 +1,17 @@
+"""Authentication backends."""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class ProfileModelBackend(ModelBackend):
+    """Model backend loading the session user together with its profile."""
+
+    def get_user(self, user_id):
+        """Return the user and its profile in one query."""
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
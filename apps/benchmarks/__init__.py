@@ -0,0 +1,7 @@
+"""Performance benchmarks of the apps views, queries and widgets.
+
+Run with `manage.py benchmark --size 10000` (or 100000, 1000000). A test
+database is seeded with `size` rows per large table, every case is timed
+with Stripe and Twitter stubbed out, and the results are compared with a
+stored baseline.
+"""
@@ -0,0 +1,147 @@
+"""Timed benchmark cases.
+
+Each case is a function taking the shared `Context` and doing one unit of
+work; querysets are forced so the SQL runs inside the timed region.
+"""
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from ghana_location_api.models import Regions
+from orders.models import OrderPreference
+
+from ..admin import OrderPreferenceAdmin
+from ..fees import calculate_fees
+from ..forms import CustomUserWidget, RegionWidget
+from ..models import IP
+from ..stripe_sync import LocalStripeStub, sync_plans
+from ..twitter_feeds import FakeTimelineProvider, warm_feeds
+from ..views import PlanListView, PostView
+
+CASES = OrderedDict()
+
+FEE_ROWS = 2000
+
+STUBS = override_settings(STRIPE_PLAN_CLIENT='apps.stripe_sync.LocalStripeStub',
+                          TWITTER_TIMELINE_PROVIDER='apps.twitter_feeds.FakeTimelineProvider')
+
+
+def case(name):
+    """Register a function as the benchmark case `name`."""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+class Context(object):
+    """Users and requests shared by the cases of a run."""
+
+    def __init__(self):
+        """Pick the users the cases act as."""
+        self.factory = RequestFactory()
+        self.superuser = User.objects.filter(is_superuser=True).first() or \
+            User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        self.manager = User.objects.filter(username='manager0').get()
+        self.deep_cursor = None
+        ip_ids = list(IP.objects.order_by('pk').values_list('pk', flat=True)[:FEE_ROWS // 4])
+        self.fee_rows = [(ip_ids[i % len(ip_ids)], Decimal('%d.%02d' % (5 + i % 95, i % 100)), 1 + i % 4)
+                         for i in range(FEE_ROWS)]
+
+    def request(self, user, path='/', **params):
+        """Return a GET request made by `user`."""
+        request = self.factory.get(path, params)
+        request.user = user or AnonymousUser()
+        return request
+
+
+@case('plan_list_view')
+def plan_list_view(context):
+    """Render the plan list."""
+    PlanListView.as_view()(context.request(context.superuser, '/plans/')).render()
+
+
+@case('plan_sync_unchanged')
+def plan_sync_unchanged(context):
+    """Sync an unchanged plan catalogue, which should write nothing."""
+    sync_plans(client=LocalStripeStub.generate(200))
+
+
+@case('post_view')
+def post_view(context):
+    """Render the posts page of an administrator."""
+    PostView.as_view()(context.request(context.superuser, '/posts/')).render()
+
+
+@case('ip_for_user_superuser')
+def ip_for_user_superuser(context):
+    """List the first page of IPs a superuser may manage."""
+    list(IP.objects.for_user(context.superuser)[:25])
+
+
+@case('ip_for_user_manager')
+def ip_for_user_manager(context):
+    """List the IPs a plain manager may manage."""
+    list(IP.objects.for_user(context.manager))
+
+
+@case('ip_visible_first_page')
+def ip_visible_first_page(context):
+    """Fetch the first keyset page of visible IPs."""
+    page = IP.objects.visible().keyset_page()
+    context.deep_cursor = context.deep_cursor or page.next_cursor
+
+
+@case('ip_visible_next_page')
+def ip_visible_next_page(context):
+    """Fetch a keyset page past the first one."""
+    IP.objects.visible().keyset_page(context.deep_cursor)
+
+
+@case('ip_by_country')
+def ip_by_country(context):
+    """List the first page of IPs of one country."""
+    list(IP.objects.visible().by_country('GH')[:25])
+
+
+@case('custom_user_autocomplete')
+def custom_user_autocomplete(context):
+    """Run the custom user select2 search."""
+    list(CustomUserWidget().filter_queryset(None, 'jo')[:25])
+
+
+@case('region_autocomplete')
+def region_autocomplete(context):
+    """Run the region select2 search."""
+    widget = RegionWidget()
+    list(widget.filter_queryset(None, 'ash', queryset=Regions.objects.all())[:25])
+
+
+@case('order_preference_changelist')
+def order_preference_changelist(context):
+    """Render the order preference changelist."""
+    model_admin = OrderPreferenceAdmin(OrderPreference, admin.site)
+    model_admin.changelist_view(context.request(context.superuser, '/admin/orders/orderpreference/')).render()
+
+
+@case('twitter_feeds_warm')
+def twitter_feeds_warm(context):
+    """Resolve the feeds of a page of IPs against a local provider."""
+    ips = IP.objects.exclude(twitter_username=None).order_by('pk')[:25]
+    warm_feeds(ips, provider=FakeTimelineProvider())
+
+
+@case('ticket_fees_scalar')
+def ticket_fees_scalar(context):
+    """Price ticket rows one IP load and one fee at a time."""
+    sum(IP.objects.get(pk=ip_id).ticket_fee(price) * quantity for ip_id, price, quantity in context.fee_rows)
+
+
+@case('ticket_fees_batch')
+def ticket_fees_batch(context):
+    """Price the same rows with the batch fee engine."""
+    calculate_fees(context.fee_rows)
@@ -0,0 +1,80 @@
+"""Run the benchmark cases and compare them with a baseline.
+
+A baseline is a JSON document `{size: {case: {"wall_ms": ..., "queries": ...}}}`.
+A case regresses when its median wall time exceeds the baseline by more than
+the threshold, or when it runs more queries than the baseline. Queries are
+counted on every database alias, so reads routed to a replica count too.
+"""
+
+import json
+import statistics
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from .cases import CASES, STUBS, Context
+
+Result = namedtuple('Result', ['name', 'wall_ms', 'queries'])
+Regression = namedtuple('Regression', ['name', 'metric', 'baseline', 'measured'])
+
+
+def measure(name, func, context, repeat):
+    """Time `repeat` runs of a case; return the median and the query count of the last run."""
+    func(context)  # Warm up imports, templates and the query cache.
+    timings = []
+    for __ in range(repeat):
+        cache.clear()
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            start = time.perf_counter()
+            func(context)
+            timings.append((time.perf_counter() - start) * 1000)
+    return Result(name, round(statistics.median(timings), 3), sum(len(queries) for queries in captured))
+
+
+def run(names=None, repeat=5):
+    """Run the selected cases, or all of them, with Stripe and Twitter stubbed."""
+    with STUBS:
+        context = Context()
+        return [measure(name, CASES[name], context, repeat) for name in (names or CASES)]
+
+
+def load_baseline(path, size):
+    """Return the baseline of a dataset size, empty when there is none."""
+    try:
+        with open(path) as stream:
+            return json.load(stream).get(str(size), {})
+    except (IOError, OSError):
+        return {}
+
+
+def save_baseline(path, size, results):
+    """Store the results as the baseline of a dataset size."""
+    try:
+        with open(path) as stream:
+            baselines = json.load(stream)
+    except (IOError, OSError):
+        baselines = {}
+    baselines[str(size)] = dict((result.name, {'wall_ms': result.wall_ms, 'queries': result.queries})
+                                for result in results)
+    with open(path, 'w') as stream:
+        json.dump(baselines, stream, indent=2, sort_keys=True)
+        stream.write('\n')
+
+
+def compare(results, baseline, threshold):
+    """Return the regressions of the results against a baseline."""
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            continue
+        if result.wall_ms > expected['wall_ms'] * (1 + threshold):
+            regressions.append(Regression(result.name, 'wall_ms', expected['wall_ms'], result.wall_ms))
+        if result.queries > expected['queries']:
+            regressions.append(Regression(result.name, 'queries', expected['queries'], result.queries))
+    return regressions
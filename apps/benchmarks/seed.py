@@ -0,0 +1,121 @@
+"""Seed a database with a benchmark dataset of a given size."""
+
+import copy
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from ghana_location_api.models import Regions
+from modeltranslation.utils import build_localized_fieldname
+from orders.models import OrderPreference
+from user_profile.models import CustomUser
+
+from ..models import IP, IPCountry, SyncWatermark
+from ..search import rebuild_index
+from ..stripe_sync import LocalStripeStub, sync_plans
+
+SEED_MARKER = 'benchmark.seed'
+CHUNK = 5000
+PLAN_COUNT = 200
+MANAGER_COUNT = 500
+COUNTRIES = ('GH', 'NG', 'KE', 'ZA', 'EG', 'MA', 'SN', 'CI', 'TZ', 'UG', 'RW', 'ET', 'CM', 'BJ', 'TG', 'BF')
+REGIONS = ('Ashanti', 'Brong Ahafo', 'Central', 'Eastern', 'Greater Accra', 'Northern', 'Upper East',
+           'Upper West', 'Volta', 'Western', 'Ahafo', 'Bono East', 'North East', 'Oti', 'Savannah', 'Western North')
+FIRST_NAMES = ('Kwame', 'Ama', 'John', 'Johanna', 'Kofi', 'Akosua', 'Yaw', 'Efua', 'Kojo', 'Abena', 'Joseph', 'Esi')
+LAST_NAMES = ('Mensah', 'Owusu', 'Boateng', 'Asante', 'Johnson', 'Osei', 'Appiah', 'Addo', 'Danso', 'Ofori')
+CITIES = ('Accra', 'Kumasi', 'Tamale', 'Takoradi', 'Cape Coast', 'Sunyani', 'Ho', 'Koforidua')
+
+
+def seeded_size():
+    """Return the size of the dataset already in the database, or None."""
+    marker = SyncWatermark.objects.filter(name=SEED_MARKER).first()
+    return marker.objects_seen if marker else None
+
+
+def _chunks(items, size=CHUNK):
+    """Yield lists of at most `size` items from an iterable."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ip(rng, i):
+    """Return an unsaved IP with every translation filled."""
+    values = {
+        'company_name': '%s %s Events %d' % (rng.choice(LAST_NAMES), rng.choice(CITIES), i),
+        'address1': '%d %s Road' % (i, rng.choice(CITIES)),
+        'address2': rng.choice(REGIONS),
+        'contact_name': '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+        'description': 'Organizer number %d.' % i,
+    }
+    ip = IP(email='ip%d@example.com' % i, contact_number='0200%06d' % i, logo='ip/logo_%d.png' % i,
+            twitter_username='ip%d' % i if i % 3 == 0 else None, hidden=i % 20 == 0, disabled=i % 50 == 0,
+            default_ticket_fee=rng.choice([None, 1, 2.5]), default_ticket_fee_percentage=rng.choice([None, 5, 7.5]))
+    for name, value in values.items():
+        setattr(ip, name, value)
+        for lang_code, __ in settings.LANGUAGES:
+            setattr(ip, build_localized_fieldname(name, lang_code), value)
+    return ip
+
+
+def _custom_user(rng, i):
+    """Return an unsaved CustomUser."""
+    return CustomUser(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                      email='user%d@example.com' % i, street='%d High Street' % i, city=rng.choice(CITIES),
+                      region=rng.choice(REGIONS), phone_number='0244%06d' % i)
+
+
+def _order_template():
+    """Create the order every seeded order copies, with a user and a course of its own."""
+    user_model = OrderPreference._meta.get_field('user').related_model
+    course_model = OrderPreference._meta.get_field('course').related_model
+    user = user_model._default_manager.order_by('pk').first()
+    course_values = {'title': 'Benchmark course'}
+    if any(field.name == 'author' for field in course_model._meta.fields):
+        author_model = course_model._meta.get_field('author').related_model
+        course_values['author'] = author_model._default_manager.order_by('pk').first()
+    course = course_model._default_manager.create(**course_values)
+    return OrderPreference.objects.create(user=user, course=course, order_number='BENCH%08d' % 0)
+
+
+def _order(template, i):
+    """Return an unsaved copy of an order sharing the template's user and course."""
+    order = copy.copy(template)
+    order.pk = None
+    order.order_number = 'BENCH%08d' % i
+    return order
+
+
+def seed(size, seed_value=0):
+    """Fill the database with `size` IPs, users and orders plus their relations."""
+    rng = random.Random(seed_value)
+    with transaction.atomic():
+        Regions.objects.bulk_create(Regions(region=name, code=name[:2].upper()) for name in REGIONS)
+        User.objects.bulk_create(User(username='manager%d' % i) for i in range(MANAGER_COUNT))
+        managers = list(User.objects.filter(username__startswith='manager').values_list('pk', flat=True))
+    for chunk in _chunks(_ip(rng, i) for i in range(size)):
+        with transaction.atomic():
+            IP.objects.bulk_create(chunk)
+    through = IP.managers.through
+    ip_ids = IP.objects.order_by('pk').values_list('pk', flat=True).iterator()
+    for chunk in _chunks(ip_ids):
+        with transaction.atomic():
+            through.objects.bulk_create(through(ip_id=pk, user_id=rng.choice(managers)) for pk in chunk)
+            IPCountry.objects.bulk_create(IPCountry(ip_id=pk, country=country) for pk in chunk
+                                          for country in set(rng.sample(COUNTRIES, rng.randint(1, 2))))
+    for chunk in _chunks(_custom_user(rng, i) for i in range(size)):
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(chunk)
+    rebuild_index(batch_size=CHUNK)
+    template = _order_template()
+    for chunk in _chunks(_order(template, i) for i in range(1, size)):
+        with transaction.atomic():
+            OrderPreference.objects.bulk_create(chunk)
+    sync_plans(client=LocalStripeStub.generate(PLAN_COUNT))
+    SyncWatermark.objects.update_or_create(name=SEED_MARKER, defaults={'objects_seen': size})
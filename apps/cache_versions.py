@@ -0,0 +1,76 @@
+"""Version tokens for building cache keys that are invalidated by a single write.
+
+Cached values embed the current token of their namespace in their key, so
+bumping the token orphans every value at once. Tokens are random rather than
+counters: a token evicted from the cache is replaced by a fresh one and can
+never resurrect values cached under an older one.
+"""
+
+import uuid
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .telemetry import TelemetryCache
+
+VERSION_KEY = 'version_%s'
+
+
+def is_shared_cache():
+    """Return whether the default cache is shared by every process, so a bump reaches all of them."""
+    backend = caches['default']
+    while isinstance(backend, TelemetryCache):
+        backend = backend._cache
+    return not isinstance(backend, (LocMemCache, DummyCache))
+
+
+def _new_token():
+    """Return a fresh, unique version token."""
+    return uuid.uuid4().hex[:12]
+
+
+def get_version(namespace):
+    """Return the current version token of a namespace."""
+    key = VERSION_KEY % namespace
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, _new_token(), None)
+        token = cache.get(key)
+    return token
+
+
+def get_versions(namespaces):
+    """Return a dict of version tokens for several namespaces in one round trip."""
+    keys = dict((VERSION_KEY % namespace, namespace) for namespace in namespaces)
+    found = cache.get_many(list(keys))
+    missing = dict((key, _new_token()) for key in keys if key not in found)
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return dict((keys[key], token) for key, token in found.items())
+
+
+def bump_version(namespace):
+    """Invalidate every value cached under a namespace."""
+    cache.set(VERSION_KEY % namespace, _new_token(), None)
+
+
+def bump_versions(namespaces):
+    """Invalidate several namespaces in one round trip."""
+    namespaces = list(namespaces)
+    if namespaces:
+        cache.set_many(dict((VERSION_KEY % namespace, _new_token()) for namespace in namespaces), None)
+
+
+def bump_versions_on_commit(namespaces):
+    """Invalidate namespaces now and again once the current transaction commits.
+
+    The second bump orphans anything a concurrent reader cached from the
+    pre-commit state in between.
+    """
+    namespaces = list(namespaces)
+    bump_versions(namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(namespaces))
@@ -1,15 +1,16 @@
 from django.shortcuts import redirect
-from django.core.urlresolvers import reverse
+from django.urls import reverse
 from django.core.exceptions import PermissionDenied
+from .principal import get_principal
 
 
 def administration_required(function):
 
     def wrap(request, *args, **kwargs):
-        user = request.user
-        if user.is_anonymous():
+        principal = get_principal(request)
+        if principal.is_anonymous:
             raise PermissionDenied
-        elif user.is_superuser or user.profile.is_administrator():
+        elif principal.is_superuser or principal.is_administrator:
             return function(request, *args, **kwargs)
         else:
             raise PermissionDenied
@@ -22,10 +23,10 @@ def administration_required(function):
 def superadmin_required(function):
 
     def wrap(request, *args, **kwargs):
-        user = request.user
-        if user.is_anonymous():
+        principal = get_principal(request)
+        if principal.is_anonymous:
             raise PermissionDenied
-        elif user.is_superuser:
+        elif principal.is_superuser:
             return function(request, *args, **kwargs)
         else:
             raise PermissionDenied
@@ -0,0 +1,93 @@
+"""Ticket fees charged to IPs, one ticket at a time or in batches.
+
+The rule: a ticket costs its IP `default_ticket_fee` plus
+`default_ticket_fee_percentage` percent of its price, rounded half up to
+the cent; a missing default counts as zero. A line of `quantity` tickets
+costs `quantity` times the fee of one ticket.
+
+The batch engine reads each IP's fee schedule once, from the cache when
+possible, and computes in integer cents and hundredths of a percent, which
+gives exactly the Decimal result of the rule.
+"""
+
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ip_cache import ip_cache_keys
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+FeeSchedule = namedtuple('FeeSchedule', ['fixed_cents', 'percentage_hundredths'])
+FeeLine = namedtuple('FeeLine', ['ip_id', 'price', 'quantity', 'unit_fee', 'fee'])
+
+
+def ticket_fee(fixed, percentage, price):
+    """Return the fee of one ticket of `price` under a fixed fee and a percentage."""
+    fee = (fixed or 0) + Decimal(price) * (percentage or 0) / HUNDRED
+    return Decimal(fee).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _hundredths(value):
+    """Return a two decimal places amount as an integer number of hundredths."""
+    return int((value or 0) * 100)
+
+
+def get_schedules(ip_ids):
+    """Return the fee schedules of IPs by id, cached under each IP's version."""
+    from .models import IP
+    keys = ip_cache_keys(set(ip_ids), 'fee_schedule')
+    cached = cache.get_many(list(keys.values()))
+    schedules, missing = {}, []
+    for ip_id, key in keys.items():
+        if key in cached:
+            schedules[ip_id] = FeeSchedule(*cached[key])
+        else:
+            missing.append(ip_id)
+    if missing:
+        fresh = dict((ip_id, FeeSchedule(_hundredths(fixed), _hundredths(percentage)))
+                     for ip_id, fixed, percentage in IP.objects.filter(pk__in=missing)
+                     .values_list('pk', 'default_ticket_fee', 'default_ticket_fee_percentage'))
+        unknown = set(missing) - set(fresh)
+        if unknown:
+            raise IP.DoesNotExist('No IP with id %s.' % ', '.join(str(pk) for pk in sorted(unknown)))
+        cache.set_many(dict((keys[ip_id], tuple(schedule)) for ip_id, schedule in fresh.items()),
+                       settings.FEE_SCHEDULE_CACHE_EXPIRY)
+        schedules.update(fresh)
+    return schedules
+
+
+def _round_half_up(numerator, denominator):
+    """Return `numerator / denominator` rounded half away from zero, in integers."""
+    quotient = (2 * abs(numerator) + denominator) // (2 * denominator)
+    return quotient if numerator >= 0 else -quotient
+
+
+def calculate_fees(rows):
+    """Return a `FeeLine` of every `(ip_id, price, quantity)` row, in order."""
+    rows = [(ip_id, Decimal(price), quantity) for ip_id, price, quantity in rows]
+    schedules = get_schedules(ip_id for ip_id, __, __ in rows)
+    lines = []
+    for ip_id, price, quantity in rows:
+        schedule = schedules[ip_id]
+        cents = price * 100
+        if cents == cents.to_integral_value():
+            # Fee in cents = (fixed * 10000 + price cents * percent hundredths) / 10000, rounded
+            # half up once over the whole sum like the scalar rule.
+            unit_cents = _round_half_up(schedule.fixed_cents * 10000 + int(cents) * schedule.percentage_hundredths,
+                                        10000)
+            unit_fee = Decimal(unit_cents).scaleb(-2)
+        else:
+            # Sub-cent prices are rare; they take the Decimal rule.
+            unit_fee = ticket_fee(Decimal(schedule.fixed_cents).scaleb(-2),
+                                  Decimal(schedule.percentage_hundredths).scaleb(-2), price)
+        lines.append(FeeLine(ip_id, price, quantity, unit_fee, unit_fee * quantity))
+    return lines
+
+
+def total_fees(rows):
+    """Return the total fee of `(ip_id, price, quantity)` rows."""
+    return sum((line.fee for line in calculate_fees(rows)), Decimal('0.00'))
@@ -1,15 +1,24 @@
 """Django forms."""
 
 from django import forms
-from django_select2.forms import ModelSelect2Widget
+from django.db.models import OuterRef, Subquery
+from django_select2.forms import ModelSelect2MultipleWidget, ModelSelect2Widget
 from orders.models import OrderPreference
 from ghana_location_api.models import Regions
 from user_profile.models import CustomUser
+from .autocomplete import CachedAutocompleteMixin
+from .search import document_matches, normalize, search_documents, search_user_ids
+
+
+def user_label(first_name, last_name, email):
+    """Return the upper cased display name of a user, falling back to the email."""
+    name = u' '.join(part for part in (first_name, last_name) if part)
+    return (name or u'%s' % email).upper()
 
 
 # These widgets for the admin to implement select 2 in all choice fields.
 
-class RegionWidget(ModelSelect2Widget):
+class RegionWidget(CachedAutocompleteMixin, ModelSelect2Widget):
     """User select2 dropdown widget for django admin."""
 
     model = Regions
@@ -17,10 +26,24 @@ class RegionWidget(ModelSelect2Widget):
         'region__icontains',
         'code__icontains',
     ]
+    autocomplete_namespace = 'regions'
 
+    def search_rows(self, term, limit):
+        """Return `(pk, region, (region, code))` rows, lower cased for matching."""
+        rows = self.filter_queryset(None, term, self.get_queryset()).values_list('pk', 'region', 'code')[:limit]
+        return [(pk, region, ((region or '').lower(), (code or '').lower())) for pk, region, code in rows]
 
-class CustomUserWidget(ModelSelect2Widget):
-    """User select2 dropdown widget for django admin."""
+    def row_matches(self, haystack, term):
+        """Every word of the term is contained in the region or the code."""
+        return all(any(bit in field for field in haystack) for bit in term.split())
+
+    def label_from_instance(self, obj):
+        """Return the region name, as the autocomplete results do."""
+        return obj.region
+
+
+class CustomUserSearchMixin(CachedAutocompleteMixin):
+    """Search and label users for select2 widgets through the user search index."""
 
     model = CustomUser
     search_fields = [
@@ -33,17 +56,58 @@ class CustomUserWidget(ModelSelect2Widget):
         'phone_number__icontains',
         'professional_skills__professional_skills__icontains',
     ]
+    autocomplete_namespace = 'users'
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        """Match users through the search index, best ranked first."""
+        if queryset is None:
+            queryset = self.get_queryset()
+        if not term:
+            return queryset
+        documents = search_documents(term)
+        return queryset.filter(pk__in=documents.values('user_id')).annotate(
+            search_rank=Subquery(documents.filter(user_id=OuterRef('pk')).values('rank')[:1]),
+        ).order_by('search_rank', 'pk')
 
     def label_from_instance(self, obj):
         """Return name instead of email by default."""
-        if obj.first_name and obj.last_name:
-            return (str(obj.first_name) + " " + str(obj.last_name)).upper()
-        elif obj.first_name:
-            return str(obj.first_name).upper()
-        elif obj.last_name:
-            return str(obj.last_name).upper()
-        else:
-            return str(obj.email).upper()
+        return user_label(obj.first_name, obj.last_name, obj.email)
+
+    def normalize_term(self, term):
+        """Fold the term like the search documents."""
+        return normalize(term)
+
+    def search_rows(self, term, limit):
+        """Return `(pk, label, document)` rows of the best ranked users."""
+        queryset = self.get_queryset()
+        if term:
+            user_ids = search_user_ids(term, limit=limit)
+            queryset = queryset.filter(pk__in=user_ids)
+        rows = queryset.values_list('pk', 'first_name', 'last_name', 'email', 'search_document__document')
+        if not term:
+            return [(pk, user_label(first, last, email), document or '')
+                    for pk, first, last, email, document in rows.order_by('pk')[:limit]]
+        rows = dict((row[0], row) for row in rows)
+        return [(pk, user_label(*rows[pk][1:4]), rows[pk][4] or '') for pk in user_ids if pk in rows]
+
+    def row_matches(self, haystack, term):
+        """Match the stored document the way the search index does."""
+        return document_matches(haystack, term.split())
+
+
+class CustomUserWidget(CustomUserSearchMixin, ModelSelect2Widget):
+    """User select2 dropdown widget for django admin."""
+
+
+class TutorSuggestionWidget(CustomUserSearchMixin, ModelSelect2MultipleWidget):
+    """Tutor select2 multiple choice widget loading candidates page by page.
+
+    Only the selected tutors are rendered with the form; candidates are
+    searched and paged by the select2 autocomplete view, within the queryset
+    of the `tutor_suggestion` field.
+    """
+
+    max_results = 25
 
 
 class OrderPreferenceSelect2WidgetForm(forms.ModelForm):
@@ -57,4 +121,5 @@ class OrderPreferenceSelect2WidgetForm(forms.ModelForm):
         widgets = {
             "region": RegionWidget(),
             "user": CustomUserWidget(),
+            "tutor_suggestion": TutorSuggestionWidget(),
         }
@@ -0,0 +1,155 @@
+"""Hourly and daily rollups of user tracker data for the post graphs.
+
+Tracker points are `(timestamp, value)` pairs, as returned by
+`profile.get_graph_source_data()`. Each point is folded into one hourly and
+one daily `TrackerRollup` bucket as it is recorded, so graphs read a bounded
+number of pre-aggregated rows instead of the full history.
+
+Points are recorded when a row of `TRACKER_POINT_MODEL` is created, once its
+transaction commits; `TRACKER_POINT_FIELDS` names its user (or profile),
+timestamp and value fields. Nothing is recorded while they are unset. Bulk
+inserts send no signal; `rebuild_tracker_rollups` catches up with them.
+"""
+
+from datetime import datetime, timedelta
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.models import User
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import TrackerRollup
+
+RESOLUTIONS = {
+    TrackerRollup.HOUR: timedelta(hours=1),
+    TrackerRollup.DAY: timedelta(days=1),
+}
+
+
+def as_datetime(value):
+    """Return an aware datetime from a datetime or an epoch in seconds or milliseconds."""
+    if isinstance(value, datetime):
+        return value if timezone.is_aware(value) else timezone.make_aware(value, timezone.utc)
+    value = float(value)
+    if value > 1e11:
+        value /= 1000.0
+    try:
+        return datetime.fromtimestamp(value, timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError('Timestamp out of range: %r.' % value)
+
+
+def bucket_start(moment, resolution):
+    """Return the start of the bucket holding `moment`."""
+    moment = as_datetime(moment).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if resolution == TrackerRollup.DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _fold(user_id, resolution, bucket, count, total, minimum, maximum):
+    """Add aggregated values to a bucket, creating it if needed."""
+    rollups = TrackerRollup.objects.filter(user_id=user_id, resolution=resolution, bucket=bucket)
+    changes = dict(count=F('count') + count, total=F('total') + total,
+                   minimum=Least('minimum', minimum), maximum=Greatest('maximum', maximum))
+    if rollups.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            TrackerRollup.objects.create(user_id=user_id, resolution=resolution, bucket=bucket, count=count,
+                                         total=total, minimum=minimum, maximum=maximum)
+    except IntegrityError:
+        rollups.update(**changes)
+
+
+def record_points(user_id, points):
+    """Fold tracker points into the hourly and daily rollups of a user."""
+    buckets = {}
+    for timestamp, value in points:
+        if value is None:
+            continue
+        value = float(value)
+        for resolution in RESOLUTIONS:
+            key = (resolution, bucket_start(timestamp, resolution))
+            count, total, minimum, maximum = buckets.get(key, (0, 0.0, value, value))
+            buckets[key] = (count + 1, total + value, min(minimum, value), max(maximum, value))
+    with transaction.atomic():
+        for (resolution, bucket), aggregates in sorted(buckets.items()):
+            _fold(user_id, resolution, bucket, *aggregates)
+    return len(buckets)
+
+
+def rebuild_rollups(user, points):
+    """Replace every rollup of a user by those computed from `points`."""
+    with transaction.atomic():
+        TrackerRollup.objects.filter(user=user).delete()
+        return record_points(user.pk, points)
+
+
+def pick_resolution(start, end, max_points):
+    """Return the finest resolution keeping a range under `max_points` buckets."""
+    if (end - start) <= RESOLUTIONS[TrackerRollup.HOUR] * max_points:
+        return TrackerRollup.HOUR
+    return TrackerRollup.DAY
+
+
+def iter_series(user, start, end, resolution):
+    """Yield `[epoch ms, average, minimum, maximum, count]` rows of a range."""
+    rows = TrackerRollup.objects.filter(user=user, resolution=resolution, bucket__gte=bucket_start(start, resolution),
+                                        bucket__lt=end).order_by('bucket') \
+        .values_list('bucket', 'count', 'total', 'minimum', 'maximum')
+    for bucket, count, total, minimum, maximum in rows.iterator():
+        yield [int((bucket - datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds() * 1000),
+               total / count if count else None, minimum, maximum, count]
+
+
+def _owner_models():
+    """Return the models whose rows identify a user: users and profiles."""
+    return (User, User._meta.get_field('profile').related_model)
+
+
+def tracker_model():
+    """Return the model storing tracker points, or None when `TRACKER_POINT_MODEL` is unset."""
+    if not settings.TRACKER_POINT_MODEL:
+        return None
+    return django_apps.get_model(settings.TRACKER_POINT_MODEL)
+
+
+def tracker_fields(model):
+    """Return the `(user, timestamp, value)` fields of the tracker model named by `TRACKER_POINT_FIELDS`."""
+    if not settings.TRACKER_POINT_FIELDS or len(settings.TRACKER_POINT_FIELDS) != 3:
+        raise ImproperlyConfigured('TRACKER_POINT_FIELDS must name the user, timestamp and value fields.')
+    owner, moment, value = (model._meta.get_field(name) for name in settings.TRACKER_POINT_FIELDS)
+    if owner.related_model not in _owner_models():
+        raise ImproperlyConfigured('%s.%s is not a relation to users or profiles.' % (model.__name__, owner.name))
+    if not isinstance(moment, models.DateTimeField):
+        raise ImproperlyConfigured('%s.%s is not a datetime field.' % (model.__name__, moment.name))
+    return owner, moment, value
+
+
+def _point_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Post save signal for tracker points; new ones are folded into the rollups once they commit."""
+    if not created or raw:
+        return
+    owner, moment, value = tracker_fields(sender)
+    user_id = getattr(instance, owner.attname)
+    if owner.related_model is not User:
+        user_id = owner.related_model._default_manager.filter(pk=user_id) \
+            .values_list(User._meta.get_field('profile').field.attname, flat=True).first()
+    point = (getattr(instance, moment.attname), getattr(instance, value.attname))
+    if user_id is not None:
+        transaction.on_commit(lambda: record_points(user_id, [point]))
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    model = tracker_model()
+    if model is None:
+        return
+    tracker_fields(model)
+    post_save.connect(_point_saved, sender=model, dispatch_uid='graphs_tracker_point_saved')
@@ -0,0 +1,76 @@
+"""Versioned cache namespaces per IP with coalesced invalidation.
+
+Values cached for an IP use keys from `ip_cache_key`, which embed the IP's
+current generation token, so invalidating an IP is a single version bump.
+Invalidations requested inside a transaction are collected and flushed once,
+after it commits. Ids collected in a rolled back block are flushed with the
+next commit on the same connection, which only costs an extra version bump.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache_versions import bump_versions, get_version, get_versions
+
+IP_NAMESPACE = 'ip_%s'
+
+_pending = threading.local()
+
+
+def ip_cache_key(ip_id, name):
+    """Return the key of a value cached for an IP under its current generation."""
+    return 'ip_%s_%s_%s' % (ip_id, get_version(IP_NAMESPACE % ip_id), name)
+
+
+def ip_cache_keys(ip_ids, name):
+    """Return a dict of cache keys by IP id, reading the generations in one round trip."""
+    versions = get_versions(IP_NAMESPACE % ip_id for ip_id in ip_ids)
+    return dict((ip_id, 'ip_%s_%s_%s' % (ip_id, versions[IP_NAMESPACE % ip_id], name)) for ip_id in ip_ids)
+
+
+def _flush(ip_ids):
+    """Start a new generation for every IP in `ip_ids`."""
+    if not ip_ids:
+        return
+    bump_versions(IP_NAMESPACE % ip_id for ip_id in ip_ids)
+    # Keys that predate the namespaces are deleted in the same round trip.
+    cache.delete_many([key % ip_id for key in settings.IP_LEGACY_CACHE_KEYS for ip_id in ip_ids])
+
+
+def _flush_pending(alias):
+    """Flush the ids collected for `alias` once its transaction committed."""
+    ip_ids = _pending_ids(alias, clear=True)
+    if ip_ids:
+        _flush(ip_ids)
+
+
+def _pending_ids(alias, clear=False):
+    """Return the set of IP ids waiting for a commit on `alias` in this thread."""
+    pending = getattr(_pending, 'ip_ids', None)
+    if pending is None:
+        pending = _pending.ip_ids = {}
+    if clear:
+        return pending.pop(alias, set())
+    return pending.setdefault(alias, set())
+
+
+def invalidate_ips(ip_ids, using=None):
+    """Invalidate the cached data of several IPs, coalesced per transaction."""
+    ip_ids = set(ip_ids)
+    if not ip_ids:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _flush(ip_ids)
+        return
+    _pending_ids(connection.alias).update(ip_ids)
+    # Every call queues a callback, so ids survive the rollback of the savepoint
+    # that queued the first one; the first callback to run flushes them all.
+    transaction.on_commit(lambda: _flush_pending(connection.alias), using=using)
+
+
+def invalidate_ip(ip_id, using=None):
+    """Invalidate the cached data of one IP, coalesced per transaction."""
+    invalidate_ips([ip_id], using=using)
@@ -0,0 +1,231 @@
+"""Streaming bulk import and export of IP records with their translations.
+
+Rows are read and written one at a time and saved in batches with
+`bulk_create` / `bulk_update`, so memory stays constant whatever the size of
+the feed. Managers are linked with one insert per batch into the M2M table,
+and what `post_save` would have done per row (cache invalidation, logo
+relocation, renditions) runs once per batch instead.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from django.db import connections, transaction
+from modeltranslation.settings import DEFAULT_LANGUAGE
+from modeltranslation.utils import build_localized_fieldname
+
+from . import ip_cache, permissions, relocation, renditions
+from .models import IP, IP_I18N_FIELDS
+
+MANAGERS_COLUMN = 'managers'
+MANAGERS_SEPARATOR = ';'
+EXCLUDED_FIELDS = ('logo_renditions',)
+
+
+def export_fields():
+    """Return the IP columns exchanged in feeds, localized variants included."""
+    return [field.attname for field in IP._meta.concrete_fields if field.attname not in EXCLUDED_FIELDS]
+
+
+def _can_return_ids(connection):
+    """Return whether `bulk_create` sets primary keys on this backend."""
+    features = connection.features
+    return getattr(features, 'can_return_rows_from_bulk_insert',
+                   getattr(features, 'can_return_ids_from_bulk_insert', False))
+
+
+class CSVFormat(object):
+    """CSV rows; managers are ids joined with a semicolon."""
+
+    def __init__(self, stream):
+        """Wrap an open text stream."""
+        self.stream = stream
+
+    def read(self):
+        """Yield rows as dicts, empty cells as None."""
+        for row in csv.DictReader(self.stream):
+            row = dict((key, value if value != '' else None) for key, value in row.items())
+            if row.get(MANAGERS_COLUMN) is not None:
+                row[MANAGERS_COLUMN] = [int(pk) for pk in row[MANAGERS_COLUMN].split(MANAGERS_SEPARATOR) if pk]
+            yield row
+
+    def writer(self, columns):
+        """Return a callable writing one row."""
+        writer = csv.DictWriter(self.stream, columns)
+        writer.writeheader()
+
+        def write(row):
+            row = dict(row, **{MANAGERS_COLUMN: MANAGERS_SEPARATOR.join(str(pk) for pk in row[MANAGERS_COLUMN])})
+            writer.writerow(dict((key, '' if value is None else value) for key, value in row.items()))
+        return write
+
+
+class JSONLinesFormat(object):
+    """One JSON object per line; managers are a list of ids."""
+
+    def __init__(self, stream):
+        """Wrap an open text stream."""
+        self.stream = stream
+
+    def read(self):
+        """Yield rows as dicts, skipping blank lines."""
+        for line in self.stream:
+            if line.strip():
+                yield json.loads(line)
+
+    def writer(self, columns):
+        """Return a callable writing one row."""
+        def write(row):
+            self.stream.write(json.dumps(row, default=str, sort_keys=True))
+            self.stream.write('\n')
+        return write
+
+
+FORMATS = {'csv': CSVFormat, 'jsonl': JSONLinesFormat}
+
+
+def export_ips(stream, format='jsonl', queryset=None, batch_size=None):
+    """Write IP records to a stream and return how many were written."""
+    batch_size = batch_size or settings.IP_TRANSFER_BATCH_SIZE
+    columns = export_fields()
+    write = FORMATS[format](stream).writer(columns + [MANAGERS_COLUMN])
+    queryset = (queryset if queryset is not None else IP.objects.all()).order_by('pk')
+    through = IP.managers.through
+    last_pk, total = 0, 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).values(*columns)[:batch_size])
+        if not rows:
+            return total
+        ids = [row['id'] for row in rows]
+        managers = dict((pk, []) for pk in ids)
+        for ip_id, user_id in through.objects.filter(ip_id__in=ids).order_by('ip_id', 'user_id') \
+                .values_list('ip_id', 'user_id'):
+            managers[ip_id].append(user_id)
+        for row in rows:
+            row[MANAGERS_COLUMN] = managers[row['id']]
+            write(row)
+        total += len(rows)
+        last_pk = ids[-1]
+
+
+def _clean(row, fields):
+    """Return model values of a row, converted and with translations filled in."""
+    values = {}
+    for name, field in fields.items():
+        if name in row:
+            value = row[name]
+            values[name] = None if value is None and field.null else field.to_python(value)
+    for name in IP_I18N_FIELDS:
+        localized = build_localized_fieldname(name, DEFAULT_LANGUAGE)
+        # The base column mirrors the default language, fill whichever side is missing.
+        if values.get(localized) is None and values.get(name) is not None:
+            values[localized] = values[name]
+        elif values.get(name) is None and values.get(localized) is not None:
+            values[name] = values[localized]
+    return values
+
+
+class IPImporter(object):
+    """Save IP rows in batches."""
+
+    def __init__(self, batch_size=None, using='default'):
+        """Set up the importer."""
+        self.batch_size = batch_size or settings.IP_TRANSFER_BATCH_SIZE
+        self.using = using
+        self.fields = dict((field.attname, field) for field in IP._meta.concrete_fields
+                           if field.attname not in EXCLUDED_FIELDS)
+        self.created = self.updated = 0
+
+    def run(self, rows):
+        """Import an iterable of rows; return `(created, updated)`."""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        return self.created, self.updated
+
+    def _locked_ips(self):
+        """Return the IP queryset once no other transaction can insert IPs until this one ends."""
+        connection = connections[self.using]
+        if connection.vendor == 'sqlite':
+            # SQLite has a single writer: any write statement holds the database lock until commit.
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE %s SET %s = %s WHERE 0' % (
+                    connection.ops.quote_name(IP._meta.db_table),
+                    connection.ops.quote_name(IP._meta.pk.column), connection.ops.quote_name(IP._meta.pk.column)))
+            return IP.objects.using(self.using)
+        # Locking the highest row also locks the gap after it against inserts.
+        return IP.objects.using(self.using).select_for_update()
+
+    def _assign_ids(self, new):
+        """Give new records explicit ids where the backend cannot return them."""
+        missing = [ip for ip in new if ip.pk is None]
+        if not missing or _can_return_ids(connections[self.using]):
+            return
+        last = max([self._locked_ips().order_by('-pk').values_list('pk', flat=True).first() or 0] +
+                   [ip.pk for ip in new if ip.pk is not None])
+        for offset, ip in enumerate(missing, 1):
+            ip.pk = last + offset
+
+    def save_batch(self, rows):
+        """Create, update and link the managers of one batch of rows."""
+        with transaction.atomic(using=self.using):
+            cleaned = [(_clean(row, self.fields), row.get(MANAGERS_COLUMN)) for row in rows]
+            existing = IP.objects.using(self.using).in_bulk(
+                [values['id'] for values, __ in cleaned if values.get('id') is not None])
+            new, changed, update_fields, linked = [], [], set(), []
+            for values, managers in cleaned:
+                ip = existing.get(values.get('id'))
+                if ip is None:
+                    ip = IP(**values)
+                    new.append(ip)
+                else:
+                    for name, value in values.items():
+                        setattr(ip, name, value)
+                    update_fields.update(name for name in values if name != 'id')
+                    changed.append(ip)
+                if managers is not None:
+                    linked.append((ip, managers))
+            self._assign_ids(new)
+            IP.objects.using(self.using).bulk_create(new)
+            if changed and update_fields:
+                IP.objects.using(self.using).bulk_update(changed, sorted(update_fields))
+            self._link_managers(linked)
+            self._after_batch(new + changed)
+        self.created += len(new)
+        self.updated += len(changed)
+
+    def _link_managers(self, linked):
+        """Replace the managers of the given IPs with two statements."""
+        if not linked:
+            return
+        through = IP.managers.through
+        ip_ids = [ip.pk for ip, __ in linked]
+        affected = set(through.objects.using(self.using).filter(ip_id__in=ip_ids).values_list('user_id', flat=True))
+        through.objects.using(self.using).filter(ip_id__in=ip_ids).delete()
+        through.objects.using(self.using).bulk_create(
+            through(ip_id=ip.pk, user_id=user_id) for ip, managers in linked for user_id in set(managers))
+        affected.update(user_id for __, managers in linked for user_id in managers)
+        permissions.invalidate_managed_ips(affected)
+
+    def _after_batch(self, ips):
+        """Run once for the batch what post_save would have run per record."""
+        ip_cache.invalidate_ips((ip.pk for ip in ips), using=self.using)
+        pending = [ip for ip in ips if ip.logo and relocation.needs_relocation(ip)]
+        rendered = [ip.pk for ip in ips if ip.logo and renditions.needs_renditions(ip)]
+
+        def follow_up():
+            relocation.relocate_ip_logos(pending)
+            for ip_id in rendered:
+                renditions.schedule_renditions(ip_id)
+        transaction.on_commit(follow_up, using=self.using)
+
+
+def import_ips(stream, format='jsonl', batch_size=None):
+    """Import IP records from a stream; return `(created, updated)`."""
+    return IPImporter(batch_size=batch_size).run(FORMATS[format](stream).read())
@@ -0,0 +1,38 @@
+"""Generate logo renditions for existing IPs."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.models import IP
+from apps.renditions import generate_renditions, needs_renditions
+
+
+class Command(BaseCommand):
+    """Render the configured logo renditions of IPs in parallel batches."""
+
+    help = 'Backfill the logo renditions of existing IPs.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of IPs rendered in parallel per batch.')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that are already up to date.')
+
+    def handle(self, *args, **options):
+        """Render the renditions."""
+        batch_size = options['batch_size']
+        queryset = IP.objects.exclude(logo='').order_by('pk')
+        last_pk, done = 0, 0
+        with ProcessPoolExecutor(max_workers=settings.IP_LOGO_RENDITION_WORKERS) as pool:
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                pending = [ip for ip in batch if options['force'] or needs_renditions(ip)]
+                done += generate_renditions(pending, pool)
+                self.stdout.write('Rendered %s IPs, up to id %s.' % (done, last_pk))
+        self.stdout.write('Done, %s IPs rendered.' % done)
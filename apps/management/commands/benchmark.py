@@ -0,0 +1,74 @@
+"""Run the performance benchmarks against a seeded database."""
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.benchmarks import runner
+from apps.benchmarks.cases import CASES
+from apps.benchmarks.seed import seed, seeded_size
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(runner.__file__), 'baseline.json')
+
+
+class Command(BaseCommand):
+    """Seed a benchmark database, time the cases and check them against a baseline."""
+
+    help = 'Time views, queries and widgets on a seeded dataset and fail on regressions.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('cases', nargs='*',
+                            help='Only run these cases.')
+        parser.add_argument('--size', type=int, default=10000,
+                            help='Number of rows of each large table (10000, 100000, 1000000).')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per case; the median is reported.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded database for the next run of the same size.')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help='Path of the JSON baseline file.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed wall time increase over the baseline, 0.2 is 20%%.')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store the results as the new baseline of this size.')
+
+    def handle(self, *args, **options):
+        """Run the benchmarks."""
+        unknown = set(options['cases']) - set(CASES)
+        if unknown:
+            raise CommandError('Unknown cases: %s.' % ', '.join(sorted(unknown)))
+        size = options['size']
+        verbosity = options['verbosity']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # A file database, so --keepdb can reuse a seeded dataset.
+            test_settings['NAME'] = os.path.join(settings.BASE_DIR, 'benchmark_%s.sqlite3' % size)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if seeded_size() != size:
+                self.stdout.write('Seeding %s rows...' % size)
+                seed(size)
+            results = runner.run(options['cases'], repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=options['keepdb'])
+
+        baseline = runner.load_baseline(options['baseline'], size)
+        for result in results:
+            expected = baseline.get(result.name)
+            self.stdout.write('%-32s %10.3f ms %6d queries%s' % (
+                result.name, result.wall_ms, result.queries,
+                '   (baseline %.3f ms, %d queries)' % (expected['wall_ms'], expected['queries']) if expected else ''))
+        if options['save_baseline']:
+            runner.save_baseline(options['baseline'], size, results)
+            self.stdout.write('Baseline of size %s saved to %s.' % (size, options['baseline']))
+            return
+        if not baseline:
+            raise CommandError('No baseline of size %s in %s; record one with --save-baseline.' % (
+                size, options['baseline']))
+        regressions = runner.compare(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError('\n'.join('%s: %s went from %s to %s.' % regression for regression in regressions))
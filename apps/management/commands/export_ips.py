@@ -0,0 +1,37 @@
+"""Export IP records to a CSV or JSON lines feed."""
+
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ip_transfer import FORMATS, export_ips
+
+
+class Command(BaseCommand):
+    """Stream IP records out in primary key order."""
+
+    help = 'Export IP records with translations and managers to CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('path', help='Output file, or - for standard output.')
+        parser.add_argument('--format', choices=sorted(FORMATS), default=None,
+                            help='Feed format, guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of records read per query.')
+
+    def handle(self, *args, **options):
+        """Export the records."""
+        path = options['path']
+        format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if format not in FORMATS:
+            raise CommandError('Unknown format %r, use --format.' % format)
+        stream = sys.stdout if path == '-' else io.open(path, 'w', encoding='utf-8', newline='')
+        try:
+            total = export_ips(stream, format=format, batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        if stream is not sys.stdout:
+            self.stdout.write('%s IPs exported.' % total)
@@ -0,0 +1,36 @@
+"""Import IP records from a CSV or JSON lines feed."""
+
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ip_transfer import FORMATS, import_ips
+
+
+class Command(BaseCommand):
+    """Stream IP records in and save them in batches."""
+
+    help = 'Import IP records with translations and managers from CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('path', help='Feed file, or - for standard input.')
+        parser.add_argument('--format', choices=sorted(FORMATS), default=None,
+                            help='Feed format, guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of records saved per batch.')
+
+    def handle(self, *args, **options):
+        """Import the feed."""
+        path = options['path']
+        format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if format not in FORMATS:
+            raise CommandError('Unknown format %r, use --format.' % format)
+        stream = sys.stdin if path == '-' else io.open(path, encoding='utf-8', newline='')
+        try:
+            created, updated = import_ips(stream, format=format, batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write('%s IPs created, %s updated.' % (created, updated))
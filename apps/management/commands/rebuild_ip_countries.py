@@ -0,0 +1,26 @@
+"""Check and rebuild the materialized IP country memberships."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.memberships import rebuild_ip_countries
+
+
+class Command(BaseCommand):
+    """Compare IP country memberships with the events and repair them."""
+
+    help = 'Rebuild the IP to country membership table from events.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--check', action='store_true',
+                            help='Only report differences and exit with an error if any.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of IPs compared per batch.')
+
+    def handle(self, *args, **options):
+        """Check or rebuild the table."""
+        missing, stale = rebuild_ip_countries(fix=not options['check'], batch_size=options['batch_size'])
+        message = '%s missing and %s stale memberships.' % (missing, stale)
+        if options['check'] and (missing or stale):
+            raise CommandError(message)
+        self.stdout.write(message if options['check'] else 'Repaired %s' % message)
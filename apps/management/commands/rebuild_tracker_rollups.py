@@ -0,0 +1,26 @@
+"""Rebuild the tracker graph rollups from the full tracker history."""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from apps.graphs import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """Recompute the hourly and daily tracker rollups of users."""
+
+    help = 'Rebuild tracker rollups from profile.get_graph_source_data().'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('user_ids', nargs='*', type=int,
+                            help='Only rebuild these users.')
+
+    def handle(self, *args, **options):
+        """Rebuild the rollups."""
+        users = User.objects.filter(profile__isnull=False).select_related('profile').order_by('pk')
+        if options['user_ids']:
+            users = users.filter(pk__in=options['user_ids'])
+        for user in users.iterator():
+            buckets = rebuild_rollups(user, user.profile.get_graph_source_data())
+            self.stdout.write('User %s: %s buckets.' % (user.pk, buckets))
@@ -0,0 +1,23 @@
+"""Rebuild the denormalized user search index."""
+
+from django.core.management.base import BaseCommand
+
+from apps.autocomplete import invalidate_autocomplete
+from apps.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """Regenerate every user's search document."""
+
+    help = 'Rebuild the user autocomplete search index from scratch.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users indexed per bulk insert.')
+
+    def handle(self, *args, **options):
+        """Rebuild the index."""
+        total = rebuild_index(batch_size=options['batch_size'])
+        invalidate_autocomplete('users')
+        self.stdout.write('Indexed %s users.' % total)
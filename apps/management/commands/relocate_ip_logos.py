@@ -0,0 +1,35 @@
+"""Move legacy IP logos into the ip/ directory."""
+
+from django.core.management.base import BaseCommand
+
+from apps.models import IP
+from apps.relocation import LOGO_DIRECTORY, relocate_ip_logos
+
+
+class Command(BaseCommand):
+    """Relocate logos in batches, resuming where a previous run stopped."""
+
+    help = 'Relocate IP logos stored outside the ip/ directory.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of IPs relocated per batch.')
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='Only relocate IPs with a greater id.')
+
+    def handle(self, *args, **options):
+        """Relocate the logos."""
+        # Relocated rows drop out of the queryset, so a rerun resumes by itself.
+        queryset = IP.objects.exclude(logo='').exclude(logo__startswith=LOGO_DIRECTORY + '/').order_by('pk')
+        total = queryset.filter(pk__gt=options['start_after']).count()
+        last_pk, seen, moved = options['start_after'], 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            seen += len(batch)
+            moved += len(relocate_ip_logos(batch))
+            self.stdout.write('%s/%s processed, %s relocated, last id %s.' % (seen, total, moved, last_pk))
+        self.stdout.write('Done, %s of %s logos relocated.' % (moved, total))
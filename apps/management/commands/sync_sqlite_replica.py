@@ -0,0 +1,31 @@
+"""Copy the primary SQLite database to the replica files, for local development."""
+
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Refresh SQLite replicas with an online backup of the primary."""
+
+    help = 'Copy the primary SQLite database into every SQLite replica of REPLICA_DATABASES.'
+
+    def handle(self, *args, **options):
+        """Back up the primary into each replica."""
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite primaries can be copied; use real replication elsewhere.')
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in settings.REPLICA_DATABASES:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write('Copied %s to %s.' % (DEFAULT_DB_ALIAS, alias))
+        finally:
+            source.close()
@@ -0,0 +1,33 @@
+"""Sync Stripe plans into the local database."""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from apps.stripe_sync import sync_plans
+
+
+class Command(BaseCommand):
+    """Run the incremental Stripe plan sync once or periodically."""
+
+    help = 'Fetch Stripe plans page by page and upsert the ones that changed.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--page-size', type=int, default=None,
+                            help='Number of plans requested per Stripe page.')
+        parser.add_argument('--client', default=None,
+                            help='Dotted path of an alternative plan client class.')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sync every N seconds.')
+
+    def handle(self, *args, **options):
+        """Run the sync."""
+        client = import_string(options['client'])() if options['client'] else None
+        while True:
+            result = sync_plans(client=client, page_size=options['page_size'])
+            self.stdout.write('Synced %s plans (%s changed, %s pages).' % result)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
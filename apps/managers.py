@@ -1,8 +1,16 @@
 """Create and Manage Model Manager."""
-from django.db.models import Manager
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Count, F, Manager, Min, Prefetch, Q
 from django.db.models.query import QuerySet
-from .generic import repos
-from .constants import group_permissions
+from modeltranslation.utils import build_localized_fieldname, get_language
+from .pagination import KeysetPage, KeysetPaginator
+from .permissions import IP_ALL_PERMISSIONS, IP_OWN_PERMISSIONS, get_ip_permissions, get_managed_ip_ids
+
+
+def name_field(language=None):
+    """Return the company name column of a language, the active one by default."""
+    return build_localized_fieldname('company_name', language or get_language())
 
 
 class IPQuerySet(QuerySet):
@@ -10,12 +18,11 @@ class IPQuerySet(QuerySet):
 
     def for_user(self, user):
         """Method to get specific user permission records."""
-        if repos.user_has_perm(user, group_permissions.IP_VIEW_ALL) or \
-                repos.user_has_perm(user, group_permissions.IP_MANAGE_ALL):
+        perms = get_ip_permissions(user)
+        if perms & IP_ALL_PERMISSIONS:
             return self.all()
-        elif repos.user_has_perm(user, group_permissions.IP_VIEW_OWN) or \
-                repos.user_has_perm(user, group_permissions.IP_MANAGE_OWN):
-            return self.filter(managers__in=[user])
+        elif perms & IP_OWN_PERMISSIONS:
+            return self.filter(pk__in=get_managed_ip_ids(user))
         return self.none()
 
     def enabled(self):
@@ -26,8 +33,51 @@ class IPQuerySet(QuerySet):
         """Get the list of all visible records."""
         return self.enabled().filter(hidden=False)
 
+    def ordered_by_name(self, language=None):
+        """Order on the company name of the active language only, NULL names last like `keyset_page`."""
+        return self.order_by(F(name_field(language)).asc(nulls_last=True), 'pk')
+
+    def keyset_page(self, cursor=None, per_page=None, language=None):
+        """Return a page of records ordered by localized name, selected by cursor."""
+        paginator = KeysetPaginator(self, name_field(language), per_page or settings.IP_LIST_PAGE_SIZE)
+        return paginator.page(cursor)
+
+    def snapshots(self, language=None):
+        """Return the display snapshots of the records, fetched in one cache round trip."""
+        from .snapshots import get_snapshots
+        return get_snapshots(self.values_list('pk', flat=True), language)
+
+    def snapshot_page(self, cursor=None, per_page=None, language=None):
+        """Return a keyset page of display snapshots instead of model instances."""
+        from .snapshots import get_snapshots
+        page = self.only('pk', name_field(language)).keyset_page(cursor, per_page, language)
+        return KeysetPage(get_snapshots([ip.pk for ip in page.object_list], language), page.next_cursor,
+                          page.has_next)
+
+    def with_upcoming_events(self, now=None):
+        """Annotate upcoming event count and next start, and prefetch upcoming events.
+
+        Runs two queries whatever the number of records; the prefetched events
+        are stored in `upcoming_events` and reused by `IP.valid_events`.
+        """
+        now = now or datetime.now()
+        upcoming = Q(events__session_earliest_starts__gte=now)
+        event_model = self.model._meta.get_field('events').related_model
+        events = event_model._default_manager.filter(session_earliest_starts__gte=now) \
+            .order_by('session_earliest_starts')
+        return self.annotate(
+            upcoming_event_count=Count('events', filter=upcoming, distinct=True),
+            next_event_starts=Min('events__session_earliest_starts', filter=upcoming),
+        ).prefetch_related(Prefetch('events', queryset=events, to_attr='upcoming_events'))
+
+    def invalidate_cache(self):
+        """Invalidate the cached data of every IP in the queryset at once."""
+        from .ip_cache import invalidate_ips
+        invalidate_ips(self.values_list('pk', flat=True))
+
     def by_country(self, country):
-        """Get the list records by country."""
-        return self.filter(events__countries__country=country).distinct()
+        """Get the list records by country from the materialized memberships."""
+        from .memberships import country_key
+        return self.filter(country_memberships__country=country_key(country))
 
 IPManager = Manager.from_queryset(IPQuerySet)
@@ -0,0 +1,145 @@
+"""Incremental maintenance of the IP to country membership table.
+
+`IPCountry` holds one row per (IP, country) reachable through the IP's
+events, so `IPQuerySet.by_country` is a single indexed lookup instead of a
+join over events and their countries with a DISTINCT. Whenever an event or
+one of its countries changes, the memberships of the affected IPs are
+recomputed and the difference written back.
+"""
+
+import operator
+from functools import reduce
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+from .models import IP, IPCountry
+
+COUNTRY_LOOKUP = 'events__countries__country'
+
+
+def country_key(country):
+    """Return the value stored for a country, as `values_list` yields it for `COUNTRY_LOOKUP`.
+
+    Related countries are stored by primary key; plain country fields by
+    value, taking the code of country objects.
+    """
+    if _country_field().is_relation:
+        value = getattr(country, 'pk', country)
+    else:
+        value = getattr(country, 'code', country)
+    return u'%s' % value
+
+
+def source_countries(ip_ids):
+    """Return the set of (ip id, country) pairs computed from events."""
+    rows = IP.objects.filter(pk__in=ip_ids, **{'%s__isnull' % COUNTRY_LOOKUP: False}) \
+        .values_list('pk', COUNTRY_LOOKUP).distinct()
+    return set((ip_id, u'%s' % country) for ip_id, country in rows)
+
+
+def refresh_ip_countries(ip_ids):
+    """Bring the memberships of some IPs in line with their events."""
+    ip_ids = set(ip_id for ip_id in ip_ids if ip_id is not None)
+    if not ip_ids:
+        return
+    wanted = source_countries(ip_ids)
+    current = set(IPCountry.objects.filter(ip_id__in=ip_ids).values_list('ip_id', 'country'))
+    stale = current - wanted
+    if stale:
+        IPCountry.objects.filter(reduce(operator.or_, (Q(ip_id=ip_id, country=country)
+                                                       for ip_id, country in stale))).delete()
+    # A concurrent refresh of the same IPs may insert the same rows first.
+    IPCountry.objects.bulk_create([IPCountry(ip_id=ip_id, country=country) for ip_id, country in wanted - current],
+                                  ignore_conflicts=True)
+
+
+def rebuild_ip_countries(fix=True, batch_size=1000):
+    """Compare the whole table with the events; return `(missing, stale)` counts.
+
+    Differences are repaired unless `fix` is false.
+    """
+    missing = stale = 0
+    ip_ids = list(IP.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ip_ids), batch_size):
+        batch = ip_ids[start:start + batch_size]
+        wanted = source_countries(batch)
+        current = set(IPCountry.objects.filter(ip_id__in=batch).values_list('ip_id', 'country'))
+        missing += len(wanted - current)
+        stale += len(current - wanted)
+        if fix and wanted != current:
+            refresh_ip_countries(batch)
+    return missing, stale
+
+
+def _event_model():
+    """Return the event model behind `IP.events`."""
+    return IP._meta.get_field('events').related_model
+
+
+def _event_ip_attname():
+    """Return the attribute holding an event's IP id."""
+    return IP._meta.get_field('events').field.attname
+
+
+def _country_field():
+    """Return the field of an event country holding the country."""
+    return _event_model()._meta.get_field('countries').related_model._meta.get_field('country')
+
+
+def _event_ip_id(event):
+    """Return the IP id of an event."""
+    return getattr(event, _event_ip_attname())
+
+
+def _remember_previous_ip(sender, instance, raw=False, **kwargs):
+    """Pre save signal for keep the IP an event belonged to before the save."""
+    if instance.pk and not raw:
+        instance._previous_ip_id = sender._default_manager.filter(pk=instance.pk) \
+            .values_list(_event_ip_attname(), flat=True).first()
+
+
+def _event_changed(sender, instance, **kwargs):
+    """Save and delete signal for refresh the IPs of an event."""
+    refresh_ip_countries([_event_ip_id(instance), getattr(instance, '_previous_ip_id', None)])
+
+
+def _event_country_changed(sender, instance, **kwargs):
+    """Save and delete signal for refresh the IP of an event country."""
+    event_field = _event_model()._meta.get_field('countries').field
+    event_id = getattr(instance, event_field.attname)
+    refresh_ip_countries(_event_model()._default_manager.filter(pk=event_id)
+                         .values_list(_event_ip_attname(), flat=True))
+
+
+def _event_countries_m2m_changed(sender, instance, action, pk_set, **kwargs):
+    """M2M signal for refresh the IPs whose event countries changed."""
+    events = _event_model()._default_manager
+    if isinstance(instance, _event_model()):
+        if action.startswith('post_'):
+            refresh_ip_countries([_event_ip_id(instance)])
+    elif action == 'pre_clear':
+        # A country is dropping all its events; remember their IPs while the rows exist.
+        instance._cleared_ip_ids = list(events.filter(countries=instance)
+                                        .values_list(_event_ip_attname(), flat=True).distinct())
+    elif action == 'post_clear':
+        refresh_ip_countries(getattr(instance, '_cleared_ip_ids', []))
+    elif action.startswith('post_'):
+        refresh_ip_countries(events.filter(pk__in=pk_set).values_list(_event_ip_attname(), flat=True).distinct())
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    event_model = _event_model()
+    pre_save.connect(_remember_previous_ip, sender=event_model, dispatch_uid='ip_countries_event_pre')
+    post_save.connect(_event_changed, sender=event_model, dispatch_uid='ip_countries_event_save')
+    post_delete.connect(_event_changed, sender=event_model, dispatch_uid='ip_countries_event_delete')
+    countries = event_model._meta.get_field('countries')
+    if countries.many_to_many:
+        through = countries.through if countries.auto_created else countries.remote_field.through
+        m2m_changed.connect(_event_countries_m2m_changed, sender=through, dispatch_uid='ip_countries_m2m')
+    else:
+        post_save.connect(_event_country_changed, sender=countries.related_model,
+                          dispatch_uid='ip_countries_country_save')
+        post_delete.connect(_event_country_changed, sender=countries.related_model,
+                            dispatch_uid='ip_countries_country_delete')
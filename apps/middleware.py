@@ -0,0 +1,87 @@
+"""Request middlewares."""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.middleware import get_user
+from django.utils.functional import SimpleLazyObject
+
+from . import routers, telemetry
+from .principal import get_principal
+
+PROFILE_BACKEND = 'apps.backends.ProfileModelBackend'
+LEGACY_BACKENDS = ('django.contrib.auth.backends.ModelBackend',)
+
+
+def _session_user(request):
+    """Return the user of the session, moving sessions of legacy backends to `ProfileModelBackend`."""
+    if request.session.get(BACKEND_SESSION_KEY) in LEGACY_BACKENDS:
+        request.session[BACKEND_SESSION_KEY] = PROFILE_BACKEND
+    return get_user(request)
+
+
+class PrincipalMiddleware(object):
+    """Expose the role flags of the current user as `request.principal`.
+
+    The user is loaded with its profile whichever backend the session was
+    created with, so sessions of `LEGACY_BACKENDS` keep working without
+    listing them in `AUTHENTICATION_BACKENDS`.
+    """
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Attach a lazily resolved user and principal to the request."""
+        if hasattr(request, 'session'):
+            request.user = SimpleLazyObject(lambda: _session_user(request))
+        request.principal = SimpleLazyObject(lambda: get_principal(request))
+        return self.get_response(request)
+
+
+class TelemetryMiddleware(object):
+    """Record the latency, queries, cache lookups and external calls of sampled requests."""
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Serve the request, measuring it if it is sampled."""
+        if not telemetry.sampled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        with telemetry.trace_request() as trace:
+            try:
+                return self.get_response(request)
+            finally:
+                match = getattr(request, 'resolver_match', None)
+                view = (match.view_name if match is not None else None) or telemetry.UNRESOLVED
+                telemetry.record_request(view, time.perf_counter() - start, trace)
+                telemetry.maybe_write_file()
+
+
+class ReplicaMiddleware(object):
+    """Serve safe requests of `REPLICA_READ_VIEWS` from replicas, with read-your-writes stickiness."""
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Track the writes of the request and pin the client to the primary after one."""
+        with routers.replica_reads(enabled=False):
+            response = self.get_response(request)
+            wrote = routers.wrote()
+        if wrote:
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Allow replica reads for safe requests of listed views by clients that did not just write."""
+        if request.method in ('GET', 'HEAD') and settings.REPLICA_STICKY_COOKIE not in request.COOKIES and \
+                request.resolver_match.view_name in settings.REPLICA_READ_VIEWS:
+            routers.allow_replica_reads()
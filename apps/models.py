@@ -1,27 +1,29 @@
 """Django model."""
 
+import json
 import logging
 from datetime import datetime
 from decimal import Decimal
-import os
-import twitter
 from django.conf import settings
-from django.contrib.auth.models import User
-from django.core.cache import cache
+from django.contrib.auth.models import Group, Permission, User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
 
 from form_utils.fields import FakeEmptyFieldFile
 from .models import ImageSpecField
 from .processors import ResizeToFill
+from modeltranslation.settings import DEFAULT_LANGUAGE
 from modeltranslation.utils import build_localized_fieldname
 
+from user_profile.models import CustomUser
+
 from .managers import IPManager
+from . import fees, ip_cache, permissions, relocation, renditions, twitter_feeds
 from .utils import get_logo_path
-from .uploads import move_file
 from .validators import validate_uri
 
 logger = logging.getLogger(settings.CUSTOM_LOGGER)
@@ -29,6 +31,10 @@ logger = logging.getLogger(settings.CUSTOM_LOGGER)
 IP_I18N_FIELDS = ('company_name', 'address1', 'address2', 'contact_name', 'description')
 
 
+# Written by background jobs with queryset updates; a full save of a stale instance must not revert them.
+BACKGROUND_FIELDS = ('logo_renditions',)
+
+
 class IP(models.Model):
     """IP model with custom model manager and various properties."""
 
@@ -55,6 +61,7 @@ class IP(models.Model):
         source='logo',
         format='JPEG',
         options={'quality': 90},)
+    logo_renditions = models.TextField(blank=True, default='', editable=False)
 
     description = models.TextField(max_length=3072, verbose_name=_("Description"))
     fb_fan_page = models.URLField(blank=True, null=True)
@@ -78,60 +85,293 @@ class IP(models.Model):
     class Meta:
         """Meta objects."""
 
-        ordering = map(lambda (lang_code, __): build_localized_fieldname('company_name', lang_code),
-                       settings.LANGUAGES)
+        # A single column sort; listings order on the active language with `ordered_by_name`.
+        ordering = [build_localized_fieldname('company_name', DEFAULT_LANGUAGE), 'pk']
+        indexes = [models.Index(fields=[build_localized_fieldname('company_name', lang_code), 'id'],
+                                name='ip_name_%s_idx' % lang_code.replace('-', '_'))
+                   for lang_code, __ in settings.LANGUAGES]
 
     def __unicode__(self):
         """Return company name for object."""
         return self.company_name
 
-    @models.permalink
+    def save(self, *args, **kwargs):
+        """Save the record; a full update leaves the columns written in the background alone."""
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert') and \
+                not self._state.adding:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.attname for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.attname not in deferred and
+                                       field.attname not in BACKGROUND_FIELDS]
+        super(IP, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         """Return absolute url."""
         if self.post_url:
-            return 'vanity_url_catcher', (), {'event_slug': self.post_url}
-        return 'ip_detail', (), {'ip_id': self.id}
+            return reverse('vanity_url_catcher', kwargs={'event_slug': self.post_url})
+        return reverse('ip_detail', kwargs={'ip_id': self.id})
+
+    def ticket_fee(self, price):
+        """Return the fee charged for one ticket of `price`."""
+        return fees.ticket_fee(self.default_ticket_fee, self.default_ticket_fee_percentage, price)
 
     @property
     def valid_events(self):
-        """Return valid events."""
-        return self.events.filter(session_earliest_starts__gte=datetime.now())
+        """Return the valid events, as the `with_upcoming_events` prefetched list when present."""
+        if hasattr(self, 'upcoming_events'):
+            return self.upcoming_events
+        return self.events.filter(session_earliest_starts__gte=datetime.now()).order_by('session_earliest_starts')
+
+    @property
+    def logo_manifest(self):
+        """Return the manifest of pre-generated logo renditions."""
+        if getattr(self, '_logo_manifest_raw', None) != self.logo_renditions:
+            self._logo_manifest = json.loads(self.logo_renditions) if self.logo_renditions else {}
+            self._logo_manifest_raw = self.logo_renditions
+        return self._logo_manifest
+
+    def logo_rendition_url(self, key):
+        """Return the url of a pre-generated rendition such as `180x180.webp`, or None."""
+        manifest = self.logo_manifest
+        name = manifest.get('renditions', {}).get(key)
+        if name and self.logo and manifest.get('source') == self.logo.name:
+            return self.logo.storage.url(name)
+        return None
 
     @property
     def logo_m_url(self):
         """Return logo url."""
+        url = self.logo_rendition_url(settings.IP_LOGO_DEFAULT_RENDITION)
+        if url:
+            return url
         return getattr(self.logo_m, 'url', None)
 
     @property
     def get_twitter_feed(self):
-        """Return twitter feeds."""
-        tweets = cache.get("tweets_%s" % self.id)
-        if tweets:
-            return tweets
-        if not self.twitter_username:
-            return None
-        try:
-            tweets = twitter.Api().GetUserTimeline(self.twitter_username)
-            if tweets:
-                tweets = tweets[:settings.TWITTER_BLOCK_ITEMS]
-                cache.set("tweets_%s" % self.id, tweets, settings.TWITTER_BLOCK_CACHE_EXPIRY)
-                return tweets
-        except:
-            pass
-        return None
+        """Return twitter feeds, possibly stale while a refresh runs in the background."""
+        if not hasattr(self, '_twitter_feed'):
+            self._twitter_feed = twitter_feeds.get_feed(self)
+        return self._twitter_feed
 
 
 @receiver(post_save, sender=IP)
-def move_ip_logo(sender, instance, **kwargs):
-    """Post save signal for move ip logo."""
-    if instance.id and not isinstance(instance.logo, FakeEmptyFieldFile) and instance.logo:
-        segments = instance.logo.name.split(os.sep)
-        if segments[0] != 'ip':
-            move_file(move_ip_logo, IP, sender, instance, 'logo')
+def move_ip_logo(sender, instance, raw=False, **kwargs):
+    """Post save signal for move ip logo once the save commits."""
+    if not raw and instance.id and not isinstance(instance.logo, FakeEmptyFieldFile) and \
+            relocation.needs_relocation(instance):
+        ip_id = instance.id
+        transaction.on_commit(lambda: relocation.relocate_ip_logo(ip_id))
+
+
+@receiver(post_save, sender=IP)
+def render_ip_logo(sender, instance, raw=False, **kwargs):
+    """Post save signal for generate logo renditions once the save commits."""
+    if not raw and renditions.needs_renditions(instance):
+        ip_id = instance.id
+        transaction.on_commit(lambda: renditions.schedule_renditions(ip_id))
 
 
 @receiver(post_save, sender=IP)
 def invalidate_ips_cache(sender, instance, **kwargs):
-    """Post save signal for invalidate."""
-    from common.utils import cache_utils
-    cache_utils.invalidate_ip(instance.id)
+    """Post save signal for invalidate, flushed once when the transaction commits."""
+    ip_cache.invalidate_ip(instance.id)
+
+
+@receiver(post_delete, sender=IP)
+def invalidate_deleted_ips_cache(sender, instance, **kwargs):
+    """Post delete signal for invalidate, so snapshots of deleted IPs are not served."""
+    ip_cache.invalidate_ip(instance.id)
+
+
+@receiver(post_save, sender=IP)
+def build_ip_snapshots(sender, instance, raw=False, **kwargs):
+    """Post save signal for rebuild display snapshots once the invalidation committed."""
+    if not raw:
+        from .snapshots import build_snapshots
+        ip_id = instance.id
+        transaction.on_commit(lambda: build_snapshots([ip_id]))
+
+
+@receiver(m2m_changed, sender=IP.managers.through)
+def invalidate_ips_cache_on_managers(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for invalidate the IPs whose managers changed."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_ip_ids = list(instance.ip_manages.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            ip_cache.invalidate_ip(instance.id)
+        elif action == 'post_clear':
+            ip_cache.invalidate_ips(getattr(instance, '_cleared_ip_ids', []))
+        else:
+            ip_cache.invalidate_ips(pk_set)
+
+
+@receiver(m2m_changed, sender=IP.managers.through)
+def invalidate_managed_ips(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for invalidate the cached managed IP ids of the affected users."""
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_manager_ids = list(instance.managers.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        user_ids = [instance.pk] if reverse else getattr(instance, '_cleared_manager_ids', [])
+        permissions.invalidate_managed_ips(user_ids)
+    elif action in ('post_add', 'post_remove'):
+        permissions.invalidate_managed_ips([instance.pk] if reverse else pk_set)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for invalidate cached permission sets on membership changes."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        permissions.invalidate_user_permissions([instance.pk])
+    elif pk_set is None:
+        permissions.invalidate_group_permissions()
+    else:
+        permissions.invalidate_user_permissions(pk_set)
+
+
+USER_PERMISSION_FLAGS = ('is_superuser', 'is_staff', 'is_active')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_flags(sender, instance, created=False, update_fields=None, **kwargs):
+    """Post save signal for invalidate the user's permission set, unless no flag could have changed."""
+    if created or (update_fields is not None and not set(update_fields) & set(USER_PERMISSION_FLAGS)):
+        return
+    permissions.invalidate_user_permissions([instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_group_permissions(sender, **kwargs):
+    """Signal for invalidate every cached permission set when a group changes."""
+    if kwargs.get('action', 'post_delete').startswith('post_'):
+        permissions.invalidate_group_permissions()
+
+
+class IPCountry(models.Model):
+    """Materialized membership of an IP in the countries of its events."""
+
+    ip = models.ForeignKey(IP, related_name='country_memberships', on_delete=models.CASCADE)
+    country = models.CharField(max_length=64)
+
+    class Meta:
+        """Meta objects."""
+
+        unique_together = ('country', 'ip')
+
+    def __unicode__(self):
+        """Return the IP and country of the membership."""
+        return u'%s: %s' % (self.ip_id, self.country)
+
+
+class TrackerRollup(models.Model):
+    """Pre-aggregated tracker values of a user over an hour or a day."""
+
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTION_CHOICES = ((HOUR, _('Hourly')), (DAY, _('Daily')))
+
+    user = models.ForeignKey(User, related_name='tracker_rollups', on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        """Meta objects."""
+
+        unique_together = ('user', 'resolution', 'bucket')
+
+    def __unicode__(self):
+        """Return the user, resolution and bucket of the rollup."""
+        return u'%s %s %s' % (self.user_id, self.resolution, self.bucket)
+
+
+class SyncWatermark(models.Model):
+    """Progress marker of a background sync job against a remote API."""
+
+    name = models.CharField(max_length=64, unique=True)
+    last_synced = models.DateTimeField(null=True, blank=True)
+    objects_seen = models.PositiveIntegerField(default=0)
+    objects_changed = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        """Return the job name and its last sync time."""
+        return u'%s @ %s' % (self.name, self.last_synced)
+
+
+class StripeObjectFingerprint(models.Model):
+    """Digest of the last synced payload of a Stripe object."""
+
+    stripe_id = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    synced = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        """Return stripe id for object."""
+        return self.stripe_id
+
+
+class UserSearchDocument(models.Model):
+    """Normalized search text of a user, queried by the user autocomplete."""
+
+    user = models.OneToOneField(CustomUser, primary_key=True, on_delete=models.CASCADE,
+                                related_name='search_document')
+    document = models.TextField()
+
+    def __unicode__(self):
+        """Return the indexed document."""
+        return self.document
+
+
+@receiver(post_save, sender=CustomUser)
+def index_user_search_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Post save signal for refresh the user's search document."""
+    from .search import USER_SEARCH_FIELDS, index_user
+    if raw or (update_fields is not None and not set(update_fields) & set(USER_SEARCH_FIELDS)):
+        return
+    index_user(instance)
+
+
+@receiver(m2m_changed, sender=CustomUser.professional_skills.through)
+def index_user_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for refresh the search documents of the users whose skills changed."""
+    from .search import index_user, index_users
+    if action == 'pre_clear' and reverse:
+        instance._cleared_user_ids = list(CustomUser.objects.filter(professional_skills=instance)
+                                          .values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            index_user(instance)
+        elif action == 'post_clear':
+            index_users(CustomUser.objects.filter(pk__in=getattr(instance, '_cleared_user_ids', [])))
+        else:
+            index_users(CustomUser.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=CustomUser.professional_skills.field.related_model)
+def index_skill_users(sender, instance, created=False, raw=False, **kwargs):
+    """Post save signal for refresh the search documents of the users of a renamed skill."""
+    if not created and not raw:
+        from .search import index_users
+        index_users(CustomUser.objects.filter(professional_skills=instance))
+
+
+@receiver(pre_delete, sender=CustomUser.professional_skills.field.related_model)
+def collect_skill_users(sender, instance, **kwargs):
+    """Pre delete signal for remember the users of a skill before its links are deleted."""
+    instance._skill_user_ids = list(CustomUser.objects.filter(professional_skills=instance)
+                                    .values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=CustomUser.professional_skills.field.related_model)
+def index_deleted_skill_users(sender, instance, **kwargs):
+    """Post delete signal for refresh the search documents of the users of a deleted skill."""
+    from .search import index_users
+    index_users(CustomUser.objects.filter(pk__in=getattr(instance, '_skill_user_ids', [])))
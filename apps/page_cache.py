@@ -0,0 +1,114 @@
+"""Conditional GET and versioned caching of pages.
+
+A page declares the cache namespaces its content depends on, such as
+`plans` or an IP's namespace from `ip_cache`. Their current version tokens
+form the page's ETag, so a repeat visitor or the CDN gets a 304 without the
+view running, and the rendered page is cached under the same tokens for
+anonymous visitors. Saving a plan or an IP bumps its namespace, which
+changes the ETag and orphans every cached copy at once.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from . import routers
+from .cache_versions import bump_versions_on_commit, get_versions
+from .principal import USER_NAMESPACE
+
+PLANS_NAMESPACE = 'plans'
+
+
+def page_validator(request, namespaces):
+    """Return the ETag and cache key of a page under the current versions of its namespaces.
+
+    Pages of authenticated users also depend on the user's version and are
+    never shared between users.
+    """
+    namespaces = list(namespaces)
+    user = request.user
+    if user.is_authenticated:
+        namespaces.append(USER_NAMESPACE % user.pk)
+    versions = get_versions(namespaces)
+    parts = [request.get_full_path(), get_language() or '', str(user.pk)] + \
+        ['%s=%s' % (namespace, versions[namespace]) for namespace in namespaces]
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return quote_etag(digest), 'page_%s' % digest, versions
+
+
+class ConditionalPageMixin(object):
+    """Answer conditional GETs and cache rendered pages under versioned keys.
+
+    Subclasses return the namespaces of their content from
+    `get_cache_namespaces()`. Pages of authenticated users are not shared,
+    so their templates key `{% cache %}` fragments on the
+    `page_cache_version` context variable, which changes with the page's
+    namespaces, and expire them after `page_cache_expiry` seconds.
+    """
+
+    def get_cache_namespaces(self):
+        """Return the cache namespaces the page depends on."""
+        raise NotImplementedError('Subclasses must list the namespaces of their content.')
+
+    def get_context_data(self, **kwargs):
+        """Expose the version and lifetime of the page for fragment caching."""
+        context = super(ConditionalPageMixin, self).get_context_data(**kwargs)
+        context['page_cache_version'] = getattr(self, 'page_cache_version', '')
+        context['page_cache_expiry'] = settings.PAGE_CACHE_EXPIRY
+        return context
+
+    def dispatch(self, request, *args, **kwargs):
+        """Serve a 304, a cached copy or a freshly rendered page."""
+        if request.method not in ('GET', 'HEAD'):
+            return super(ConditionalPageMixin, self).dispatch(request, *args, **kwargs)
+        # The url kwargs are needed to know which objects the page shows.
+        self.request, self.args, self.kwargs = request, args, kwargs
+        etag, key, versions = page_validator(request, self.get_cache_namespaces())
+        self.page_cache_version = '-'.join(versions[namespace] for namespace in sorted(versions))
+        entry = cache.get(key)
+        last_modified = entry['rendered'] if entry else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None and entry is not None and 'content' in entry:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        if response is None:
+            with routers.primary_reads():
+                response = super(ConditionalPageMixin, self).dispatch(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+            if response.status_code != 200 or response.streaming:
+                return response
+            last_modified = int(time.time())
+            # Pages carrying a CSRF token pair it with the visitor's cookie and are never shared.
+            entry = {'rendered': last_modified,
+                     'private': bool(request.user.is_authenticated or request.META.get('CSRF_COOKIE_USED'))}
+            if not entry['private']:
+                entry.update(content=response.content, content_type=response['Content-Type'])
+            cache.set(key, entry, settings.PAGE_CACHE_EXPIRY)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if request.user.is_authenticated or (entry or {}).get('private'):
+            patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        else:
+            patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+        patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+        return response
+
+
+def invalidate_plans(**kwargs):
+    """Start a new version of every page showing plans."""
+    bump_versions_on_commit([PLANS_NAMESPACE])
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    from djstripe.models import Plan
+    post_save.connect(invalidate_plans, sender=Plan, dispatch_uid='page_cache_plan_saved')
+    post_delete.connect(invalidate_plans, sender=Plan, dispatch_uid='page_cache_plan_deleted')
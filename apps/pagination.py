@@ -0,0 +1,144 @@
+"""Keyset (cursor) pagination and paginators for large tables.
+
+Pages are selected with a `WHERE key >= last key AND (key > last key OR
+pk > last pk)` condition instead of OFFSET: the leading range lets an index
+on `(key, pk)` serve both the filter and the order, so the tenth thousandth
+page costs the same as the first on every backend. Rows whose key is NULL
+sort last, in pk order, and are read by a second query once the keyed rows
+run out, since no single index range covers both.
+"""
+
+import base64
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+KeysetPage = namedtuple('KeysetPage', ['object_list', 'next_cursor', 'has_next'])
+
+
+def encode_cursor(values):
+    """Return an opaque, url safe cursor for a row's sort values."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the sort values packed in a cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise SuspiciousOperation('Invalid pagination cursor.')
+    if not isinstance(values, list) or len(values) != 2:
+        raise SuspiciousOperation('Invalid pagination cursor.')
+    return values
+
+
+class KeysetPaginator(object):
+    """Paginate a queryset on one sort key with the primary key as tiebreaker.
+
+    Rows may be model instances or dicts from `values()` that include the
+    sort key and the primary key column.
+    """
+
+    def __init__(self, queryset, key, per_page):
+        """Set up the paginator; `key` is the name of the sort column."""
+        self.queryset = queryset
+        self.key = key
+        self.pk_name = queryset.model._meta.pk.attname
+        self.per_page = per_page
+
+    def _parts(self, cursor):
+        """Return the ordered querysets of the rows following `cursor`, keyed rows first."""
+        keyed = self.queryset.filter(**{'%s__isnull' % self.key: False}).order_by(self.key, 'pk')
+        nulls = self.queryset.filter(**{'%s__isnull' % self.key: True}).order_by('pk')
+        if not cursor:
+            return [keyed, nulls]
+        value, pk = decode_cursor(cursor)
+        if value is None:
+            return [nulls.filter(pk__gt=pk)]
+        after = Q(**{'%s__gte' % self.key: value}) & (Q(**{'%s__gt' % self.key: value}) | Q(pk__gt=pk))
+        return [keyed.filter(after), nulls]
+
+    def rows_after(self, cursor=None, limit=None, chunked=False):
+        """Return an iterator of at most `limit` rows following `cursor`.
+
+        The cursor is decoded right away; the NULL keyed rows are only
+        queried when the keyed ones do not fill the limit. `chunked` streams
+        rows from the database cursor, skipping prefetches.
+        """
+        return self._iter_rows(self._parts(cursor), limit, chunked)
+
+    def _iter_rows(self, parts, limit, chunked):
+        """Yield rows from the parts in order, up to `limit`."""
+        for queryset in parts:
+            if limit is not None:
+                if limit <= 0:
+                    return
+                queryset = queryset[:limit]
+            for row in (queryset.iterator() if chunked else queryset):
+                yield row
+                if limit is not None:
+                    limit -= 1
+
+    def cursor_for(self, row):
+        """Return the cursor of the page following `row`."""
+        if isinstance(row, dict):
+            return encode_cursor([row[self.key], row[self.pk_name]])
+        return encode_cursor([getattr(row, self.key), getattr(row, self.pk_name)])
+
+    def page(self, cursor=None):
+        """Return the page following `cursor`, or the first page."""
+        rows = list(self.rows_after(cursor, self.per_page + 1))
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self.cursor_for(rows[-1]) if has_next else None
+        return KeysetPage(rows, next_cursor, has_next)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose total count is estimated or cached on large tables.
+
+    Unfiltered PostgreSQL tables use the planner's row estimate once it
+    exceeds `ESTIMATE_THRESHOLD`; other counts are cached for
+    `PAGINATOR_COUNT_CACHE_EXPIRY` seconds under the SQL of the query.
+    """
+
+    ESTIMATE_THRESHOLD = 100000
+
+    def _estimate(self):
+        """Return the planner's row estimate of an unfiltered table, or None."""
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= self.ESTIMATE_THRESHOLD:
+            return int(row[0])
+        return None
+
+    @cached_property
+    def count(self):
+        """Return the estimated or cached number of objects."""
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super(CachedCountPaginator, self).count
+        estimate = self._estimate()
+        if estimate is not None:
+            return estimate
+        sql, params = queryset.query.sql_with_params()
+        key = 'paginator_count_%s' % hashlib.md5((u'%s%r' % (sql, params)).encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.PAGINATOR_COUNT_CACHE_EXPIRY)
+        return count
@@ -0,0 +1,90 @@
+"""Resolved IP permission sets, cached per request and in the shared cache.
+
+`IPQuerySet.for_user` needs up to four permission checks and, for scoped
+users, the ids of the IPs they manage. Both are resolved once and cached under
+versioned keys: per user for direct permissions, group membership and managed
+IPs, and globally for group permission changes. A process-local cache would
+keep granting revoked access in the other processes, so without a shared
+cache they are only memoized for the request.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_versions import bump_versions_on_commit, get_versions, is_shared_cache
+from .constants import group_permissions
+from .generic import repos
+
+IP_PERMISSIONS = (
+    group_permissions.IP_VIEW_ALL,
+    group_permissions.IP_MANAGE_ALL,
+    group_permissions.IP_VIEW_OWN,
+    group_permissions.IP_MANAGE_OWN,
+)
+IP_ALL_PERMISSIONS = frozenset([group_permissions.IP_VIEW_ALL, group_permissions.IP_MANAGE_ALL])
+IP_OWN_PERMISSIONS = frozenset([group_permissions.IP_VIEW_OWN, group_permissions.IP_MANAGE_OWN])
+
+GROUP_PERMISSIONS_NAMESPACE = 'group_perms'
+USER_PERMISSIONS_NAMESPACE = 'user_perms_%s'
+USER_MANAGED_IPS_NAMESPACE = 'user_managed_ips_%s'
+
+
+def _resolve_permissions(user):
+    """Return the IP permissions granted to a user, asking the auth tables."""
+    return frozenset(perm for perm in IP_PERMISSIONS if repos.user_has_perm(user, perm))
+
+
+def get_ip_permissions(user):
+    """Return the frozenset of IP permissions of a user.
+
+    The result is memoized on the user object, which lives as long as the
+    request, and shared across processes through the cache when it is shared.
+    """
+    perms = getattr(user, '_ip_permissions', None)
+    if perms is not None:
+        return perms
+    if not user.pk or not is_shared_cache():
+        perms = _resolve_permissions(user)
+    else:
+        versions = get_versions([GROUP_PERMISSIONS_NAMESPACE, USER_PERMISSIONS_NAMESPACE % user.pk])
+        key = 'ip_perms_%s_%s_%s' % (versions[GROUP_PERMISSIONS_NAMESPACE],
+                                     versions[USER_PERMISSIONS_NAMESPACE % user.pk], user.pk)
+        perms = cache.get(key)
+        if perms is None:
+            perms = _resolve_permissions(user)
+            cache.set(key, perms, settings.PERMISSION_CACHE_EXPIRY)
+    user._ip_permissions = perms
+    return perms
+
+
+def get_managed_ip_ids(user):
+    """Return the frozenset of ids of the IPs a user manages."""
+    ip_ids = getattr(user, '_managed_ip_ids', None)
+    if ip_ids is not None:
+        return ip_ids
+    if not is_shared_cache():
+        ip_ids = frozenset(user.ip_manages.values_list('pk', flat=True))
+    else:
+        namespace = USER_MANAGED_IPS_NAMESPACE % user.pk
+        key = 'ip_managed_ids_%s_%s' % (get_versions([namespace])[namespace], user.pk)
+        ip_ids = cache.get(key)
+        if ip_ids is None:
+            ip_ids = frozenset(user.ip_manages.values_list('pk', flat=True))
+            cache.set(key, ip_ids, settings.PERMISSION_CACHE_EXPIRY)
+    user._managed_ip_ids = ip_ids
+    return ip_ids
+
+
+def invalidate_user_permissions(user_ids):
+    """Invalidate the cached permission sets of some users."""
+    bump_versions_on_commit(USER_PERMISSIONS_NAMESPACE % pk for pk in user_ids)
+
+
+def invalidate_group_permissions():
+    """Invalidate every cached permission set."""
+    bump_versions_on_commit([GROUP_PERMISSIONS_NAMESPACE])
+
+
+def invalidate_managed_ips(user_ids):
+    """Invalidate the cached managed IP ids of some users."""
+    bump_versions_on_commit(USER_MANAGED_IPS_NAMESPACE % pk for pk in user_ids)
@@ -0,0 +1,153 @@
+"""Cached resolution of a user's base portal.
+
+`profile.get_base_portal()` walks several related tables, so its result is
+cached per user under the user's version and the global portal version.
+The user's version is bumped on profile changes and when a portal reached
+through one of the profile relations named in `BASE_PORTAL_RELATIONS` changes
+or is (un)assigned, for the users linked to it only. The global version is
+bumped when a model listed in `BASE_PORTAL_INVALIDATION_MODELS` changes.
+While `BASE_PORTAL_RELATIONS` is None, base portals are not cached.
+"""
+import operator
+from functools import reduce
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.utils.functional import SimpleLazyObject
+
+from .cache_versions import bump_versions_on_commit, get_versions
+from .principal import USER_NAMESPACE, invalidate_users
+
+PORTALS_NAMESPACE = 'portals'
+
+
+def _cache_keys(user_ids):
+    """Return the portal cache key of each user id."""
+    namespaces = [PORTALS_NAMESPACE] + [USER_NAMESPACE % user_id for user_id in user_ids]
+    versions = get_versions(namespaces)
+    return dict((user_id, 'base_portal_%s_%s_%s' % (user_id, versions[PORTALS_NAMESPACE],
+                                                    versions[USER_NAMESPACE % user_id]))
+                for user_id in user_ids)
+
+
+def get_base_portal(user):
+    """Return the base portal of a user, from the cache when possible."""
+    return warm_base_portals([user])[user.pk]
+
+
+def warm_base_portals(users):
+    """Resolve the base portals of many users with one cache round trip.
+
+    Return a dict of portals by user id; portals missing from the cache are
+    computed and stored together.
+    """
+    users = dict((user.pk, user) for user in users)
+    if settings.BASE_PORTAL_RELATIONS is None:
+        return dict((user_id, user.profile.get_base_portal()) for user_id, user in users.items())
+    keys = _cache_keys(list(users))
+    cached = cache.get_many(list(keys.values()))
+    portals, missing = {}, {}
+    for user_id, key in keys.items():
+        if key in cached:
+            # Values are wrapped in a tuple so a user without portal is cached too.
+            portals[user_id] = cached[key][0]
+        else:
+            portals[user_id] = users[user_id].profile.get_base_portal()
+            missing[key] = (portals[user_id],)
+    if missing:
+        cache.set_many(missing, settings.BASE_PORTAL_CACHE_EXPIRY)
+    return portals
+
+
+def lazy_base_portal(user):
+    """Return the base portal of a user, resolved only if something reads it."""
+    return SimpleLazyObject(lambda: get_base_portal(user))
+
+
+def invalidate_portals(**kwargs):
+    """Signal for drop the cached base portal of every user."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_versions_on_commit([PORTALS_NAMESPACE])
+
+
+def _profile_model():
+    """Return the profile model of users."""
+    return User._meta.get_field('profile').related_model
+
+
+def portal_relations():
+    """Return the profile fields named by `BASE_PORTAL_RELATIONS`."""
+    profile_model = _profile_model()
+    fields = []
+    for name in settings.BASE_PORTAL_RELATIONS or ():
+        try:
+            field = profile_model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.is_relation or field.related_model is None:
+            raise ImproperlyConfigured('%s.%s is not a relation.' % (profile_model.__name__, name))
+        fields.append(field)
+    return fields
+
+
+def _through(field):
+    """Return the m2m table of a many-to-many profile relation."""
+    return field.remote_field.through if field.concrete else field.through
+
+
+def _linked_users(fields, instance):
+    """Return the ids of the users whose profile reaches `instance` through one of `fields`."""
+    if not fields:
+        return []
+    user_field = User._meta.get_field('profile').field.attname
+    return list(_profile_model()._default_manager.filter(
+        reduce(operator.or_, (Q(**{field.name: instance}) for field in fields)))
+        .values_list(user_field, flat=True).distinct())
+
+
+def _portal_saved(sender, instance, raw=False, **kwargs):
+    """Post save signal for invalidate the base portals of the users linked to a portal."""
+    invalidate_users(_linked_users([field for field in portal_relations() if field.related_model is sender], instance))
+
+
+def _portal_deleted(sender, instance, **kwargs):
+    """Pre delete signal for invalidate the base portals of the users linked to a portal, before the links go."""
+    _portal_saved(sender, instance)
+
+
+def _portal_assignment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for invalidate the base portals of the users whose portal assignments changed."""
+    if isinstance(instance, _profile_model()):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_users([getattr(instance, User._meta.get_field('profile').field.attname)])
+        return
+    fields = [field for field in portal_relations() if field.many_to_many and _through(field) is sender]
+    if action == 'pre_clear':
+        instance._cleared_portal_user_ids = _linked_users(fields, instance)
+    elif action in ('post_add', 'post_remove'):
+        invalidate_users(_profile_model()._default_manager.filter(pk__in=pk_set)
+                         .values_list(User._meta.get_field('profile').field.attname, flat=True))
+    elif action == 'post_clear':
+        invalidate_users(getattr(instance, '_cleared_portal_user_ids', []))
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    for field in portal_relations():
+        label = field.related_model._meta.label_lower
+        post_save.connect(_portal_saved, sender=field.related_model, dispatch_uid='portals_saved_%s' % label)
+        pre_delete.connect(_portal_deleted, sender=field.related_model, dispatch_uid='portals_deleted_%s' % label)
+        if field.many_to_many:
+            through = _through(field)
+            m2m_changed.connect(_portal_assignment_changed, sender=through,
+                                dispatch_uid='portals_m2m_%s' % through._meta.label_lower)
+    for label in settings.BASE_PORTAL_INVALIDATION_MODELS:
+        model = django_apps.get_model(label)
+        label = model._meta.label_lower
+        post_save.connect(invalidate_portals, sender=model, dispatch_uid='portals_global_saved_%s' % label)
+        post_delete.connect(invalidate_portals, sender=model, dispatch_uid='portals_global_deleted_%s' % label)
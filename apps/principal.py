@@ -0,0 +1,104 @@
+"""Request scoped principal holding the role flags of the current user.
+
+The role decision (superuser, administrator) is resolved once per request and
+shared through the cache under a per-user version, so admin pages decide
+access without touching the profile tables. The version is bumped whenever
+the user, its profile or its groups change. A process-local cache is not
+used, as the other processes would never see the bump.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_save
+
+from .cache_versions import bump_versions_on_commit, get_version, is_shared_cache
+
+USER_NAMESPACE = 'user_%s'
+
+
+class Principal(object):
+    """Role flags of a user, cheap to build from the cache."""
+
+    __slots__ = ('user_id', 'is_superuser', 'is_administrator')
+
+    def __init__(self, user_id=None, is_superuser=False, is_administrator=False):
+        """Store the role flags."""
+        self.user_id = user_id
+        self.is_superuser = is_superuser
+        self.is_administrator = is_administrator
+
+    @property
+    def is_anonymous(self):
+        """Return whether the request is not authenticated."""
+        return self.user_id is None
+
+    def as_dict(self):
+        """Return the flags as a picklable dict."""
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+ANONYMOUS = Principal()
+
+
+def principal_cache_key(user_id):
+    """Return the cache key of a user's principal under its current version."""
+    return 'principal_%s_%s' % (user_id, get_version(USER_NAMESPACE % user_id))
+
+
+def load_principal(user):
+    """Return the principal of a user, from the cache when it is shared by every process."""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    shared = is_shared_cache()
+    key = principal_cache_key(user.pk) if shared else None
+    flags = cache.get(key) if shared else None
+    if flags is None:
+        profile = getattr(user, 'profile', None)
+        flags = Principal(user.pk, user.is_superuser,
+                          bool(profile is not None and profile.is_administrator())).as_dict()
+        if shared:
+            cache.set(key, flags, settings.PRINCIPAL_CACHE_EXPIRY)
+    return Principal(**flags)
+
+
+def get_principal(request):
+    """Return the principal of a request, resolved once per request."""
+    principal = getattr(request, '_principal', None)
+    if principal is None:
+        principal = request._principal = load_principal(request.user)
+    return principal
+
+
+def invalidate_users(user_ids):
+    """Drop the cached principals and other per-user data of some users."""
+    bump_versions_on_commit(USER_NAMESPACE % user_id for user_id in user_ids)
+
+
+def _user_saved(sender, instance, raw=False, **kwargs):
+    """Post save signal for invalidate the principal of a user."""
+    invalidate_users([instance.pk])
+
+
+def _profile_saved(sender, instance, raw=False, **kwargs):
+    """Post save signal for invalidate the principal of a profile's user."""
+    invalidate_users([getattr(instance, User._meta.get_field('profile').field.attname)])
+
+
+def _groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """M2M signal for invalidate principals when group membership changes."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            invalidate_users([instance.pk])
+        else:
+            invalidate_users(pk_set if pk_set is not None else getattr(instance, '_cleared_user_ids', []))
+
+
+def connect_signals():
+    """Connect the receivers; called once the app registry is ready."""
+    profile_model = User._meta.get_field('profile').related_model
+    post_save.connect(_user_saved, sender=User, dispatch_uid='principal_user_saved')
+    post_save.connect(_profile_saved, sender=profile_model, dispatch_uid='principal_profile_saved')
+    m2m_changed.connect(_groups_changed, sender=User.groups.through, dispatch_uid='principal_groups_changed')
@@ -0,0 +1,135 @@
+"""Relocation of uploaded IP logos into their permanent `ip/` directory.
+
+On local storage a logo is renamed in place, which is atomic and copies
+nothing, or copied with `os.sendfile` when the directories live on different
+filesystems. Other storages are streamed in fixed-size chunks.
+"""
+
+import errno
+import logging
+import os
+import shutil
+
+from django.conf import settings
+
+logger = logging.getLogger(settings.CUSTOM_LOGGER)
+
+LOGO_DIRECTORY = 'ip'
+
+
+def needs_relocation(ip):
+    """Return whether an IP's logo still lives outside the `ip/` directory."""
+    return bool(ip.logo) and ip.logo.name.split(os.sep)[0] != LOGO_DIRECTORY
+
+
+def _copy_file(src_path, dst_path, chunk_size):
+    """Copy a file with sendfile when available, else in chunks."""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        sendfile = getattr(os, 'sendfile', None)
+        if sendfile is not None:
+            size, offset = os.fstat(src.fileno()).st_size, 0
+            try:
+                while offset < size:
+                    sent = sendfile(dst.fileno(), src.fileno(), offset, chunk_size)
+                    if not sent:
+                        break
+                    offset += sent
+                return
+            except OSError:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, chunk_size)
+
+
+def _move_local(storage, src_name, dst_name, chunk_size):
+    """Move a file within a filesystem storage; return its new name."""
+    dst_name = storage.get_available_name(dst_name)
+    src_path, dst_path = storage.path(src_name), storage.path(dst_name)
+    directory = os.path.dirname(dst_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        os.rename(src_path, dst_path)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        _copy_file(src_path, dst_path, chunk_size)
+        os.remove(src_path)
+    return dst_name
+
+
+def _move_streamed(storage, src_name, dst_name, chunk_size):
+    """Move a file by streaming it in chunks; return its new name."""
+    with storage.open(src_name, 'rb') as src:
+        src.DEFAULT_CHUNK_SIZE = chunk_size
+        dst_name = storage.save(dst_name, src)
+    storage.delete(src_name)
+    return dst_name
+
+
+def move_stored_file(storage, src_name, dst_name, chunk_size=None):
+    """Move a file inside a storage the cheapest way it allows; return its new name."""
+    chunk_size = chunk_size or settings.LOGO_RELOCATION_CHUNK_SIZE
+    try:
+        storage.path(src_name)
+    except NotImplementedError:
+        return _move_streamed(storage, src_name, dst_name, chunk_size)
+    return _move_local(storage, src_name, dst_name, chunk_size)
+
+
+def _moved_name(ip, dst_name):
+    """Return `dst_name` if an interrupted run already moved the IP's logo there, else None.
+
+    The file is taken as this IP's when the source is gone, the destination
+    exists and no other IP row points at it.
+    """
+    from .models import IP
+    storage = ip.logo.storage
+    if storage.exists(ip.logo.name) or not storage.exists(dst_name):
+        return None
+    if IP.objects.filter(logo=dst_name).exclude(pk=ip.pk).exists():
+        return None
+    return dst_name
+
+
+def relocate_ip_logos(ips):
+    """Move the logos of several IPs into `ip/`; return the IPs that moved.
+
+    Each IP row is updated right after its file moves, without sending
+    `post_save`, so an interrupted run can simply be started again; a row
+    left behind by a file moved just before the interruption is repaired.
+    """
+    from .models import IP
+    moved = []
+    for ip in ips:
+        if not needs_relocation(ip):
+            continue
+        old_name = ip.logo.name
+        dst_name = os.path.join(LOGO_DIRECTORY, os.path.basename(old_name))
+        try:
+            new_name = _moved_name(ip, dst_name) or move_stored_file(ip.logo.storage, old_name, dst_name)
+        except (IOError, OSError):
+            logger.warning('Could not relocate logo %s of IP %s', old_name, ip.pk, exc_info=True)
+            continue
+        IP.objects.filter(pk=ip.pk).update(logo=new_name)
+        ip.logo.name = new_name
+        moved.append(ip)
+    if moved:
+        _after_relocation(moved)
+    return moved
+
+
+def _after_relocation(ips):
+    """Run what a save of the relocated IPs would have triggered."""
+    from . import ip_cache, renditions
+    ip_cache.invalidate_ips(ip.id for ip in ips)
+    for ip in ips:
+        if renditions.needs_renditions(ip):
+            renditions.schedule_renditions(ip.id)
+
+
+def relocate_ip_logo(ip_id):
+    """Relocate one IP's logo, as deferred from its save."""
+    from .models import IP
+    return relocate_ip_logos(IP.objects.filter(pk=ip_id))
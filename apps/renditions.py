@@ -0,0 +1,162 @@
+"""Eager generation of IP logo renditions.
+
+Renditions are rendered once the save that changed a logo commits, for every
+size and format listed in `IP_LOGO_RENDITIONS`, on a background thread of the
+web process. `backfill_logo_renditions` renders existing logos in a pool of
+worker processes instead; only the image data crosses the process boundary.
+The storage names are recorded in `IP.logo_renditions` so URLs can be built at
+request time without touching storage; renditions of a previous logo are
+deleted once the new ones are stored.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from . import ip_cache
+
+logger = logging.getLogger(settings.CUSTOM_LOGGER)
+
+RenditionSpec = namedtuple('RenditionSpec', ['width', 'height', 'format', 'quality'])
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+_scheduler = None
+_pool_lock = threading.Lock()
+
+
+def get_specs():
+    """Return the configured rendition specs."""
+    return [RenditionSpec(*spec) for spec in settings.IP_LOGO_RENDITIONS]
+
+
+def spec_key(spec):
+    """Return the manifest key of a spec, such as `180x180.webp`."""
+    return '%sx%s.%s' % (spec.width, spec.height, EXTENSIONS[spec.format])
+
+
+def render(source, specs):
+    """Decode an image once and encode it for every spec.
+
+    Takes and returns plain bytes so it can run in a worker process with
+    nothing but the image data crossing the process boundary.
+    """
+    from PIL import Image, ImageOps
+    image = Image.open(BytesIO(source))
+    image.load()
+    rendered = {}
+    for spec in specs:
+        resized = ImageOps.fit(image, (spec.width, spec.height), Image.LANCZOS)
+        if spec.format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        output = BytesIO()
+        resized.save(output, spec.format, quality=spec.quality)
+        rendered[spec_key(spec)] = output.getvalue()
+    return rendered
+
+
+def _get_scheduler():
+    """Return the thread running generations scheduled from the save path."""
+    global _scheduler
+    with _pool_lock:
+        if _scheduler is None:
+            _scheduler = ThreadPoolExecutor(max_workers=1)
+        return _scheduler
+
+
+def rendition_name(ip, key):
+    """Return the storage name of a rendition of an IP's logo."""
+    base = os.path.splitext(os.path.basename(ip.logo.name))[0]
+    return os.path.join('ip', 'renditions', str(ip.pk), '%s_%s' % (base, key))
+
+
+def needs_renditions(ip):
+    """Return whether the renditions of an IP are missing or outdated."""
+    if not ip.logo or ip.logo.name.split(os.sep)[0] != 'ip':
+        return False
+    return ip.logo_manifest.get('source') != ip.logo.name or \
+        set(ip.logo_manifest.get('renditions', {})) != set(spec_key(spec) for spec in get_specs())
+
+
+def store_renditions(ip, rendered):
+    """Save rendered images, record them in the IP's manifest and delete the replaced ones."""
+    from .models import IP
+    storage = ip.logo.storage
+    previous = IP.objects.filter(pk=ip.pk).values_list('logo_renditions', flat=True).first()
+    manifest = {'source': ip.logo.name, 'renditions': {}}
+    for key, data in rendered.items():
+        name = rendition_name(ip, key)
+        if storage.exists(name):
+            storage.delete(name)
+        manifest['renditions'][key] = storage.save(name, ContentFile(data))
+    ip.logo_renditions = json.dumps(manifest)
+    IP.objects.filter(pk=ip.pk).update(logo_renditions=ip.logo_renditions)
+    ip_cache.invalidate_ip(ip.pk)
+    replaced = set(json.loads(previous).get('renditions', {}).values()) if previous else set()
+    for name in replaced - set(manifest['renditions'].values()):
+        storage.delete(name)
+    return manifest
+
+
+class _InlinePool(object):
+    """Pool rendering on the calling thread."""
+
+    def submit(self, fn, *args):
+        """Run `fn` now and return its completed future."""
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def generate_renditions(ips, pool=None):
+    """Render and store the renditions of several IPs; return the count done.
+
+    Images are rendered by `pool`, such as a process pool, or on the calling
+    thread when it is None.
+    """
+    specs = get_specs()
+    pool = pool or _InlinePool()
+    futures = {}
+    for ip in ips:
+        try:
+            with ip.logo.storage.open(ip.logo.name, 'rb') as source:
+                futures[pool.submit(render, source.read(), specs)] = ip
+        except (IOError, OSError):
+            logger.warning('Could not read logo of IP %s', ip.pk, exc_info=True)
+    done = 0
+    for future in as_completed(futures):
+        ip = futures[future]
+        try:
+            store_renditions(ip, future.result())
+            done += 1
+        except Exception:
+            logger.warning('Could not render logo of IP %s', ip.pk, exc_info=True)
+    return done
+
+
+def _generate_for(ip_id):
+    """Reload an IP and render its logo if it still needs it."""
+    from django.db import close_old_connections
+    from .models import IP
+    close_old_connections()
+    try:
+        ip = IP.objects.filter(pk=ip_id).first()
+        if ip is not None and needs_renditions(ip):
+            generate_renditions([ip])
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(ip_id):
+    """Render an IP's logo in the background, off the request thread."""
+    return _get_scheduler().submit(_generate_for, ip_id)
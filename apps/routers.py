@@ -0,0 +1,123 @@
+"""Database routing of read-only work to replicas.
+
+Reads go to a healthy replica only inside a `replica_reads()` block, which
+`ReplicaMiddleware` opens for safe requests to the views listed in
+`REPLICA_READ_VIEWS`. Any write pins the rest of the block to the primary,
+and the middleware keeps the client's following requests on the primary for
+`REPLICA_STICKY_SECONDS`, so users always read their own writes. Results
+stored in version-keyed caches are computed inside `primary_reads()`.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+_state = threading.local()
+_health = {}
+
+
+def _replicas_enabled():
+    """Return whether reads of the current thread may go to a replica."""
+    return getattr(_state, 'replica_reads', False) and not getattr(_state, 'wrote', False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Send the reads of the block to a replica until something is written.
+
+    With `enabled=False` the block only tracks writes, until
+    `allow_replica_reads()` is called.
+    """
+    previous = getattr(_state, 'replica_reads', False), getattr(_state, 'wrote', False)
+    _state.replica_reads, _state.wrote = enabled, False
+    try:
+        yield
+    finally:
+        _state.replica_reads, _state.wrote = previous
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads of the block to the primary, for results stored in version-keyed caches.
+
+    A cached value outlives the read that produced it, so it must not be
+    read from a replica that may still lag behind the latest version bump.
+    """
+    previous = getattr(_state, 'replica_reads', False)
+    _state.replica_reads = False
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+def allow_replica_reads():
+    """Let the rest of the current block read from replicas."""
+    _state.replica_reads = True
+
+
+def wrote():
+    """Return whether the current block wrote to the primary."""
+    return getattr(_state, 'wrote', False)
+
+
+def _applied_migrations(alias):
+    """Return the number of migrations applied to a database."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM django_migrations')
+        return cursor.fetchone()[0]
+
+
+def is_healthy(alias):
+    """Return whether a replica answers with the primary's schema.
+
+    A replica is healthy when it has applied as many migrations as the
+    primary, so an empty or outdated copy is never read. Checked at most
+    every `REPLICA_HEALTH_CHECK_INTERVAL` seconds.
+    """
+    healthy, checked_at = _health.get(alias, (True, None))
+    now = time.monotonic()
+    if checked_at is not None and now - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return healthy
+    try:
+        healthy = _applied_migrations(alias) == _applied_migrations(DEFAULT_DB_ALIAS)
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+    _health[alias] = (healthy, now)
+    return healthy
+
+
+def read_replica():
+    """Return the alias of a healthy replica, or the primary when there is none."""
+    candidates = [alias for alias in settings.REPLICA_DATABASES if is_healthy(alias)]
+    return random.choice(candidates) if candidates else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter(object):
+    """Route reads of `replica_reads()` blocks to replicas and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        """Return a replica inside a read-only block."""
+        if _replicas_enabled():
+            return read_replica()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        """Return the primary, pinning the current block to it."""
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same data as the primary."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only migrate the primary; replicas copy its schema."""
+        return db not in settings.REPLICA_DATABASES
+
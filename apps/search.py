@@ -0,0 +1,201 @@
+"""Denormalized user search index backing the user autocomplete.
+
+Every user gets one normalized document in `UserSearchDocument`. On SQLite the
+documents are mirrored into an FTS5 table by triggers and matched by token
+prefix, ranked with bm25. On PostgreSQL they are matched through a pg_trgm GIN
+index and ranked by trigram similarity. Other backends fall back to plain
+substring filtering of the document column. Searches run on the database the
+router reads documents from and are not capped, so every match can be paged.
+"""
+
+import re
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.expressions import RawSQL
+
+from user_profile.models import CustomUser
+
+from .models import UserSearchDocument
+
+USER_SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'street', 'city', 'region', 'phone_number')
+
+DOCUMENT_TABLE = UserSearchDocument._meta.db_table
+FTS_TABLE = 'apps_usersearch_fts'
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "document, content='{doc}', content_rowid='user_id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {doc} BEGIN "
+    "INSERT INTO {fts}(rowid, document) VALUES (new.user_id, new.document); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {doc} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.user_id, old.document); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {doc} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.user_id, old.document); "
+    "INSERT INTO {fts}(rowid, document) VALUES (new.user_id, new.document); END",
+)
+
+POSTGRESQL_SCHEMA = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS {doc}_trgm ON {doc} USING gin (document gin_trgm_ops)",
+)
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    text = unicodedata.normalize('NFKD', u'%s' % (text or ''))
+    text = u''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(u' ', text.lower()).strip()
+
+
+def build_document(user):
+    """Return the normalized search document of a user."""
+    parts = [getattr(user, field) for field in USER_SEARCH_FIELDS]
+    parts.extend(skill.professional_skills for skill in user.professional_skills.all())
+    return normalize(u' '.join(u'%s' % part for part in parts if part))
+
+
+def index_user(user):
+    """Create or refresh the search document of a user; return whether it changed.
+
+    An unchanged document is not written, so its save does not invalidate
+    the cached autocomplete results.
+    """
+    document = build_document(user)
+    if UserSearchDocument.objects.filter(user=user).values_list('document', flat=True).first() == document:
+        return False
+    UserSearchDocument.objects.update_or_create(user=user, defaults={'document': document})
+    return True
+
+
+def index_users(users):
+    """Refresh the search documents of the users of a queryset; return how many changed.
+
+    Documents are compared and written in bulk, for changes reaching many
+    users at once such as a renamed skill.
+    """
+    from .autocomplete import invalidate_autocomplete
+    users = list(users.prefetch_related('professional_skills'))
+    stored = dict(UserSearchDocument.objects.filter(user__in=[user.pk for user in users])
+                  .values_list('user_id', 'document'))
+    created, changed = [], []
+    for user in users:
+        document = build_document(user)
+        if user.pk not in stored:
+            created.append(UserSearchDocument(user=user, document=document))
+        elif stored[user.pk] != document:
+            changed.append(UserSearchDocument(user=user, document=document))
+    UserSearchDocument.objects.bulk_create(created)
+    UserSearchDocument.objects.bulk_update(changed, ['document'])
+    if created or changed:
+        # Bulk writes send no post_save, so the autocomplete is flushed here.
+        invalidate_autocomplete('users')
+    return len(created) + len(changed)
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild every search document and return how many were written.
+
+    The documents are swapped in one transaction, so searches never see an
+    empty or partial index and a failed rebuild keeps the previous one.
+    """
+    ensure_schema()
+    users = CustomUser.objects.prefetch_related('professional_skills').order_by('pk')
+    batch, total = [], 0
+    with transaction.atomic():
+        UserSearchDocument.objects.all().delete()
+        for user in _chunked(users, batch_size):
+            batch.append(UserSearchDocument(user=user, document=build_document(user)))
+            if len(batch) >= batch_size:
+                UserSearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            UserSearchDocument.objects.bulk_create(batch)
+            total += len(batch)
+    return total
+
+
+def _chunked(queryset, size):
+    """Iterate a queryset in pk ordered chunks so prefetches stay bounded."""
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:size])
+        if not chunk:
+            return
+        for obj in chunk:
+            yield obj
+        last_pk = chunk[-1].pk
+
+
+def ensure_schema(using=DEFAULT_DB_ALIAS):
+    """Create the backend specific full-text structures if they are missing."""
+    conn = connections[using]
+    statements = {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}.get(conn.vendor, ())
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(fts=FTS_TABLE, doc=DOCUMENT_TABLE))
+
+
+def _fts_query(tokens):
+    """Return an FTS5 MATCH expression requiring a prefix match of every token."""
+    return u' '.join(u'"%s"*' % token.replace('"', '""') for token in tokens)
+
+
+class _FTSRank(Func):
+    """The bm25 rank of a document row for an FTS5 match expression, lower is better."""
+
+    output_field = FloatField()
+
+    def __init__(self, match, user_id):
+        """Rank the row of `user_id` against `match`."""
+        super(_FTSRank, self).__init__(user_id)
+        self.match = match
+
+    def as_sql(self, compiler, connection):
+        """Look the rank up in the FTS table, correlated on the document row."""
+        sql, params = compiler.compile(self.source_expressions[0])
+        return '(SELECT rank FROM {fts} WHERE {fts} MATCH %s AND rowid = {row})'.format(
+            fts=FTS_TABLE, row=sql), [self.match] + list(params)
+
+
+def _search_vendor():
+    """Return the vendor of the database search documents are read from."""
+    return connections[router.db_for_read(UserSearchDocument)].vendor
+
+
+def document_matches(document, tokens):
+    """Return whether a normalized document matches tokens like `search_user_ids`."""
+    if _search_vendor() == 'sqlite':
+        words = document.split()
+        return all(any(word.startswith(token) for word in words) for token in tokens)
+    return all(token in document for token in tokens)
+
+
+def search_documents(term):
+    """Return the documents matching `term`, annotated with a `rank` ordering the best first."""
+    tokens = normalize(term).split()
+    if not tokens:
+        return UserSearchDocument.objects.none()
+    documents = UserSearchDocument.objects.all()
+    vendor = _search_vendor()
+    if vendor == 'sqlite':
+        match = _fts_query(tokens)
+        return documents.filter(
+            user_id__in=RawSQL('SELECT rowid FROM {fts} WHERE {fts} MATCH %s'.format(fts=FTS_TABLE), [match]),
+        ).annotate(rank=_FTSRank(match, F('user_id'))).order_by('rank', 'user_id')
+    for token in tokens:
+        documents = documents.filter(document__contains=token)
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        return documents.annotate(rank=TrigramSimilarity('document', u' '.join(tokens)) * Value(-1.0)) \
+            .order_by('rank', 'user_id')
+    return documents.annotate(rank=F('document')).order_by('rank', 'user_id')
+
+
+def search_user_ids(term, limit=None):
+    """Return the ids of users matching `term`, best ranked first, at most `limit` when given."""
+    return list(search_documents(term).values_list('user_id', flat=True)[:limit])
@@ -0,0 +1,88 @@
+"""Per-language display snapshots of IPs for listing pages.
+
+A snapshot is an `IPSnapshot` tuple of everything a listing row shows: the
+translated fields, the logo url and the absolute url. Snapshots are cached
+per language as plain tuples prefixed with the IP's `ip_cache` version, and
+fetched together with those versions in a single multi-get, so a listing
+renders without instantiating models or reversing urls. A snapshot whose
+version no longer matches, because `invalidate_ips_cache` ran, is rebuilt.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+from modeltranslation.utils import build_localized_fieldname, get_language
+
+from .cache_versions import VERSION_KEY, get_versions
+from .ip_cache import IP_NAMESPACE
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_KEY = 'ip_snapshot_%s_%s_%s'
+
+IPSnapshot = namedtuple('IPSnapshot', ['id', 'company_name', 'address1', 'address2', 'contact_name',
+                                       'description', 'logo_url', 'url'])
+
+
+def _snapshot_key(language, ip_id):
+    """Return the cache key of the snapshot of an IP in a language."""
+    return SNAPSHOT_KEY % (SNAPSHOT_FORMAT, language, ip_id)
+
+
+def _load_fields(languages):
+    """Return the columns needed to build snapshots in some languages."""
+    from .models import IP_I18N_FIELDS
+    fields = ['id', 'logo', 'logo_renditions', 'post_url']
+    for name in IP_I18N_FIELDS:
+        fields.append(name)
+        fields.extend(build_localized_fieldname(name, language) for language in languages)
+    return fields
+
+
+def build_snapshots(ip_ids, languages=None):
+    """Build and cache the snapshots of IPs; return them as `{language: {ip id: snapshot}}`.
+
+    Versions are read before the rows, so a concurrent update leaves behind
+    a snapshot that is already outdated rather than one that looks current.
+    """
+    from .models import IP
+    ip_ids = list(ip_ids)
+    languages = list(languages or [code for code, __ in settings.LANGUAGES])
+    versions = get_versions(IP_NAMESPACE % ip_id for ip_id in ip_ids)
+    ips = list(IP.objects.filter(pk__in=ip_ids).only(*_load_fields(languages)))
+    snapshots, entries = {}, {}
+    for language in languages:
+        snapshots[language] = {}
+        with translation.override(language):
+            for ip in ips:
+                snapshot = IPSnapshot(ip.id, ip.company_name, ip.address1, ip.address2, ip.contact_name,
+                                      ip.description, ip.logo_m_url, ip.get_absolute_url())
+                snapshots[language][ip.id] = snapshot
+                entries[_snapshot_key(language, ip.id)] = (versions[IP_NAMESPACE % ip.id],) + tuple(snapshot)
+    if entries:
+        cache.set_many(entries, settings.IP_SNAPSHOT_CACHE_EXPIRY)
+    return snapshots
+
+
+def get_snapshots(ip_ids, language=None):
+    """Return the snapshots of IPs in the order of `ip_ids`, skipping IPs that do not exist.
+
+    Cached snapshots and the current versions are read in one multi-get; the
+    missing or outdated ones are rebuilt together.
+    """
+    ip_ids = list(ip_ids)
+    language = language or get_language()
+    version_keys = dict((ip_id, VERSION_KEY % (IP_NAMESPACE % ip_id)) for ip_id in ip_ids)
+    snapshot_keys = dict((ip_id, _snapshot_key(language, ip_id)) for ip_id in ip_ids)
+    found = cache.get_many(list(version_keys.values()) + list(snapshot_keys.values()))
+    snapshots, missing = {}, []
+    for ip_id in ip_ids:
+        version, entry = found.get(version_keys[ip_id]), found.get(snapshot_keys[ip_id])
+        if version is not None and entry is not None and entry[0] == version:
+            snapshots[ip_id] = IPSnapshot._make(entry[1:])
+        else:
+            missing.append(ip_id)
+    if missing:
+        snapshots.update(build_snapshots(missing, [language])[language])
+    return [snapshots[ip_id] for ip_id in ip_ids if ip_id in snapshots]
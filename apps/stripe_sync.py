@@ -0,0 +1,144 @@
+"""Incremental Stripe plan sync that runs outside the request path."""
+
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from djstripe.models import Plan
+
+from .models import StripeObjectFingerprint, SyncWatermark
+from .telemetry import external_call
+
+logger = logging.getLogger(settings.CUSTOM_LOGGER)
+
+PLAN_SYNC_NAME = 'stripe.plans'
+
+SyncResult = namedtuple('SyncResult', ['seen', 'changed', 'pages'])
+
+
+class StripeAPIClient(object):
+    """Plan client backed by the real Stripe API."""
+
+    def __init__(self, api_key=None):
+        """Set up the Stripe key, defaulting to the configured secret key."""
+        self.api_key = api_key or settings.STRIPE_TEST_SECRET_KEY
+
+    def list_plans(self, limit, starting_after=None):
+        """Return one page of plans as a dict with `data` and `has_more`."""
+        import stripe
+        params = {'limit': limit, 'api_key': self.api_key}
+        if starting_after:
+            params['starting_after'] = starting_after
+        with external_call('stripe'):
+            return stripe.Plan.list(**params)
+
+
+class LocalStripeStub(object):
+    """In-memory stand-in for the Stripe plan API, for tests and benchmarks."""
+
+    def __init__(self, plans=None):
+        """Keep plans in insertion order, like Stripe's list endpoint."""
+        self.plans = list(plans or [])
+        self.calls = 0
+
+    @classmethod
+    def generate(cls, count, amount=1000):
+        """Return a stub pre-filled with `count` synthetic plans."""
+        return cls([{
+            'id': 'plan_%06d' % i,
+            'object': 'plan',
+            'amount': amount + i,
+            'currency': 'usd',
+            'interval': 'month',
+            'interval_count': 1,
+            'nickname': 'Plan %d' % i,
+            'livemode': False,
+            'metadata': {},
+        } for i in range(count)])
+
+    def list_plans(self, limit, starting_after=None):
+        """Return one page of plans following Stripe's cursor semantics."""
+        self.calls += 1
+        start = 0
+        if starting_after:
+            ids = [plan['id'] for plan in self.plans]
+            start = ids.index(starting_after) + 1
+        page = self.plans[start:start + limit]
+        return {'object': 'list', 'data': page, 'has_more': start + limit < len(self.plans)}
+
+
+def get_plan_client():
+    """Return the plan client configured by `STRIPE_PLAN_CLIENT`."""
+    return import_string(settings.STRIPE_PLAN_CLIENT)()
+
+
+def fingerprint(data):
+    """Return a stable digest of a Stripe payload."""
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class PlanSyncEngine(object):
+    """Fetch plans page by page and upsert only those whose payload changed."""
+
+    def __init__(self, client=None, page_size=None):
+        """Set up the engine with a plan client and Stripe page size."""
+        self.client = client or get_plan_client()
+        self.page_size = page_size or settings.STRIPE_SYNC_PAGE_SIZE
+
+    def iter_pages(self):
+        """Yield lists of plan payloads until Stripe reports no more pages."""
+        starting_after = None
+        while True:
+            page = self.client.list_plans(limit=self.page_size, starting_after=starting_after)
+            data = list(page['data'])
+            if data:
+                yield data
+            if not page.get('has_more') or not data:
+                return
+            starting_after = data[-1]['id']
+
+    def sync_page(self, plans):
+        """Upsert the changed plans of a page and return how many changed."""
+        digests = dict((plan['id'], fingerprint(plan)) for plan in plans)
+        known = dict(StripeObjectFingerprint.objects.filter(stripe_id__in=digests)
+                     .values_list('stripe_id', 'fingerprint'))
+        changed = [plan for plan in plans if known.get(plan['id']) != digests[plan['id']]]
+        if not changed:
+            return 0
+        with transaction.atomic():
+            for plan in changed:
+                Plan.sync_from_stripe_data(plan)
+                StripeObjectFingerprint.objects.update_or_create(
+                    stripe_id=plan['id'], defaults={'fingerprint': digests[plan['id']]})
+        return len(changed)
+
+    def sync(self):
+        """Run a full pass and advance the watermark; return a `SyncResult`."""
+        started = timezone.now()
+        seen = changed = pages = 0
+        for plans in self.iter_pages():
+            pages += 1
+            seen += len(plans)
+            changed += self.sync_page(plans)
+        SyncWatermark.objects.update_or_create(
+            name=PLAN_SYNC_NAME,
+            defaults={'last_synced': started, 'objects_seen': seen, 'objects_changed': changed})
+        logger.info('Stripe plan sync: %s seen, %s changed in %s pages', seen, changed, pages)
+        return SyncResult(seen, changed, pages)
+
+
+def sync_plans(client=None, page_size=None):
+    """Entry point for management commands and periodic workers."""
+    return PlanSyncEngine(client=client, page_size=page_size).sync()
+
+
+def last_plan_sync():
+    """Return the time of the last completed plan sync, or None."""
+    watermark = SyncWatermark.objects.filter(name=PLAN_SYNC_NAME).first()
+    return watermark.last_synced if watermark else None
@@ -0,0 +1,343 @@
+"""Per-view request telemetry aggregated in process.
+
+A sampled request records its latency, the number and duration of its SQL
+queries, its cache hits and misses and the duration of its external calls
+under the name of the resolved URL. Every thread aggregates into its own
+counters, so recording takes no lock; the exporters merge the threads'
+counters into Prometheus text, served by `MetricsView` or written to
+`TELEMETRY_FILE` every `TELEMETRY_FILE_INTERVAL` seconds. The counters of
+finished threads are folded into one retired aggregate, so thread churn does
+not grow the registry.
+"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.utils.module_loading import import_string
+
+UNRESOLVED = '<unresolved>'
+BACKGROUND = '<background>'
+
+_local = threading.local()
+_aggregates = []
+_aggregates_lock = threading.Lock()
+_next_file_write = [0]
+
+
+class Aggregate(object):
+    """Counters and histograms written by a single thread."""
+
+    def __init__(self):
+        """Start empty."""
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        """Add `value` to a counter."""
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Add an observation to a histogram: bucket counts, then sum and count."""
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(settings.TELEMETRY_BUCKETS) + 3)
+        histogram[bisect_left(settings.TELEMETRY_BUCKETS, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def merge(self, other):
+        """Add the counters and histograms of another aggregate."""
+        # dict() copies in one step under the GIL, so writers are never blocked.
+        for key, value in dict(other.counters).items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in dict(other.histograms).items():
+            merged = self.histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(list(values)):
+                merged[index] += value
+
+    def clear(self):
+        """Forget every measurement."""
+        self.counters.clear()
+        self.histograms.clear()
+
+
+_retired = Aggregate()
+
+
+class Trace(object):
+    """Measurements of the request being served by the current thread."""
+
+    __slots__ = ('queries', 'query_time', 'cache_hits', 'cache_misses', 'external')
+
+    def __init__(self):
+        """Start empty."""
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.external = []
+
+
+def _aggregate():
+    """Return the aggregate of the current thread, registering it on first use."""
+    aggregate = getattr(_local, 'aggregate', None)
+    if aggregate is None:
+        aggregate = _local.aggregate = Aggregate()
+        with _aggregates_lock:
+            _prune()
+            _aggregates.append((threading.current_thread(), aggregate))
+    return aggregate
+
+
+def _prune():
+    """Fold the aggregates of finished threads into the retired one; call with the lock held."""
+    finished = [aggregate for thread, aggregate in _aggregates if not thread.is_alive()]
+    if finished:
+        for aggregate in finished:
+            _retired.merge(aggregate)
+        _aggregates[:] = [(thread, aggregate) for thread, aggregate in _aggregates if thread.is_alive()]
+
+
+def _all_aggregates():
+    """Return the retired aggregate and those of the live threads."""
+    with _aggregates_lock:
+        _prune()
+        return [_retired] + [aggregate for __, aggregate in _aggregates]
+
+
+def sampled():
+    """Return whether the next request should be measured."""
+    rate = settings.TELEMETRY_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def current_trace():
+    """Return the trace of the request served by this thread, or None."""
+    return getattr(_local, 'trace', None)
+
+
+def _query_wrapper(trace):
+    """Return a database execute wrapper counting queries into `trace`."""
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            trace.queries += 1
+            trace.query_time += time.perf_counter() - start
+    return wrapper
+
+
+@contextmanager
+def trace_request():
+    """Measure the queries, cache lookups and external calls of a request."""
+    trace = _local.trace = Trace()
+    wrapper = _query_wrapper(trace)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            yield trace
+    finally:
+        _local.trace = None
+
+
+def record_request(view, duration, trace):
+    """Aggregate the measurements of a finished request."""
+    aggregate = _aggregate()
+    labels = (('view', view),)
+    aggregate.observe('apps_request_duration_seconds', labels, duration)
+    aggregate.inc('apps_request_queries_total', labels, trace.queries)
+    aggregate.inc('apps_request_query_seconds_total', labels, trace.query_time)
+    aggregate.inc('apps_cache_hits_total', labels, trace.cache_hits)
+    aggregate.inc('apps_cache_misses_total', labels, trace.cache_misses)
+    for service, elapsed in trace.external:
+        aggregate.observe('apps_external_call_duration_seconds', labels + (('service', service),), elapsed)
+
+
+def record_cache(hits, misses):
+    """Count cache lookups of the current request, if it is sampled."""
+    trace = current_trace()
+    if trace is not None:
+        trace.cache_hits += hits
+        trace.cache_misses += misses
+
+
+@contextmanager
+def external_call(service):
+    """Time a call to an external service.
+
+    Calls made while serving a sampled request are reported under its view;
+    calls made elsewhere, such as in worker threads, under `<background>`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = current_trace()
+        if trace is not None:
+            trace.external.append((service, elapsed))
+        else:
+            _aggregate().observe('apps_external_call_duration_seconds',
+                                 (('view', BACKGROUND), ('service', service)), elapsed)
+
+
+def collect():
+    """Return the counters and histograms of every thread merged together."""
+    total = Aggregate()
+    for aggregate in _all_aggregates():
+        total.merge(aggregate)
+    return total.counters, total.histograms
+
+
+def reset():
+    """Forget every measurement of this process."""
+    for aggregate in _all_aggregates():
+        aggregate.clear()
+
+
+def _format_labels(labels, extra=()):
+    """Return labels in the Prometheus exposition format."""
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels + tuple(extra))
+
+
+def render_prometheus():
+    """Return the measurements in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    lines = ['# TYPE apps_telemetry_sample_rate gauge',
+             'apps_telemetry_sample_rate %s' % settings.TELEMETRY_SAMPLE_RATE]
+    for name in sorted(set(name for name, __ in counters)):
+        lines.append('# TYPE %s counter' % name)
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append('%s%s %s' % (name, _format_labels(labels), value))
+    bounds = ['%s' % bound for bound in settings.TELEMETRY_BUCKETS] + ['+Inf']
+    for name in sorted(set(name for name, __ in histograms)):
+        lines.append('# TYPE %s histogram' % name)
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds, values[:-2]):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels), values[-2]))
+            lines.append('%s_count%s %s' % (name, _format_labels(labels), values[-1]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(path=None):
+    """Atomically write the measurements to `path`, `%(pid)s` is the process id."""
+    path = (path or settings.TELEMETRY_FILE) % {'pid': os.getpid()}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.telemetry')
+    with os.fdopen(fd, 'w') as stream:
+        stream.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def maybe_write_file():
+    """Write the telemetry file when it is configured and due."""
+    if not settings.TELEMETRY_FILE:
+        return
+    now = time.monotonic()
+    if now < _next_file_write[0]:
+        return
+    # Set first: a concurrent request may write once more, which is harmless.
+    _next_file_write[0] = now + settings.TELEMETRY_FILE_INTERVAL
+    write_file()
+
+
+_MISSING = object()
+
+
+class TelemetryCache(BaseCache):
+    """Cache backend wrapping another one and counting its hits and misses.
+
+    Configure the wrapped backend as `OPTIONS['BACKEND']`, with its own
+    `LOCATION` and `OPTIONS` next to it.
+    """
+
+    def __init__(self, location, params):
+        """Build the wrapped backend."""
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('BACKEND')
+        wrapped_params = dict(params, OPTIONS=options.pop('OPTIONS', {}))
+        super(TelemetryCache, self).__init__(wrapped_params)
+        self._cache = import_string(backend)(options.pop('LOCATION', location), wrapped_params)
+
+    def __getattr__(self, name):
+        """Delegate everything that is not counted."""
+        return getattr(self._cache, name)
+
+    def get(self, key, default=None, version=None):
+        """Return a value, counting a hit or a miss."""
+        value = self._cache.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        """Return the found values, counting hits and misses."""
+        keys = list(keys)
+        values = self._cache.get_many(keys, version=version)
+        record_cache(len(values), len(keys) - len(values))
+        return values
+
+    def add(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.add(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.set(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.delete(*args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.delete_many(*args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.has_key(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.incr(*args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.decr(*args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.touch(*args, **kwargs)
+
+    def clear(self):
+        """Delegate to the wrapped backend."""
+        return self._cache.clear()
+
+    def close(self, **kwargs):
+        """Delegate to the wrapped backend."""
+        return self._cache.close(**kwargs)
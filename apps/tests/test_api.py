@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import gzip
+import json
+
+from django.conf import settings
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from mock import patch
+
+from apps.api import negotiate_encoding
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+class IPAPITest(BaseAppDjangoTest):
+    """Test the IP read API."""
+
+    def setUp(self):
+        """Setup visible and hidden IPs."""
+        for name in ('delta', 'alpha', 'charlie', 'bravo', 'echo'):
+            IPFactory(company_name=name, website='http://%s.example.com' % name)
+        IPFactory(company_name='hidden', hidden=True)
+
+    def _get(self, **params):
+        """Return the decoded JSON of an API response."""
+        response = self.client.get(reverse('api-ips'), params, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_sparse_fieldset(self):
+        """Test only the requested fields are returned, id always included."""
+        data = self._get(fields='company_name', limit=2)
+        self.assertEqual(data['results'], [{'id': data['results'][0]['id'], 'company_name': 'alpha'},
+                                           {'id': data['results'][1]['id'], 'company_name': 'bravo'}])
+
+    def test_walks_all_pages(self):
+        """Test following cursors returns every visible IP once."""
+        names, cursor = [], None
+        while True:
+            data = self._get(fields='company_name', limit=2, **({'cursor': cursor} if cursor else {}))
+            names.extend(row['company_name'] for row in data['results'])
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(names, ['alpha', 'bravo', 'charlie', 'delta', 'echo'])
+
+    def test_unknown_field(self):
+        """Test unknown fields are rejected."""
+        response = self.client.get(reverse('api-ips'), {'fields': 'managers'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_limit(self):
+        """Test limits below one are rejected."""
+        for limit in ('0', '-1', 'ten'):
+            response = self.client.get(reverse('api-ips'), {'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    @patch('apps.routers.is_healthy', return_value=True)
+    def test_streams_from_replica(self, is_healthy):
+        """Test the streamed rows are read from the replica chosen during the request."""
+        with patch('apps.api.stream_page', return_value=iter(['{}'])) as stream_page:
+            self.client.get(reverse('api-ips'))
+            self.client.cookies[settings.REPLICA_STICKY_COOKIE] = '1'
+            self.client.get(reverse('api-ips'))
+        self.assertEqual([call[0][0].db for call in stream_page.call_args_list], ['replica', 'default'])
+
+    def test_single_query(self):
+        """Test a page costs one query."""
+        with CaptureQueriesContext(connection) as queries:
+            self._get(fields='company_name,email,default_ticket_fee')
+        self.assertEqual(len([query for query in queries if 'apps_ip' in query['sql']]), 1)
+
+    def test_gzip(self):
+        """Test gzip responses decode to the same JSON."""
+        response = self.client.get(reverse('api-ips'), {'fields': 'company_name'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)).decode('utf-8'))
+        self.assertEqual(len(data['results']), 5)
+
+    def test_negotiation(self):
+        """Test q-values and unsupported codings are honoured."""
+        self.assertEqual(negotiate_encoding('gzip;q=0, identity'), None)
+        self.assertEqual(negotiate_encoding('deflate, gzip;q=0.5'), 'gzip')
+        self.assertIsNone(negotiate_encoding(''))
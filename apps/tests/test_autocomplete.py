@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django import forms
+from django.core.cache import cache
+from mock import patch
+
+from apps.forms import CustomUserWidget, OrderPreferenceSelect2WidgetForm, TutorSuggestionWidget, user_label
+from user_profile.models import CustomUser
+from .base_testcases import BaseAppDjangoTest
+from .factories import CustomUserFactory
+
+
+class UserAutocompleteTest(BaseAppDjangoTest):
+    """Test the cached user autocomplete results."""
+
+    def setUp(self):
+        """Setup a few users."""
+        cache.clear()
+        self.john = CustomUserFactory(first_name='John', last_name='Mensah')
+        self.johanna = CustomUserFactory(first_name='Johanna', last_name='Owusu')
+        self.ama = CustomUserFactory(first_name='Ama', last_name='Johnson')
+        self.widget = CustomUserWidget()
+
+    def _ids(self, term, page=1):
+        """Return the ids of a result page."""
+        return [pk for pk, __ in self.widget.autocomplete_page(term, page)[0]]
+
+    def test_labels(self):
+        """Test labels match the widget's labels."""
+        results = dict(self.widget.autocomplete_page('john', 1)[0])
+        self.assertEqual(results[self.john.pk], 'JOHN MENSAH')
+        self.assertEqual(user_label('', '', 'a@example.com'), 'A@EXAMPLE.COM')
+
+    def test_longer_terms_reuse_prefix(self):
+        """Test typing on filters the cached rows of the prefix."""
+        with patch.object(CustomUserWidget, 'search_rows', autospec=True,
+                          side_effect=CustomUserWidget.search_rows) as search_rows:
+            self.assertEqual(set(self._ids('jo')), {self.john.pk, self.johanna.pk, self.ama.pk})
+            self.assertEqual(set(self._ids('joh')), {self.john.pk, self.johanna.pk, self.ama.pk})
+            self.assertEqual(set(self._ids('johann')), {self.johanna.pk})
+            self.assertEqual(set(self._ids('john m')), {self.john.pk})
+        self.assertEqual(search_rows.call_count, 1)
+
+    def test_equivalent_terms_share_entries(self):
+        """Test terms normalizing to the same text hit the same entry."""
+        self._ids('Joh')
+        with patch.object(CustomUserWidget, 'search_rows') as search_rows:
+            self._ids('  JOH ')
+        self.assertFalse(search_rows.called)
+
+    def test_save_invalidates(self):
+        """Test saving a user drops the cached rows."""
+        self.assertNotIn(self.ama.pk, self._ids('kofi'))
+        self.ama.first_name = 'Kofi'
+        self.ama.save()
+        self.assertEqual(self._ids('kofi'), [self.ama.pk])
+
+    def test_pages(self):
+        """Test results are paged by max_results."""
+        self.widget.max_results = 2
+        first, more = self.widget.autocomplete_page('jo', 1)
+        second, more_after = self.widget.autocomplete_page('jo', 2)
+        self.assertEqual((len(first), more, len(second), more_after), (2, True, 1, False))
+
+
+class TutorSuggestionWidgetTest(BaseAppDjangoTest):
+    """Test tutor candidates come from the field's queryset."""
+
+    def setUp(self):
+        """Setup a tutor and another user."""
+        cache.clear()
+        self.tutor = CustomUserFactory(first_name='John', last_name='Tutor')
+        self.other = CustomUserFactory(first_name='John', last_name='Other')
+
+    def test_field_queryset(self):
+        """Test only users of the field's queryset are candidates."""
+        field = forms.ModelMultipleChoiceField(queryset=CustomUser.objects.filter(pk=self.tutor.pk),
+                                               widget=TutorSuggestionWidget())
+        self.assertEqual(list(field.widget.filter_queryset(None, 'john')), [self.tutor])
+        self.assertEqual([pk for pk, __ in field.widget.autocomplete_page('john', 1)[0]], [self.tutor.pk])
+
+    def test_querysets_do_not_share_results(self):
+        """Test widgets over different querysets of one model are cached apart."""
+        tutors = CustomUserWidget(queryset=CustomUser.objects.filter(pk=self.tutor.pk))
+        everyone = CustomUserWidget()
+        self.assertEqual([pk for pk, __ in tutors.autocomplete_page('john', 1)[0]], [self.tutor.pk])
+        self.assertEqual(set(pk for pk, __ in everyone.autocomplete_page('john', 1)[0]),
+                         {self.tutor.pk, self.other.pk})
+
+    def test_order_preference_form(self):
+        """Test the admin form's widget follows the tutor_suggestion field."""
+        field = OrderPreferenceSelect2WidgetForm().fields['tutor_suggestion']
+        self.assertEqual(str(field.widget.get_queryset().query), str(field.queryset.query))
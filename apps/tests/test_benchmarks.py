@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.db import connections
+
+from apps.benchmarks import runner
+from apps.benchmarks.runner import Regression, Result
+from .base_testcases import BaseAppDjangoTest
+
+
+class BenchmarkBaselineTest(BaseAppDjangoTest):
+    """Test the benchmark baseline comparison."""
+
+    def setUp(self):
+        """Setup a baseline of one size."""
+        self.baseline = {'plan_list_view': {'wall_ms': 10.0, 'queries': 3}}
+
+    def test_within_threshold(self):
+        """Test results slower by less than the threshold pass."""
+        results = [Result('plan_list_view', 11.9, 3)]
+        self.assertEqual(runner.compare(results, self.baseline, 0.2), [])
+
+    def test_wall_time_regression(self):
+        """Test results slower than the threshold fail."""
+        results = [Result('plan_list_view', 12.5, 3)]
+        self.assertEqual(runner.compare(results, self.baseline, 0.2),
+                         [Regression('plan_list_view', 'wall_ms', 10.0, 12.5)])
+
+    def test_query_count_regression(self):
+        """Test any extra query fails whatever the threshold."""
+        results = [Result('plan_list_view', 5.0, 4)]
+        self.assertEqual(runner.compare(results, self.baseline, 1.0),
+                         [Regression('plan_list_view', 'queries', 3, 4)])
+
+    def test_new_case_is_ignored(self):
+        """Test cases missing from the baseline never fail."""
+        self.assertEqual(runner.compare([Result('post_view', 99.0, 50)], self.baseline, 0.2), [])
+
+    def test_save_and_load(self):
+        """Test baselines of several sizes live in one file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        self.assertEqual(runner.load_baseline(path, 10000), {})
+        runner.save_baseline(path, 10000, [Result('post_view', 1.5, 2)])
+        runner.save_baseline(path, 100000, [Result('post_view', 4.0, 2)])
+        self.assertEqual(runner.load_baseline(path, 10000), {'post_view': {'wall_ms': 1.5, 'queries': 2}})
+        self.assertEqual(runner.load_baseline(path, 100000), {'post_view': {'wall_ms': 4.0, 'queries': 2}})
+
+
+class BenchmarkMeasureTest(BaseAppDjangoTest):
+    """Test the benchmark measurements."""
+
+    databases = '__all__'
+
+    def test_queries_counted_on_every_alias(self):
+        """Test queries are counted whichever database they run on."""
+        def query_everywhere(context):
+            for alias in connections:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+        result = runner.measure('query_everywhere', query_everywhere, None, repeat=1)
+        self.assertEqual(result.queries, len(list(connections)))
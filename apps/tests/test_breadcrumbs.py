@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.core.urlresolvers import reverse
+from django.urls import reverse
 
 from .breadcrumbs import get_post_breadcrumbs
 from .base_testcases import BaseAppDjangoTest
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import random
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.fees import calculate_fees, ticket_fee, total_fees
+from apps.models import IP
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+class TicketFeeTest(BaseAppDjangoTest):
+    """Test the scalar ticket fee rule."""
+
+    def test_rule(self):
+        """Test the fixed fee plus the rounded percentage."""
+        self.assertEqual(ticket_fee(Decimal('1.00'), Decimal('7.50'), Decimal('10.10')), Decimal('1.76'))
+        self.assertEqual(ticket_fee(None, Decimal('5.00'), Decimal('0.10')), Decimal('0.01'))
+        self.assertEqual(ticket_fee(None, None, Decimal('99.99')), Decimal('0.00'))
+
+    def test_model_method(self):
+        """Test IP.ticket_fee applies the IP's defaults."""
+        ip = IPFactory(default_ticket_fee=Decimal('2.00'), default_ticket_fee_percentage=Decimal('10.00'))
+        self.assertEqual(ip.ticket_fee(Decimal('25.05')), Decimal('4.51'))
+
+
+class BatchFeeTest(BaseAppDjangoTest):
+    """Test the batch fee engine."""
+
+    def setUp(self):
+        """Setup IPs with various defaults."""
+        cache.clear()
+        self.ips = [
+            IPFactory(default_ticket_fee=None, default_ticket_fee_percentage=None),
+            IPFactory(default_ticket_fee=Decimal('1.00'), default_ticket_fee_percentage=None),
+            IPFactory(default_ticket_fee=None, default_ticket_fee_percentage=Decimal('7.50')),
+            IPFactory(default_ticket_fee=Decimal('0.35'), default_ticket_fee_percentage=Decimal('2.95')),
+        ]
+
+    def test_matches_scalar_rule(self):
+        """Test every line equals the scalar rule, sub-cent and negative prices included."""
+        rng = random.Random(0)
+        rows = [(rng.choice(self.ips).pk, Decimal(rng.randint(-5000, 500000)) / 100, rng.randint(1, 10))
+                for __ in range(2000)]
+        rows.append((self.ips[3].pk, Decimal('10.005'), 3))
+        rows.append((self.ips[3].pk, Decimal('-10.00'), 1))
+        ips = IP.objects.in_bulk([ip.pk for ip in self.ips])
+        for line in calculate_fees(rows):
+            self.assertEqual(line.fee, ips[line.ip_id].ticket_fee(line.price) * line.quantity)
+        self.assertEqual(total_fees(rows), sum(ips[ip_id].ticket_fee(price) * quantity
+                                               for ip_id, price, quantity in rows))
+
+    def test_negative_price_rounds_whole_fee(self):
+        """Test the fixed fee and a negative percentage part are rounded together."""
+        (line,) = calculate_fees([(self.ips[3].pk, Decimal('-10.00'), 1)])
+        self.assertEqual(line.fee, Decimal('0.06'))
+        self.assertEqual(line.fee, self.ips[3].ticket_fee(Decimal('-10.00')))
+
+    def test_schedules_are_cached(self):
+        """Test a second batch reads no IP."""
+        rows = [(ip.pk, Decimal('10.00'), 1) for ip in self.ips]
+        calculate_fees(rows)
+        with CaptureQueriesContext(connection) as queries:
+            calculate_fees(rows)
+        self.assertEqual(len(queries), 0)
+
+    def test_unknown_ip(self):
+        """Test rows of missing IPs are rejected."""
+        with self.assertRaises(IP.DoesNotExist):
+            calculate_fees([(0, Decimal('1.00'), 1)])
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import post_save
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps import graphs
+from apps.graphs import record_points
+from apps.models import TrackerRollup
+from .base_testcases import BaseAppDjangoTest, PostAppWebTest
+from .factories import StaffFactory
+
+
+def _moment(day, hour, minute=0):
+    """Return an aware datetime in January 2020."""
+    return datetime(2020, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+class TrackerRollupTest(BaseAppDjangoTest):
+    """Test tracker points are folded into hourly and daily buckets."""
+
+    def test_incremental_rollups(self):
+        """Test repeated recordings accumulate in the same buckets."""
+        user = StaffFactory()
+        record_points(user.pk, [(_moment(1, 10, 5), 4), (_moment(1, 10, 50), 2)])
+        record_points(user.pk, [(_moment(1, 11), 9)])
+
+        hour = TrackerRollup.objects.get(user=user, resolution='hour', bucket=_moment(1, 10))
+        self.assertEqual((hour.count, hour.total, hour.minimum, hour.maximum), (2, 6, 2, 4))
+        day = TrackerRollup.objects.get(user=user, resolution='day')
+        self.assertEqual((day.count, day.total, day.minimum, day.maximum), (3, 15, 2, 9))
+
+
+class GraphTestPoint(models.Model):
+    """A tracker model with decoy datetime and number fields, for the write path tests."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    taken = models.DateTimeField()
+    status = models.IntegerField(default=0)
+    value = models.FloatField()
+
+    class Meta:
+        app_label = 'apps'
+        db_table = 'apps_test_graph_point'
+
+
+@override_settings(TRACKER_POINT_MODEL='apps.GraphTestPoint', TRACKER_POINT_FIELDS=('user', 'taken', 'value'))
+class TrackerWritePathTest(TransactionTestCase):
+    """Test new tracker rows are folded into the rollups."""
+
+    def setUp(self):
+        """Setup the tracker table, its receiver and a user."""
+        with connection.schema_editor() as editor:
+            editor.create_model(GraphTestPoint)
+        graphs.connect_signals()
+        self.user = StaffFactory()
+
+    def tearDown(self):
+        """Drop the tracker table and its receiver."""
+        post_save.disconnect(sender=GraphTestPoint, dispatch_uid='graphs_tracker_point_saved')
+        with connection.schema_editor() as editor:
+            editor.delete_model(GraphTestPoint)
+
+    def test_created_point_recorded(self):
+        """Test a created point is recorded from the configured fields once the save commits."""
+        GraphTestPoint.objects.create(user=self.user, taken=_moment(1, 10, 5), status=500, value=3)
+        hour = TrackerRollup.objects.get(user=self.user, resolution='hour')
+        self.assertEqual((hour.bucket, hour.count, hour.total), (_moment(1, 10), 1, 3))
+
+    def test_updated_point_ignored(self):
+        """Test saving an existing point does not count it twice."""
+        point = GraphTestPoint.objects.create(user=self.user, taken=_moment(1, 10, 5), value=3)
+        point.value = 5
+        point.save()
+        self.assertEqual(TrackerRollup.objects.get(user=self.user, resolution='hour').total, 3)
+
+    def test_rolled_back_point_ignored(self):
+        """Test a point whose transaction rolls back is not recorded."""
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                GraphTestPoint.objects.create(user=self.user, taken=_moment(1, 10, 5), value=3)
+                raise IntegrityError()
+        self.assertFalse(TrackerRollup.objects.exists())
+
+    def test_unset_model_not_watched(self):
+        """Test no receiver is connected while the tracker model is not configured."""
+        post_save.disconnect(sender=GraphTestPoint, dispatch_uid='graphs_tracker_point_saved')
+        with override_settings(TRACKER_POINT_MODEL=None):
+            graphs.connect_signals()
+        self.assertFalse(post_save.has_listeners(GraphTestPoint))
+
+    def test_fields_required(self):
+        """Test a tracker model without its fields is refused at startup."""
+        for fields in (None, ('user', 'value', 'taken'), ('status', 'taken', 'value')):
+            with override_settings(TRACKER_POINT_FIELDS=fields), self.assertRaises(ImproperlyConfigured):
+                graphs.connect_signals()
+
+
+class PostGraphDataViewTest(PostAppWebTest):
+    """Test the streamed graph endpoint."""
+
+    def test_get_downsampled_range(self):
+        """Test only the buckets of the requested range and resolution are returned."""
+        user = StaffFactory()
+        record_points(user.pk, [(_moment(1, 10), 4), (_moment(2, 10), 6), (_moment(5, 10), 1)])
+        response = self.app.get(reverse('posts-graph-data'), user=user, params={
+            'start': '2020-01-01T00:00:00Z', 'end': '2020-01-03T00:00:00Z', 'resolution': 'day'})
+
+        data = response.json
+        self.assertEqual(data['resolution'], 'day')
+        self.assertEqual([row[1] for row in data['data']], [4, 6])
+
+    def test_invalid_resolution(self):
+        """Test an unknown resolution is rejected."""
+        response = self.app.get(reverse('posts-graph-data'), user=StaffFactory(),
+                                params={'resolution': 'minute'}, expect_errors=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_epoch(self):
+        """Test an epoch no datetime can hold is rejected."""
+        response = self.app.get(reverse('posts-graph-data'), user=StaffFactory(),
+                                params={'start': '1e300'}, expect_errors=True)
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from apps.ip_cache import invalidate_ip, invalidate_ips, ip_cache_key
+from apps.models import IP
+from .factories import IPFactory, StaffFactory
+
+
+@patch('apps.ip_cache._flush')
+class CoalescedInvalidationTest(TransactionTestCase):
+    """Test IP invalidations are flushed once per transaction."""
+
+    def test_flushed_immediately_outside_transaction(self, flush):
+        """Test autocommit invalidations are not delayed."""
+        invalidate_ip(1)
+        flush.assert_called_once_with({1})
+
+    def test_coalesced_until_commit(self, flush):
+        """Test repeated saves of one transaction flush once."""
+        with transaction.atomic():
+            ip = IPFactory()
+            ip.save()
+            other = IPFactory()
+            ip.managers.clear()
+            self.assertFalse(flush.called)
+        flush.assert_called_once_with({ip.id, other.id})
+
+    def test_nothing_flushed_on_rollback(self, flush):
+        """Test a rolled back transaction flushes nothing by itself."""
+        try:
+            with transaction.atomic():
+                invalidate_ip(1)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(flush.called)
+        with transaction.atomic():
+            invalidate_ip(2)
+        flush.assert_called_once()
+        self.assertIn(2, flush.call_args[0][0])
+
+    def test_rolled_back_savepoint(self, flush):
+        """Test ids of a rolled back savepoint do not lose the later invalidations."""
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    invalidate_ip(1)
+                    raise ValueError
+            except ValueError:
+                pass
+            invalidate_ip(2)
+            invalidate_ip(3)
+        flush.assert_called_once_with({1, 2, 3})
+
+    def test_reverse_clear(self, flush):
+        """Test clearing the IPs a user manages invalidates those IPs."""
+        user = StaffFactory()
+        ips = [IPFactory(), IPFactory()]
+        for ip in ips:
+            ip.managers.add(user)
+        flush.reset_mock()
+        user.ip_manages.clear()
+        flush.assert_called_once_with(set(ip.id for ip in ips))
+
+    def test_bulk_invalidation(self, flush):
+        """Test a queryset is invalidated in a single flush."""
+        ips = [IPFactory(), IPFactory()]
+        flush.reset_mock()
+        IP.objects.all().invalidate_cache()
+        flush.assert_called_once_with(set(ip.id for ip in ips))
+
+
+class VersionedKeyTest(TransactionTestCase):
+    """Test invalidation starts a new key generation."""
+
+    def test_new_generation(self):
+        """Test the key of an IP changes once it is invalidated."""
+        key = ip_cache_key(7, 'detail')
+        self.assertEqual(ip_cache_key(7, 'detail'), key)
+        invalidate_ip(7)
+        self.assertNotEqual(ip_cache_key(7, 'detail'), key)
+
+    @override_settings(IP_LEGACY_CACHE_KEYS=['tweets_%s', 'legacy_%s'])
+    def test_legacy_keys_deleted_at_once(self):
+        """Test the legacy keys of several IPs are deleted in one call."""
+        with patch('apps.ip_cache.cache.delete_many') as delete_many:
+            invalidate_ips([7, 8])
+        delete_many.assert_called_once()
+        self.assertEqual(sorted(delete_many.call_args[0][0]),
+                         ['legacy_7', 'legacy_8', 'tweets_7', 'tweets_8'])
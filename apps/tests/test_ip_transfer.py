@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mock import patch
+
+from apps.ip_transfer import export_ips, import_ips
+from apps.models import IP
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory, StaffFactory
+
+
+def _row(i, **values):
+    """Return a JSON line of a new IP."""
+    row = {'company_name': 'IP %s' % i, 'address1': 'a', 'address2': 'b', 'email': 'ip%s@example.com' % i,
+           'contact_name': 'c', 'contact_number': '1', 'description': 'd', 'logo': 'ip/logo.png'}
+    row.update(values)
+    return json.dumps(row)
+
+
+class IPTransferTest(BaseAppDjangoTest):
+    """Test the streaming IP import and export."""
+
+    def test_round_trip(self):
+        """Test exported records import back unchanged, managers included."""
+        manager = StaffFactory()
+        ip = IPFactory(company_name='Accra Events')
+        ip.managers.add(manager)
+        for format in ('jsonl', 'csv'):
+            stream = io.StringIO()
+            self.assertEqual(export_ips(stream, format=format), 1)
+            stream.seek(0)
+            self.assertEqual(import_ips(stream, format=format, batch_size=10), (0, 1))
+            self.assertEqual(IP.objects.get().company_name, 'Accra Events')
+            self.assertEqual(list(ip.managers.all()), [manager])
+
+    def test_creates_in_batches(self):
+        """Test new records are created and linked batch by batch."""
+        manager = StaffFactory()
+        lines = [_row(i, managers=[manager.pk]) for i in range(25)]
+        created, updated = import_ips(io.StringIO('\n'.join(lines)), batch_size=10)
+
+        self.assertEqual((created, updated), (25, 0))
+        self.assertEqual(manager.ip_manages.count(), 25)
+
+    def test_updates_existing(self):
+        """Test a row with the id of an IP only changes the columns it carries."""
+        ip = IPFactory(company_name='Accra Events', contact_name='Kofi')
+        created, updated = import_ips(io.StringIO(json.dumps({'id': ip.pk, 'company_name': 'Kumasi Events'})))
+
+        self.assertEqual((created, updated), (0, 1))
+        ip.refresh_from_db()
+        self.assertEqual((ip.company_name, ip.contact_name), ('Kumasi Events', 'Kofi'))
+
+    def test_managers_replaced(self):
+        """Test the managers column replaces the managers; rows without it leave them alone."""
+        old, new = StaffFactory(), StaffFactory()
+        ip, other = IPFactory(), IPFactory()
+        ip.managers.add(old)
+        other.managers.add(old)
+        lines = [json.dumps({'id': ip.pk, 'managers': [new.pk]}), json.dumps({'id': other.pk})]
+        import_ips(io.StringIO('\n'.join(lines)))
+
+        self.assertEqual(list(ip.managers.all()), [new])
+        self.assertEqual(list(old.ip_manages.all()), [other])
+
+    @patch('apps.ip_transfer._can_return_ids', return_value=False)
+    def test_ids_assigned_under_lock(self, can_return_ids):
+        """Test ids are only read once other writers are locked out, where the backend cannot return them."""
+        last = IPFactory().pk
+        manager = StaffFactory()
+        with CaptureQueriesContext(connection) as queries:
+            created, updated = import_ips(io.StringIO('\n'.join(_row(i, managers=[manager.pk]) for i in range(3))))
+
+        self.assertEqual((created, updated), (3, 0))
+        self.assertEqual(sorted(manager.ip_manages.values_list('pk', flat=True)), [last + 1, last + 2, last + 3])
+        sql = [query['sql'].upper() for query in queries.captured_queries]
+        lock = 'WHERE 0' if connection.vendor == 'sqlite' else 'FOR UPDATE'
+        self.assertTrue(any(lock in statement for statement in sql))
+        self.assertLess(min(i for i, statement in enumerate(sql) if lock in statement),
+                        min(i for i, statement in enumerate(sql) if statement.startswith('INSERT')))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mock import Mock, patch
+
+from apps import memberships
+from apps.memberships import country_key, rebuild_ip_countries, refresh_ip_countries
+from apps.models import IP, IPCountry
+from .base_testcases import BaseAppDjangoTest
+from .factories import EventFactory, IPFactory
+
+EVENT_MODEL = IP._meta.get_field('events').related_model
+EVENT_IP_FIELD = IP._meta.get_field('events').field.name
+
+
+class IPCountryMembershipTest(BaseAppDjangoTest):
+    """Test the memberships follow events saved through the signals."""
+
+    def setUp(self):
+        """Setup two IPs."""
+        self.ip = IPFactory()
+        self.other_ip = IPFactory()
+
+    def _event(self, ip, *codes):
+        """Save an event of `ip` in some countries; return it and the countries."""
+        event = EventFactory(**{EVENT_IP_FIELD: ip})
+        return event, [self._add_country(event, code) for code in codes]
+
+    def _add_country(self, event, code):
+        """Attach a country to an event, whether countries are rows of the event or shared ones."""
+        countries = EVENT_MODEL._meta.get_field('countries')
+        field = countries.related_model._meta.get_field('country')
+        country = field.related_model._default_manager.get_or_create(code=code)[0] if field.is_relation else code
+        if countries.many_to_many:
+            event.countries.add(countries.related_model._default_manager.create(country=country))
+        else:
+            countries.related_model._default_manager.create(**{countries.field.name: event, 'country': country})
+        return country
+
+    def _ips(self, country):
+        """Return the IPs found in a country."""
+        return list(IP.objects.by_country(country).order_by('pk'))
+
+    def test_event_countries_recorded(self):
+        """Test saving an event in countries makes its IP found in each."""
+        __, (ghana, togo) = self._event(self.ip, 'GH', 'TG')
+        self.assertEqual(self._ips(ghana), [self.ip])
+        self.assertEqual(self._ips(togo), [self.ip])
+
+    def test_event_moved(self):
+        """Test moving an event to another IP moves the membership."""
+        event, (ghana,) = self._event(self.ip, 'GH')
+        setattr(event, EVENT_IP_FIELD, self.other_ip)
+        event.save()
+        self.assertEqual(self._ips(ghana), [self.other_ip])
+
+    def test_membership_kept_by_other_event(self):
+        """Test deleting one of two events in a country keeps the IP in it."""
+        event, (ghana,) = self._event(self.ip, 'GH')
+        self._event(self.ip, 'GH')
+        event.delete()
+        self.assertEqual(self._ips(ghana), [self.ip])
+
+    def test_event_deleted_in_one_query(self):
+        """Test deleting an event removes its stale memberships with a single delete."""
+        event, (ghana, togo) = self._event(self.ip, 'GH', 'TG')
+        with CaptureQueriesContext(connection) as queries:
+            event.delete()
+        deletes = [query for query in queries if query['sql'].startswith('DELETE') and
+                   IPCountry._meta.db_table in query['sql']]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(self._ips(ghana) + self._ips(togo), [])
+
+    def test_countries_cleared(self):
+        """Test removing the countries of an event removes its IP from them."""
+        event, (ghana,) = self._event(self.ip, 'GH')
+        if EVENT_MODEL._meta.get_field('countries').many_to_many:
+            event.countries.clear()
+        else:
+            event.countries.all().delete()
+        self.assertEqual(self._ips(ghana), [])
+
+    def test_concurrent_refresh(self):
+        """Test a membership inserted by a concurrent refresh is not an error."""
+        __, (ghana,) = self._event(self.ip, 'GH')
+        IPCountry.objects.all().delete()
+        source_countries = memberships.source_countries
+
+        def racing(ip_ids):
+            wanted = source_countries(ip_ids)
+            IPCountry.objects.bulk_create(IPCountry(ip_id=ip_id, country=country) for ip_id, country in wanted)
+            return wanted
+        with patch('apps.memberships.source_countries', side_effect=racing):
+            refresh_ip_countries([self.ip.pk])
+        self.assertEqual(self._ips(ghana), [self.ip])
+
+    def test_rebuild_check(self):
+        """Test differences are counted and only repaired when asked."""
+        __, (ghana,) = self._event(self.ip, 'GH')
+        IPCountry.objects.all().delete()
+        IPCountry.objects.create(ip=self.other_ip, country=country_key(ghana))
+        self.assertEqual(rebuild_ip_countries(fix=False), (1, 1))
+        self.assertEqual(self._ips(ghana), [self.other_ip])
+        self.assertEqual(rebuild_ip_countries(), (1, 1))
+        self.assertEqual(rebuild_ip_countries(), (0, 0))
+        self.assertEqual(self._ips(ghana), [self.ip])
+
+
+class CountryKeyTest(BaseAppDjangoTest):
+    """Test countries are keyed like the stored `values_list` values."""
+
+    def test_related_country(self):
+        """Test related countries are keyed by primary key, even when they have a code."""
+        with patch('apps.memberships._country_field', return_value=Mock(is_relation=True)):
+            self.assertEqual(country_key(Mock(pk=3, code='GH')), '3')
+            self.assertEqual(country_key(3), '3')
+
+    def test_country_value(self):
+        """Test plain country fields are keyed by code or value."""
+        with patch('apps.memberships._country_field', return_value=Mock(is_relation=False)):
+            self.assertEqual(country_key(Mock(pk=3, code='GH')), 'GH')
+            self.assertEqual(country_key('GH'), 'GH')
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.views.generic import View
+from mock import patch
+
+from apps import routers
+from apps.cache_versions import bump_version
+from apps.ip_cache import IP_NAMESPACE
+from apps.models import IP
+from apps.page_cache import ConditionalPageMixin
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory, StaffFactory
+
+
+class IPPageView(ConditionalPageMixin, View):
+    """Minimal page depending on one IP."""
+
+    renders = 0
+    uses_csrf = False
+    read_from = None
+
+    def get_cache_namespaces(self):
+        """Depend on the IP of the url."""
+        return [IP_NAMESPACE % self.kwargs['pk']]
+
+    def get(self, request, *args, **kwargs):
+        """Count the renders."""
+        IPPageView.renders += 1
+        IPPageView.read_from = routers.ReplicaRouter().db_for_read(IP)
+        if self.uses_csrf:
+            get_token(request)
+        return HttpResponse('page %s' % IPPageView.renders)
+
+
+class ConditionalPageTest(BaseAppDjangoTest):
+    """Test conditional GET and versioned page caching."""
+
+    def setUp(self):
+        """Setup an IP."""
+        cache.clear()
+        IPPageView.renders = 0
+        IPPageView.uses_csrf = False
+        self.ip = IPFactory()
+        self.view = IPPageView.as_view()
+
+    def _get(self, **headers):
+        """Request the page of the IP anonymously."""
+        request = RequestFactory().get('/ips/%s' % self.ip.pk, **headers)
+        request.user = AnonymousUser()
+        return self.view(request, pk=self.ip.pk)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    @patch('apps.routers.is_healthy', return_value=True)
+    def test_rendered_from_primary(self, is_healthy):
+        """Test a page is rendered from the primary even in a replica block, since it is cached."""
+        with routers.replica_reads():
+            self._get()
+        self.assertEqual(IPPageView.read_from, 'default')
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets a 304 without rendering."""
+        etag = self._get()['ETag']
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(IPPageView.renders, 1)
+
+    def test_if_modified_since(self):
+        """Test an up to date If-Modified-Since gets a 304."""
+        last_modified = self._get()['Last-Modified']
+        self.assertEqual(self._get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_cached_copy(self):
+        """Test anonymous visitors share the cached page."""
+        first = self._get()
+        second = self._get()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(IPPageView.renders, 1)
+
+    def test_csrf_pages_not_shared(self):
+        """Test pages carrying a CSRF token are rendered for every visitor and kept private."""
+        IPPageView.uses_csrf = True
+        self._get()
+        response = self._get()
+        self.assertEqual(IPPageView.renders, 2)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_invalidation_changes_etag(self):
+        """Test a new IP version renders a new page with a new ETag."""
+        etag = self._get()['ETag']
+        bump_version(IP_NAMESPACE % self.ip.pk)
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(IPPageView.renders, 2)
+
+
+class ConditionalPageSaveTest(TransactionTestCase):
+    """Test saves invalidate pages; invalidations are flushed on commit."""
+
+    def test_save_invalidates(self):
+        """Test saving the IP goes through invalidate_ips_cache."""
+        cache.clear()
+        ip = IPFactory()
+        request = RequestFactory().get('/ips/%s' % ip.pk)
+        request.user = AnonymousUser()
+        etag = IPPageView.as_view()(request, pk=ip.pk)['ETag']
+        ip.save()
+        self.assertNotEqual(IPPageView.as_view()(request, pk=ip.pk)['ETag'], etag)
+
+
+class IPDetailPageTest(TransactionTestCase):
+    """Test the IP page is served conditionally and its body cached as a fragment."""
+
+    def setUp(self):
+        """Setup an IP without a vanity url."""
+        cache.clear()
+        self.ip = IPFactory(post_url=None, description='first')
+        self.url = reverse('ip_detail', kwargs={'ip_id': self.ip.pk})
+
+    def test_absolute_url(self):
+        """Test the IP links to this page."""
+        self.assertEqual(self.ip.get_absolute_url(), self.url)
+
+    def test_not_modified(self):
+        """Test a repeat visit gets a 304."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'first')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_fragment_follows_ip_version(self):
+        """Test the cached body of a private page is reused until the IP is saved."""
+        self.client.force_login(StaffFactory())
+        self.assertContains(self.client.get(self.url), 'first')
+        IP.objects.filter(pk=self.ip.pk).update(description='second')
+        self.assertContains(self.client.get(self.url), 'first')
+        IP.objects.get(pk=self.ip.pk).save()
+        self.assertContains(self.client.get(self.url), 'second')
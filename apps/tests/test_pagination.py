@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
+from django.db import connection
+from django.utils import translation
+
+from apps.managers import name_field
+from apps.models import IP
+from apps.pagination import CachedCountPaginator, KeysetPaginator
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+class IPKeysetPaginationTest(BaseAppDjangoTest):
+    """Test cursor pagination of IP listings."""
+
+    def setUp(self):
+        """Setup IPs sharing some names."""
+        for name in ['delta', 'alpha', 'charlie', 'bravo', 'alpha', 'echo', 'bravo']:
+            IPFactory(company_name=name)
+        IPFactory(company_name='hidden', hidden=True)
+
+    def _walk(self, queryset, per_page):
+        """Return every page of a queryset."""
+        pages, cursor = [], None
+        while True:
+            page = queryset.keyset_page(cursor, per_page=per_page)
+            pages.append([ip.company_name for ip in page.object_list])
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_walks_all_rows_once(self):
+        """Test pages follow each other without gaps or duplicates."""
+        with translation.override('en'):
+            pages = self._walk(IP.objects.visible(), 3)
+        self.assertEqual(pages, [['alpha', 'alpha', 'bravo'], ['bravo', 'charlie', 'delta'], ['echo']])
+
+    def test_matches_offset_ordering(self):
+        """Test the keyset order is the ordered_by_name order."""
+        with translation.override('en'):
+            pages = self._walk(IP.objects.visible(), 2)
+            expected = [ip.company_name for ip in IP.objects.visible().ordered_by_name()]
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is rejected."""
+        with self.assertRaises(SuspiciousOperation):
+            IP.objects.keyset_page('not-a-cursor')
+
+    def test_null_names_last(self):
+        """Test rows without a name in the language follow the named ones, in pk order."""
+        ips = list(IP.objects.visible().order_by('pk'))
+        IP.objects.filter(pk=ips[3].pk).update(company_name_fr='zulu')
+        IP.objects.filter(pk=ips[5].pk).update(company_name_fr='alfa')
+        with translation.override('fr'):
+            pages = self._walk(IP.objects.visible(), 3)
+            expected = [ip.company_name for ip in IP.objects.visible().ordered_by_name()]
+        nulls = [ip.pk for ip in ips if ip.pk not in (ips[3].pk, ips[5].pk)]
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([ip.pk for ip in IP.objects.visible().ordered_by_name('fr')],
+                         [ips[5].pk, ips[3].pk] + nulls)
+
+    def test_deep_page_uses_name_index(self):
+        """Test SQLite serves a deep page from the name index without sorting."""
+        if connection.vendor != 'sqlite':
+            return
+        with translation.override('en'):
+            cursor = IP.objects.keyset_page(per_page=2).next_cursor
+            queryset = KeysetPaginator(IP.objects.all(), name_field(), 2)._parts(cursor)[0][:3]
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as db_cursor:
+                db_cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(str(row[-1]) for row in db_cursor.fetchall())
+        self.assertIn('ip_name_en_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class CachedCountPaginatorTest(BaseAppDjangoTest):
+    """Test changelist counts are cached per query."""
+
+    def setUp(self):
+        """Setup a few IPs."""
+        cache.clear()
+        for name in ['alpha', 'bravo', 'charlie']:
+            IPFactory(company_name=name)
+
+    def test_count_cached(self):
+        """Test the same query is counted once."""
+        self.assertEqual(CachedCountPaginator(IP.objects.order_by('pk'), 2).count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(IP.objects.order_by('pk'), 2).count, 3)
+
+    def test_count_per_query(self):
+        """Test differently filtered queries are counted separately."""
+        CachedCountPaginator(IP.objects.order_by('pk'), 2).count
+        self.assertEqual(CachedCountPaginator(IP.objects.filter(company_name='alpha').order_by('pk'), 2).count, 1)
+
+    def test_list(self):
+        """Test plain lists are counted directly."""
+        self.assertEqual(CachedCountPaginator([1, 2, 3], 2).num_pages, 2)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from mock import patch
+
+from apps.cache_versions import is_shared_cache
+from apps.constants import group_permissions
+from apps.models import IP
+from apps.permissions import get_ip_permissions, get_managed_ip_ids
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory, StaffFactory, give_permission
+
+
+class IPPermissionCacheTest(BaseAppDjangoTest):
+    """Test the cached permission sets behind IPQuerySet.for_user."""
+
+    def setUp(self):
+        """Setup a staff user managing one IP."""
+        self.user = StaffFactory()
+        give_permission(self.user, group_permissions.IP_VIEW_OWN)
+        self.ip = IPFactory()
+        self.other_ip = IPFactory()
+        self.ip.managers.add(self.user)
+
+    def test_resolved_once_per_request(self):
+        """Test the auth tables are asked once per permission."""
+        with patch('apps.permissions.repos.user_has_perm', return_value=False) as has_perm:
+            get_ip_permissions(self.user)
+            get_ip_permissions(self.user)
+        self.assertEqual(has_perm.call_count, 4)
+
+    @patch('apps.permissions.is_shared_cache', return_value=True)
+    def test_shared_across_requests(self, is_shared_cache):
+        """Test a fresh user object is served from the shared cache."""
+        get_ip_permissions(self.user)
+        with patch('apps.permissions.repos.user_has_perm') as has_perm:
+            perms = get_ip_permissions(User.objects.get(pk=self.user.pk))
+        self.assertFalse(has_perm.called)
+        self.assertIn(group_permissions.IP_VIEW_OWN, perms)
+
+    def test_process_local_cache_unused(self):
+        """Test a process-local cache is never trusted with permission sets."""
+        self.assertFalse(is_shared_cache())
+        get_ip_permissions(self.user)
+        with patch('apps.permissions.repos.user_has_perm', return_value=False) as has_perm:
+            get_ip_permissions(User.objects.get(pk=self.user.pk))
+        self.assertEqual(has_perm.call_count, 4)
+
+    @patch('apps.permissions.is_shared_cache', return_value=True)
+    def test_invalidated_on_permission_change(self, is_shared_cache):
+        """Test granting a permission is visible to the next request."""
+        self.assertEqual(list(IP.objects.for_user(self.user)), [self.ip])
+        give_permission(self.user, group_permissions.IP_VIEW_ALL)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(set(IP.objects.for_user(user)), {self.ip, self.other_ip})
+
+    @patch('apps.permissions.is_shared_cache', return_value=True)
+    def test_managed_ids_invalidated_on_manager_change(self, is_shared_cache):
+        """Test adding a manager refreshes the cached IP ids."""
+        self.assertEqual(get_managed_ip_ids(self.user), {self.ip.pk})
+        self.other_ip.managers.add(self.user)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_managed_ip_ids(user), {self.ip.pk, self.other_ip.pk})
+
+    @patch('apps.permissions.is_shared_cache', return_value=True)
+    def test_invalidated_on_user_flags_change(self, is_shared_cache):
+        """Test deactivating or demoting a user is visible to the next request."""
+        give_permission(self.user, group_permissions.IP_VIEW_ALL)
+        self.assertEqual(set(IP.objects.for_user(User.objects.get(pk=self.user.pk))), {self.ip, self.other_ip})
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(list(IP.objects.for_user(User.objects.get(pk=self.user.pk))), [])
+
+    @patch('apps.permissions.is_shared_cache', return_value=True)
+    def test_login_keeps_cache(self, is_shared_cache):
+        """Test saving only the last login leaves the cached set alone."""
+        get_ip_permissions(self.user)
+        self.user.save(update_fields=['last_login'])
+        with patch('apps.permissions.repos.user_has_perm') as has_perm:
+            get_ip_permissions(User.objects.get(pk=self.user.pk))
+        self.assertFalse(has_perm.called)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.test.utils import override_settings
+from mock import patch
+
+from apps.portals import connect_signals, get_base_portal, portal_relations, warm_base_portals
+from .base_testcases import BaseAppDjangoTest
+from .factories import StaffFactory
+
+PROFILE_MODEL = User._meta.get_field('profile').related_model
+
+# The portal relations of the installed profile model.
+PORTAL_RELATIONS = [field.name for field in PROFILE_MODEL._meta.get_fields()
+                    if field.is_relation and field.related_model is not None and 'portal' in field.name]
+
+
+@override_settings(BASE_PORTAL_RELATIONS=PORTAL_RELATIONS)
+@patch.object(PROFILE_MODEL, 'get_base_portal', side_effect=['first', 'second', 'third'])
+class BasePortalCacheTest(BaseAppDjangoTest):
+    """Test base portals are cached and invalidated."""
+
+    def setUp(self):
+        """Setup a user with a profile and watch the portal relations."""
+        cache.clear()
+        connect_signals()
+        self.user = StaffFactory()
+
+    def _fresh_user(self, user=None):
+        """Return the user as the next request loads it."""
+        return User.objects.select_related('profile').get(pk=(user or self.user).pk)
+
+    def test_cached(self, base_portal):
+        """Test the portal is resolved once."""
+        self.assertEqual(get_base_portal(self._fresh_user()), 'first')
+        self.assertEqual(get_base_portal(self._fresh_user()), 'first')
+        self.assertEqual(base_portal.call_count, 1)
+
+    def test_warm_many(self, base_portal):
+        """Test several users are resolved together."""
+        other = StaffFactory()
+        self.assertEqual(warm_base_portals([self.user, other]), {self.user.pk: 'first', other.pk: 'second'})
+
+    def test_invalidated_on_profile_save(self, base_portal):
+        """Test saving the profile resolves the portal again."""
+        get_base_portal(self._fresh_user())
+        self.user.profile.save()
+        self.assertEqual(get_base_portal(self._fresh_user()), 'second')
+
+    @override_settings(BASE_PORTAL_RELATIONS=None)
+    def test_not_cached_without_relations(self, base_portal):
+        """Test portals are resolved every time while no relation is declared."""
+        self.assertEqual(get_base_portal(self._fresh_user()), 'first')
+        self.assertEqual(get_base_portal(self._fresh_user()), 'second')
+
+    @override_settings(BASE_PORTAL_RELATIONS=['no_such_relation'])
+    def test_relations_validated(self, base_portal):
+        """Test a declared name that is not a profile relation is rejected."""
+        with self.assertRaises(ImproperlyConfigured):
+            portal_relations()
+
+    def test_portal_models_watched(self, base_portal):
+        """Test the declared relations are connected."""
+        for field in portal_relations():
+            self.assertTrue(post_save.has_listeners(field.related_model))
+            self.assertTrue(pre_delete.has_listeners(field.related_model))
+            if field.many_to_many:
+                self.assertTrue(m2m_changed.has_listeners(field.remote_field.through if field.concrete
+                                                          else field.through))
+
+    def test_portal_change_scoped(self, base_portal):
+        """Test a change to a portal resolves again only the portals of the users linked to it."""
+        if not PORTAL_RELATIONS:
+            self.skipTest('The profile has no portal relation.')
+        other = StaffFactory()
+        warm_base_portals([self._fresh_user(), self._fresh_user(other)])
+        with patch('apps.portals._linked_users', return_value=[self.user.pk]):
+            post_save.send(sender=portal_relations()[0].related_model, instance=None, created=False)
+        self.assertEqual(warm_base_portals([self._fresh_user(), self._fresh_user(other)]),
+                         {self.user.pk: 'third', other.pk: 'second'})
+
+    def test_invalidated_on_portal_assignment(self, base_portal):
+        """Test assigning portals to a profile resolves its user's portal again, once the change is done."""
+        relations = [field for field in portal_relations() if field.many_to_many]
+        if not relations:
+            self.skipTest('The profile has no many-to-many portal relation.')
+        through = relations[0].remote_field.through if relations[0].concrete else relations[0].through
+        get_base_portal(self._fresh_user())
+        m2m_changed.send(sender=through, instance=self.user.profile, action='pre_add', reverse=False,
+                         model=None, pk_set=set())
+        self.assertEqual(get_base_portal(self._fresh_user()), 'first')
+        m2m_changed.send(sender=through, instance=self.user.profile, action='post_add', reverse=False,
+                         model=None, pk_set=set())
+        self.assertEqual(get_base_portal(self._fresh_user()), 'second')
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.test import RequestFactory
+from mock import patch
+
+from apps.decorators import administration_required, superadmin_required
+from apps.middleware import PrincipalMiddleware
+from apps.principal import get_principal
+from .base_testcases import BaseAppDjangoTest
+from .factories import AdminFactory, StaffFactory
+
+
+@administration_required
+def _admin_view(request):
+    """View restricted to administrators."""
+    return HttpResponse('ok')
+
+
+@superadmin_required
+def _superadmin_view(request):
+    """View restricted to superusers."""
+    return HttpResponse('ok')
+
+
+class PrincipalTest(BaseAppDjangoTest):
+    """Test the cached request principal behind the decorators."""
+
+    def _request(self, user):
+        """Return a request made by `user`."""
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_anonymous(self):
+        """Test anonymous requests are denied."""
+        with self.assertRaises(PermissionDenied):
+            _admin_view(self._request(AnonymousUser()))
+
+    def test_administrator_allowed(self):
+        """Test administrators pass and plain staff do not."""
+        self.assertEqual(_admin_view(self._request(AdminFactory())).status_code, 200)
+        with self.assertRaises(PermissionDenied):
+            _admin_view(self._request(StaffFactory()))
+        with self.assertRaises(PermissionDenied):
+            _superadmin_view(self._request(AdminFactory()))
+
+    @patch('apps.principal.is_shared_cache', return_value=True)
+    def test_no_queries_once_cached(self, is_shared_cache):
+        """Test a later request decides access without auth queries."""
+        admin = AdminFactory()
+        _admin_view(self._request(admin))
+        user = User.objects.get(pk=admin.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(_admin_view(self._request(user)).status_code, 200)
+
+    def test_invalidated_on_save(self):
+        """Test a saved user gets a freshly resolved principal."""
+        user = StaffFactory()
+        self.assertFalse(get_principal(self._request(user)).is_superuser)
+        user.is_superuser = True
+        user.save()
+        self.assertTrue(get_principal(self._request(User.objects.get(pk=user.pk))).is_superuser)
+
+
+class SessionBackendTest(BaseAppDjangoTest):
+    """Test sessions keep authenticating across the backend change."""
+
+    def _session_user(self, backend):
+        """Return a user and the user of a request of its session logged in with `backend`."""
+        user = StaffFactory()
+        self.client.force_login(user, backend=backend)
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        self.assertEqual(request.session[SESSION_KEY], str(user.pk))
+        AuthenticationMiddleware(lambda request: None)(request)
+        PrincipalMiddleware(lambda request: None)(request)
+        return user, request
+
+    def test_model_backend_session(self):
+        """Test a session created with ModelBackend is still logged in, with its profile loaded."""
+        user, request = self._session_user('django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(request.user, user)
+        self.assertEqual(request.session[BACKEND_SESSION_KEY], 'apps.backends.ProfileModelBackend')
+        with self.assertNumQueries(0):
+            request.user.profile
+
+    def test_profile_backend_session(self):
+        """Test new sessions use ProfileModelBackend."""
+        user, request = self._session_user('apps.backends.ProfileModelBackend')
+        self.assertEqual(request.user, user)
+        with self.assertNumQueries(0):
+            request.user.profile
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import errno
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from apps.models import IP
+from apps.relocation import move_stored_file, relocate_ip_logos
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+class MoveStoredFileTest(SimpleTestCase):
+    """Test the cheapest available move is used for a stored file."""
+
+    def setUp(self):
+        """Setup a temporary storage holding one file."""
+        self.root = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.root)
+        self.data = os.urandom(300 * 1024)
+        self.name = self.storage.save('uploads/logo.png', ContentFile(self.data))
+
+    def tearDown(self):
+        """Remove the temporary storage."""
+        shutil.rmtree(self.root)
+
+    def _read(self, name):
+        """Return the content of a stored file."""
+        with self.storage.open(name, 'rb') as stored:
+            return stored.read()
+
+    def test_rename_on_same_filesystem(self):
+        """Test the file is renamed into place."""
+        with patch('apps.relocation._copy_file') as copy:
+            new_name = move_stored_file(self.storage, self.name, 'ip/logo.png', chunk_size=4096)
+        self.assertEqual(new_name, 'ip/logo.png')
+        self.assertFalse(copy.called)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertEqual(self._read(new_name), self.data)
+
+    def test_copy_across_filesystems(self):
+        """Test the file is copied when rename crosses devices."""
+        with patch('apps.relocation.os.rename', side_effect=OSError(errno.EXDEV, 'cross-device')):
+            new_name = move_stored_file(self.storage, self.name, 'ip/logo.png', chunk_size=4096)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertEqual(self._read(new_name), self.data)
+
+    def test_stream_without_local_path(self):
+        """Test storages without paths are streamed."""
+        with patch.object(self.storage, 'path', side_effect=NotImplementedError):
+            new_name = move_stored_file(self.storage, self.name, 'ip/logo.png', chunk_size=4096)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertEqual(self._read(new_name), self.data)
+
+    def test_keeps_existing_destination(self):
+        """Test an existing destination file is not overwritten."""
+        self.storage.save('ip/logo.png', ContentFile(b'other'))
+        new_name = move_stored_file(self.storage, self.name, 'ip/logo.png')
+        self.assertNotEqual(new_name, 'ip/logo.png')
+        self.assertEqual(self._read('ip/logo.png'), b'other')
+
+
+class RelocateIPLogosTest(BaseAppDjangoTest):
+    """Test logos are relocated and interrupted relocations repaired."""
+
+    def setUp(self):
+        """Setup an IP whose logo lives outside `ip/` in a temporary media root."""
+        self.root = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.root)
+        self.media.enable()
+        name = default_storage.save('uploads/logo.png', ContentFile(b'logo'))
+        self.ip = IPFactory()
+        IP.objects.filter(pk=self.ip.pk).update(logo=name)
+
+    def tearDown(self):
+        """Remove the temporary media root."""
+        self.media.disable()
+        shutil.rmtree(self.root)
+
+    def _relocate(self):
+        """Relocate the IP's logo as loaded from the database."""
+        with patch('apps.relocation._after_relocation'):
+            return relocate_ip_logos(IP.objects.filter(pk=self.ip.pk))
+
+    def test_relocated(self):
+        """Test the file moves and the row follows it."""
+        self.assertEqual(len(self._relocate()), 1)
+        self.assertEqual(IP.objects.get(pk=self.ip.pk).logo.name, 'ip/logo.png')
+        self.assertFalse(default_storage.exists('uploads/logo.png'))
+
+    def test_row_repaired_after_interruption(self):
+        """Test a file moved before the row was updated is adopted on the next run."""
+        move_stored_file(default_storage, 'uploads/logo.png', 'ip/logo.png')
+        self.assertEqual(len(self._relocate()), 1)
+        self.assertEqual(IP.objects.get(pk=self.ip.pk).logo.name, 'ip/logo.png')
+
+    def test_file_of_another_ip_not_adopted(self):
+        """Test a destination file referenced by another IP is left to it."""
+        move_stored_file(default_storage, 'uploads/logo.png', 'ip/logo.png')
+        IP.objects.filter(pk=IPFactory().pk).update(logo='ip/logo.png')
+        self.assertEqual(self._relocate(), [])
+        self.assertEqual(IP.objects.get(pk=self.ip.pk).logo.name, 'uploads/logo.png')
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test.utils import override_settings
+from mock import patch
+from PIL import Image
+
+from apps.models import IP
+from apps.renditions import generate_renditions, get_specs, needs_renditions, rendition_name, spec_key
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+def _png(size, color):
+    """Return the bytes of a plain PNG image."""
+    output = BytesIO()
+    Image.new('RGBA', size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+class LogoRenditionsTest(BaseAppDjangoTest):
+    """Test logo renditions are rendered, stored and served."""
+
+    def setUp(self):
+        """Setup an IP with a logo in a temporary media root."""
+        self.root = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.root)
+        self.media.enable()
+        self.ip = self._with_logo(IPFactory(), 'ip/logo.png', (400, 300))
+
+    def tearDown(self):
+        """Remove the temporary media root."""
+        self.media.disable()
+        shutil.rmtree(self.root)
+
+    def _with_logo(self, ip, name, size):
+        """Store a logo for an IP without going through the save signals."""
+        name = default_storage.save(name, ContentFile(_png(size, (200, 10, 10, 255))))
+        IP.objects.filter(pk=ip.pk).update(logo=name)
+        return IP.objects.get(pk=ip.pk)
+
+    def _render(self, ip):
+        """Render the renditions of an IP on this thread."""
+        self.assertEqual(generate_renditions([ip]), 1)
+        return IP.objects.get(pk=ip.pk)
+
+    def test_rendered_logo(self):
+        """Test every spec is stored at its size and the default one is served."""
+        self.assertTrue(needs_renditions(self.ip))
+        ip = self._render(self.ip)
+        self.assertFalse(needs_renditions(ip))
+        for spec in get_specs():
+            with default_storage.open(ip.logo_manifest['renditions'][spec_key(spec)], 'rb') as stored:
+                image = Image.open(stored)
+                self.assertEqual((image.size, image.format), ((spec.width, spec.height), spec.format))
+        self.assertEqual(ip.logo_m_url, default_storage.url(rendition_name(ip, '180x180.jpg')))
+
+    def test_missing_rendition_falls_back(self):
+        """Test the original logo spec is served while no rendition exists."""
+        self.assertIsNone(self.ip.logo_rendition_url('180x180.jpg'))
+        with patch.object(IP, 'logo_m') as logo_m:
+            logo_m.url = '/media/original.jpg'
+            self.assertEqual(self.ip.logo_m_url, '/media/original.jpg')
+
+    def test_rerendered_after_logo_change(self):
+        """Test a new logo invalidates the old renditions until they are rendered again."""
+        ip = self._render(self.ip)
+        old_url = ip.logo_m_url
+        ip = self._with_logo(ip, 'ip/new_logo.png', (100, 100))
+        self.assertTrue(needs_renditions(ip))
+        self.assertIsNone(ip.logo_rendition_url('180x180.jpg'))
+        ip = self._render(ip)
+        self.assertNotEqual(ip.logo_m_url, old_url)
+        self.assertIn('new_logo', ip.logo_m_url)
+
+    def test_replaced_renditions_deleted(self):
+        """Test the renditions of a previous logo are deleted once the new ones are stored."""
+        old_names = list(self._render(self.ip).logo_manifest['renditions'].values())
+        ip = self._render(self._with_logo(self.ip, 'ip/new_logo.png', (100, 100)))
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+        self.assertTrue(all(default_storage.exists(name) for name in ip.logo_manifest['renditions'].values()))
+
+    def test_stale_save_keeps_manifest(self):
+        """Test saving an instance loaded before the renditions were stored keeps the manifest."""
+        stale = IP.objects.get(pk=self.ip.pk)
+        manifest = self._render(self.ip).logo_renditions
+        stale.company_name = 'Renamed'
+        with patch('apps.models.renditions.schedule_renditions'):
+            stale.save()
+        ip = IP.objects.get(pk=self.ip.pk)
+        self.assertEqual((ip.company_name, ip.logo_renditions), ('Renamed', manifest))
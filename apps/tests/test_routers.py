@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.http import HttpResponse
+from mock import patch
+
+from apps import routers
+from apps.middleware import ReplicaMiddleware
+from apps.models import IP
+from .base_testcases import BaseAppDjangoTest
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+@patch('apps.routers.is_healthy', return_value=True)
+class ReplicaRouterTest(BaseAppDjangoTest):
+    """Test the routing of reads to replicas."""
+
+    def setUp(self):
+        """Setup the router."""
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_outside_block_use_primary(self, is_healthy):
+        """Test reads only go to a replica inside a read-only block."""
+        self.assertEqual(self.router.db_for_read(IP), 'default')
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(IP), 'replica')
+        self.assertEqual(self.router.db_for_read(IP), 'default')
+
+    def test_primary_reads_block(self, is_healthy):
+        """Test reads for cached results use the primary inside a replica block."""
+        with routers.replica_reads():
+            with routers.primary_reads():
+                self.assertEqual(self.router.db_for_read(IP), 'default')
+            self.assertEqual(self.router.db_for_read(IP), 'replica')
+
+    def test_write_pins_block_to_primary(self, is_healthy):
+        """Test reads following a write in the same block use the primary."""
+        with routers.replica_reads():
+            self.router.db_for_write(IP)
+            self.assertEqual(self.router.db_for_read(IP), 'default')
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(IP), 'replica')
+
+    def test_unhealthy_replica(self, is_healthy):
+        """Test reads fall back to the primary when no replica answers."""
+        is_healthy.return_value = False
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(IP), 'default')
+
+    def test_replicas_are_not_migrated(self, is_healthy):
+        """Test replicas copy their schema instead of migrating."""
+        self.assertTrue(self.router.allow_migrate('default', 'apps'))
+        self.assertFalse(self.router.allow_migrate('replica', 'apps'))
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+@patch('apps.routers.is_healthy', return_value=True)
+class ReplicaMiddlewareTest(BaseAppDjangoTest):
+    """Test replica reads and stickiness of requests."""
+
+    def _serve(self, method='get', view_name='posts-graph-data', cookies=None, write=False):
+        """Run a request through the middleware; return the read database and the response."""
+        seen = []
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = type(str('Match'), (object,), {'view_name': view_name})()
+
+        def view(request):
+            if write:
+                routers.ReplicaRouter().db_for_write(IP)
+            seen.append(routers.ReplicaRouter().db_for_read(IP))
+            return HttpResponse()
+        middleware = ReplicaMiddleware(lambda request: middleware.process_view(request, view, (), {}) or view(request))
+        return seen[0] if seen else None, middleware(request)
+
+    def test_listed_view_reads_replica(self, is_healthy):
+        """Test safe requests to listed views read from a replica."""
+        self.assertEqual(self._serve()[0], 'replica')
+
+    def test_unlisted_or_unsafe_requests_read_primary(self, is_healthy):
+        """Test other views and methods read from the primary."""
+        self.assertEqual(self._serve(view_name='plans-create')[0], 'default')
+        self.assertEqual(self._serve(method='post')[0], 'default')
+
+    def test_write_sets_sticky_cookie(self, is_healthy):
+        """Test a write keeps the client on the primary afterwards."""
+        database, response = self._serve(method='post', write=True)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        cookies = {settings.REPLICA_STICKY_COOKIE: '1'}
+        self.assertEqual(self._serve(cookies=cookies)[0], 'default')
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_HEALTH_CHECK_INTERVAL=0)
+class ReplicaHealthTest(BaseAppDjangoTest):
+    """Test replicas are only read once they hold the primary's schema."""
+
+    multi_db = True
+
+    def setUp(self):
+        """Forget earlier checks."""
+        routers._health.clear()
+
+    def test_up_to_date_replica(self):
+        """Test a replica with every migration applied is healthy."""
+        self.assertTrue(routers.is_healthy('replica'))
+
+    def test_outdated_replica(self):
+        """Test a replica missing migrations is not read."""
+        with patch('apps.routers._applied_migrations', side_effect=lambda alias: 0 if alias == 'replica' else 5):
+            self.assertFalse(routers.is_healthy('replica'))
+            self.assertEqual(routers.read_replica(), 'default')
+
+    def test_no_replica_by_default(self):
+        """Test reads stay on the primary unless replicas are listed."""
+        with override_settings(REPLICA_DATABASES=[]), routers.replica_reads():
+            self.assertEqual(routers.ReplicaRouter().db_for_read(IP), 'default')
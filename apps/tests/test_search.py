@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from mock import patch
+
+from apps.forms import CustomUserWidget
+from apps.models import UserSearchDocument
+from apps.search import normalize, rebuild_index, search_user_ids
+from user_profile.models import CustomUser
+from .base_testcases import BaseAppDjangoTest
+from .factories import CustomUserFactory
+
+SKILL_MODEL = CustomUser.professional_skills.field.related_model
+
+
+class NormalizeTest(BaseAppDjangoTest):
+    """Test search text normalization."""
+
+    def test_strips_accents_and_punctuation(self):
+        """Test accents, case and punctuation are folded."""
+        self.assertEqual(normalize('  Zoë O\'Brien-Ashé  '), 'zoe o brien ashe')
+
+    def test_splits_email(self):
+        """Test emails are split into searchable tokens."""
+        self.assertEqual(normalize('John.Doe@Example.com'), 'john doe example com')
+
+
+class UserSearchIndexTest(BaseAppDjangoTest):
+    """Test the user search index and the autocomplete widget."""
+
+    def setUp(self):
+        """Setup a few users."""
+        self.john = CustomUserFactory(first_name='John', last_name='Mensah', city='Accra')
+        self.johanna = CustomUserFactory(first_name='Johanna', last_name='Owusu', city='Kumasi')
+        self.ama = CustomUserFactory(first_name='Ama', last_name='Johnson', city='Accra')
+
+    def test_document_kept_current_on_save(self):
+        """Test saving a user refreshes its document."""
+        self.john.city = 'Tamale'
+        self.john.save()
+        self.assertIn('tamale', UserSearchDocument.objects.get(user=self.john).document)
+
+    def test_unchanged_document_not_written(self):
+        """Test saves leaving the document alone neither write it nor invalidate the autocomplete."""
+        with patch('apps.autocomplete.bump_versions_on_commit') as bump:
+            with patch('apps.search.build_document') as build_document:
+                self.john.save(update_fields=['last_login'])
+            self.assertFalse(build_document.called)
+            self.john.save()
+        self.assertFalse(bump.called)
+        self.john.city = 'Tamale'
+        with patch('apps.autocomplete.bump_versions_on_commit') as bump:
+            self.john.save()
+        self.assertTrue(bump.called)
+
+    def test_prefix_match(self):
+        """Test every token is matched by prefix."""
+        self.assertEqual(set(search_user_ids('joh')), {self.john.pk, self.johanna.pk, self.ama.pk})
+        self.assertEqual(set(search_user_ids('joh acc')), {self.john.pk, self.ama.pk})
+        self.assertEqual(search_user_ids('kumasi'), [self.johanna.pk])
+        self.assertEqual(search_user_ids('   '), [])
+
+    def test_widget_uses_index(self):
+        """Test the widget returns only indexed matches."""
+        queryset = CustomUserWidget().filter_queryset(None, 'mensah')
+        self.assertEqual(list(queryset), [self.john])
+
+    def test_failed_rebuild_keeps_index(self):
+        """Test a rebuild failing partway leaves the previous documents in place."""
+        with patch('apps.search.build_document', side_effect=[u'john', RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                rebuild_index(batch_size=1)
+        self.assertEqual(UserSearchDocument.objects.count(), 3)
+        self.assertEqual(search_user_ids('kumasi'), [self.johanna.pk])
+
+    def test_results_not_capped(self):
+        """Test every match is returned and paged by the widget, best ranked first."""
+        self.assertEqual(len(search_user_ids('joh', limit=2)), 2)
+        user_ids = search_user_ids('joh')
+        self.assertEqual(set(user_ids), {self.john.pk, self.johanna.pk, self.ama.pk})
+        self.assertEqual([user.pk for user in CustomUserWidget().filter_queryset(None, 'joh')], user_ids)
+
+    def test_skill_rename_reindexes_users(self):
+        """Test renaming a skill refreshes the documents of the users having it."""
+        skill = SKILL_MODEL.objects.create(professional_skills='Plumbing')
+        self.john.professional_skills.add(skill)
+        self.assertEqual(search_user_ids('plumbing'), [self.john.pk])
+        skill.professional_skills = 'Carpentry'
+        skill.save()
+        self.assertEqual(search_user_ids('carpentry'), [self.john.pk])
+        self.assertEqual(search_user_ids('plumbing'), [])
+
+    def test_skill_side_changes_reindex_users(self):
+        """Test assigning, clearing and deleting a skill from its side refreshes its users."""
+        skill = SKILL_MODEL.objects.create(professional_skills='Tailoring')
+        users = getattr(skill, CustomUser.professional_skills.field.remote_field.get_accessor_name())
+        users.add(self.john, self.ama)
+        self.assertEqual(set(search_user_ids('tailoring')), {self.john.pk, self.ama.pk})
+        users.clear()
+        self.assertEqual(search_user_ids('tailoring'), [])
+        users.add(self.johanna)
+        skill.delete()
+        self.assertEqual(search_user_ids('tailoring'), [])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.models import IP
+from apps.snapshots import IPSnapshot, get_snapshots
+from .factories import IPFactory
+
+
+class IPSnapshotTest(TransactionTestCase):
+    """Test the per-language IP display snapshots.
+
+    Invalidations are flushed on commit, so saves must really commit.
+    """
+
+    def setUp(self):
+        """Setup a few IPs."""
+        cache.clear()
+        self.ips = [IPFactory(company_name=name) for name in ('alpha', 'bravo', 'charlie')]
+        self.ids = [ip.pk for ip in self.ips]
+
+    def test_snapshot_fields(self):
+        """Test snapshots hold the displayed values in the requested order."""
+        snapshots = get_snapshots(reversed(self.ids), 'en')
+        self.assertTrue(all(isinstance(snapshot, IPSnapshot) for snapshot in snapshots))
+        self.assertEqual([snapshot.company_name for snapshot in snapshots], ['charlie', 'bravo', 'alpha'])
+        self.assertEqual(snapshots[0].url, self.ips[2].get_absolute_url())
+
+    def test_cached_snapshots_skip_database(self):
+        """Test a second fetch is served from the cache."""
+        get_snapshots(self.ids, 'en')
+        with CaptureQueriesContext(connection) as queries:
+            get_snapshots(self.ids, 'en')
+        self.assertEqual(len(queries), 0)
+
+    def test_save_refreshes_snapshot(self):
+        """Test a saved IP gets a new snapshot."""
+        get_snapshots(self.ids, 'en')
+        self.ips[0].company_name = 'alpine'
+        self.ips[0].save()
+        self.assertEqual(get_snapshots([self.ids[0]], 'en')[0].company_name, 'alpine')
+
+    def test_deleted_ip_is_dropped(self):
+        """Test snapshots of deleted IPs are not served."""
+        get_snapshots(self.ids, 'en')
+        self.ips[1].delete()
+        self.assertEqual([snapshot.id for snapshot in get_snapshots(self.ids, 'en')],
+                         [self.ids[0], self.ids[2]])
+
+    def test_snapshot_page(self):
+        """Test listings page through snapshots by name."""
+        page = IP.objects.visible().snapshot_page(per_page=2, language='en')
+        self.assertEqual([snapshot.company_name for snapshot in page.object_list], ['alpha', 'bravo'])
+        self.assertTrue(page.has_next)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from mock import patch
+
+from apps.models import StripeObjectFingerprint, SyncWatermark
+from apps.stripe_sync import LocalStripeStub, PlanSyncEngine, last_plan_sync
+from .base_testcases import BaseAppDjangoTest
+
+
+class PlanSyncEngineTest(BaseAppDjangoTest):
+    """Test the incremental Stripe plan sync against the local stub."""
+
+    def setUp(self):
+        """Setup a stub holding a few pages of plans."""
+        self.stub = LocalStripeStub.generate(25)
+        self.engine = PlanSyncEngine(client=self.stub, page_size=10)
+
+    @patch('apps.stripe_sync.Plan.sync_from_stripe_data')
+    def test_fetches_page_by_page(self, sync_mock):
+        """Test every plan is upserted once, three pages of ten."""
+        result = self.engine.sync()
+
+        self.assertEqual(result.seen, 25)
+        self.assertEqual(result.changed, 25)
+        self.assertEqual(result.pages, 3)
+        self.assertEqual(self.stub.calls, 3)
+        self.assertEqual(sync_mock.call_count, 25)
+        self.assertEqual(StripeObjectFingerprint.objects.count(), 25)
+
+    @patch('apps.stripe_sync.Plan.sync_from_stripe_data')
+    def test_skips_unchanged_plans(self, sync_mock):
+        """Test a second pass only upserts the plan whose data changed."""
+        self.engine.sync()
+        sync_mock.reset_mock()
+        self.stub.plans[3]['amount'] = 1
+
+        result = self.engine.sync()
+
+        self.assertEqual(result.changed, 1)
+        sync_mock.assert_called_once_with(self.stub.plans[3])
+
+    @patch('apps.stripe_sync.Plan.sync_from_stripe_data')
+    def test_records_watermark(self, sync_mock):
+        """Test the watermark is stored after a run."""
+        self.assertIsNone(last_plan_sync())
+        self.engine.sync()
+
+        watermark = SyncWatermark.objects.get()
+        self.assertEqual(watermark.objects_seen, 25)
+        self.assertEqual(last_plan_sync(), watermark.last_synced)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.test.utils import override_settings
+
+from apps import telemetry
+from .base_testcases import BaseAppDjangoTest
+
+
+@override_settings(TELEMETRY_SAMPLE_RATE=1, TELEMETRY_BUCKETS=(0.1, 1), TELEMETRY_METRICS_TOKEN='secret')
+class TelemetryTest(BaseAppDjangoTest):
+    """Test the per-view request telemetry."""
+
+    def setUp(self):
+        """Start from empty measurements."""
+        telemetry.reset()
+
+    def test_histogram_buckets(self):
+        """Test observations are exported as cumulative buckets."""
+        trace = telemetry.Trace()
+        for duration in (0.05, 0.5, 5):
+            telemetry.record_request('plans', duration, trace)
+        text = telemetry.render_prometheus()
+        self.assertIn('apps_request_duration_seconds_bucket{view="plans",le="0.1"} 1', text)
+        self.assertIn('apps_request_duration_seconds_bucket{view="plans",le="1"} 2', text)
+        self.assertIn('apps_request_duration_seconds_bucket{view="plans",le="+Inf"} 3', text)
+        self.assertIn('apps_request_duration_seconds_count{view="plans"} 3', text)
+
+    def test_request_counts_cache_lookups_and_external_calls(self):
+        """Test a traced request records its cache lookups and external calls."""
+        cache.set('telemetry_test', 1)
+        with telemetry.trace_request() as trace:
+            cache.get('telemetry_test')
+            cache.get_many(['telemetry_test', 'telemetry_missing'])
+            with telemetry.external_call('stripe'):
+                pass
+        self.assertEqual((trace.cache_hits, trace.cache_misses), (2, 1))
+        self.assertEqual([service for service, __ in trace.external], ['stripe'])
+
+    def test_background_external_call(self):
+        """Test calls outside a request are reported under the background view."""
+        with telemetry.external_call('twitter'):
+            pass
+        self.assertIn('apps_external_call_duration_seconds_count{view="<background>",service="twitter"} 1',
+                      telemetry.render_prometheus())
+
+    def test_middleware_records_view_name(self):
+        """Test the middleware labels requests with the resolved URL name."""
+        self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('apps_request_duration_seconds_count{view="metrics"} 1', response.content.decode('utf-8'))
+
+    def test_metrics_token(self):
+        """Test the endpoint requires the bearer token."""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(TELEMETRY_METRICS_TOKEN=None)
+    def test_closed_without_token(self):
+        """Test the endpoint is closed while no token is configured."""
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+
+    def test_finished_threads_pruned(self):
+        """Test the counters of finished threads are kept but their aggregates dropped."""
+        def record():
+            with telemetry.external_call('twitter'):
+                pass
+        threads = [threading.Thread(target=record) for __ in range(5)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertIn('apps_external_call_duration_seconds_count{view="<background>",service="twitter"} 5',
+                      telemetry.render_prometheus())
+        self.assertFalse(any(thread in threads for thread, __ in telemetry._aggregates))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from concurrent.futures import Future
+
+from django.core.cache import cache
+from mock import patch
+
+from apps.twitter_feeds import FEED_KEY, LOCK_KEY, FakeTimelineProvider, get_feed, warm_feeds
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory
+
+
+class SynchronousExecutor(object):
+    """Executor running submitted calls right away, so background refreshes are done on return."""
+
+    def submit(self, fn, *args, **kwargs):
+        """Run `fn` and return its completed future."""
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+class TwitterFeedTest(BaseAppDjangoTest):
+    """Test the stale-while-revalidate twitter feed cache."""
+
+    def setUp(self):
+        """Setup an IP, a fake timeline and synchronous refreshes."""
+        cache.clear()
+        patcher = patch('apps.twitter_feeds._get_executor', return_value=SynchronousExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ip = IPFactory(twitter_username='accra')
+        self.provider = FakeTimelineProvider({'accra': ['t1', 't2']}, failing=['down'])
+
+    def _expire(self, ip):
+        """Mark the cached entry of an IP as stale."""
+        entry = cache.get(FEED_KEY % ip.id)
+        entry['fresh_until'] = time.time() - 1
+        cache.set(FEED_KEY % ip.id, entry)
+
+    def test_fetches_once_while_fresh(self):
+        """Test a fresh entry is served without calling the provider."""
+        self.assertEqual(get_feed(self.ip, self.provider), ['t1', 't2'])
+        self.assertEqual(get_feed(self.ip, self.provider), ['t1', 't2'])
+        self.assertEqual(self.provider.calls, ['accra'])
+
+    def test_serves_stale_while_refreshing(self):
+        """Test a stale entry is returned while the refresh happens."""
+        get_feed(self.ip, self.provider)
+        self._expire(self.ip)
+        self.provider.timelines['accra'] = ['t3']
+
+        self.assertEqual(get_feed(self.ip, self.provider), ['t1', 't2'])
+        self.assertEqual(get_feed(self.ip, self.provider), ['t3'])
+
+    def test_serves_stale_negative_entry(self):
+        """Test a stale negative entry is served without waiting for the retry."""
+        ip = IPFactory(twitter_username='down')
+        get_feed(ip, self.provider)
+        self._expire(ip)
+        self.provider.failing.clear()
+        self.provider.timelines['down'] = ['d1']
+
+        self.assertIsNone(get_feed(ip, self.provider))
+        self.assertEqual(get_feed(ip, self.provider), ['d1'])
+
+    def test_single_flight(self):
+        """Test no fetch starts while another worker holds the lock."""
+        cache.add(LOCK_KEY % self.ip.id, 1)
+        self.assertIsNone(get_feed(self.ip, self.provider))
+        self.assertEqual(self.provider.calls, [])
+
+    def test_negative_result_cached(self):
+        """Test failures are not retried before the backoff elapses."""
+        ip = IPFactory(twitter_username='down')
+        self.assertIsNone(get_feed(ip, self.provider))
+        self.assertIsNone(get_feed(ip, self.provider))
+        self.assertEqual(self.provider.calls, ['down'])
+        self.assertEqual(cache.get(FEED_KEY % ip.id)['failures'], 1)
+
+    def test_warm_feeds(self):
+        """Test a listing page is warmed in one pass."""
+        other = IPFactory(twitter_username='kumasi')
+        silent = IPFactory(twitter_username='')
+        self.provider.timelines['kumasi'] = ['k1']
+
+        feeds = warm_feeds([self.ip, other, silent], self.provider)
+
+        self.assertEqual(feeds, {self.ip.id: ['t1', 't2'], other.id: ['k1'], silent.id: None})
+        self.assertEqual(other.get_twitter_feed, ['k1'])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.test.utils import override_settings
+from django.urls import reverse
+from mock import patch
+
+from apps.twitter_feeds import LOCK_KEY, HTTPTimelineProvider, warm_feeds
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory, StaffFactory
+
+
+class FakeTwitter(object):
+    """Local Twitter API answering a timeline per user; users in `held` wait for `release`."""
+
+    def __init__(self, delay=0):
+        """Start the server on a free port."""
+        fake = self
+        self.delay = delay
+        self.held = set()
+        self.release = threading.Event()
+        self.requests = []
+        self.inflight = self.max_inflight = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                username = parse_qs(urlparse(self.path).query)['screen_name'][0]
+                with fake.lock:
+                    fake.requests.append(username)
+                    fake.inflight += 1
+                    fake.max_inflight = max(fake.max_inflight, fake.inflight)
+                if username in fake.held:
+                    fake.release.wait(10)
+                else:
+                    time.sleep(fake.delay)
+                body = json.dumps([{'id': 1, 'text': 'hello %s' % username, 'created_at': 'now'}]).encode('utf-8')
+                with fake.lock:
+                    fake.inflight -= 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        """Return the base url of the server."""
+        return 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def close(self):
+        """Let held requests finish and stop the server."""
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(TWITTER_FEED_TIMEOUT=0.3)
+class ConcurrentTwitterFeedsTest(BaseAppDjangoTest):
+    """Test feeds are fetched concurrently from a fake Twitter, within the timeout."""
+
+    def setUp(self):
+        """Setup IPs, a fake Twitter and a thread pool."""
+        cache.clear()
+        self.upstream = FakeTwitter(delay=0.1)
+        self.addCleanup(self.upstream.close)
+        self.provider = HTTPTimelineProvider(base_url=self.upstream.url, timeout=5)
+        self.ips = [IPFactory(twitter_username='user%d' % i) for i in range(4)]
+        self._pool(8)
+
+    def _pool(self, workers):
+        """Run the fetches on a pool of `workers` threads."""
+        executor = ThreadPoolExecutor(max_workers=workers)
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(self.upstream.release.set)
+        patcher = patch('apps.twitter_feeds._get_executor', return_value=executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetches_concurrently(self):
+        """Test the feeds of several IPs are fetched at the same time."""
+        feeds = warm_feeds(self.ips, self.provider)
+        self.assertEqual([feeds[ip.id][0]['text'] for ip in self.ips], ['hello user0', 'hello user1',
+                                                                          'hello user2', 'hello user3'])
+        self.assertGreater(self.upstream.max_inflight, 1)
+
+    def test_slow_upstream_abandoned(self):
+        """Test a feed still fetching after the timeout is left out, the others are served."""
+        self.upstream.held.add('user0')
+        feeds = warm_feeds(self.ips[:2], self.provider)
+        self.assertIsNone(feeds[self.ips[0].id])
+        self.assertEqual(feeds[self.ips[1].id][0]['text'], 'hello user1')
+
+    def test_queued_fetch_cancelled(self):
+        """Test a fetch still queued after the timeout is cancelled and its lock released."""
+        self._pool(1)
+        self.upstream.held.add('user0')
+        feeds = warm_feeds(self.ips[:2], self.provider)
+        self.assertEqual(feeds, {self.ips[0].id: None, self.ips[1].id: None})
+        self.assertIsNone(cache.get(LOCK_KEY % self.ips[1].id))
+        self.assertNotIn('user1', self.upstream.requests)
+
+
+@override_settings(TWITTER_TIMELINE_PROVIDER='apps.twitter_feeds.HTTPTimelineProvider')
+class IPTwitterFeedsViewTest(BaseAppDjangoTest):
+    """Test the twitter feeds endpoint."""
+
+    def setUp(self):
+        """Setup a visible and a hidden IP and a fake Twitter."""
+        cache.clear()
+        self.upstream = FakeTwitter()
+        self.addCleanup(self.upstream.close)
+        self.ip = IPFactory(twitter_username='accra')
+        self.hidden = IPFactory(twitter_username='secret', hidden=True)
+        self.url = '%s?ids=%s,%s' % (reverse('ip-twitter-feeds'), self.ip.pk, self.hidden.pk)
+
+    def test_login_required(self):
+        """Test anonymous requests are redirected and reach no upstream."""
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.assertEqual(self.upstream.requests, [])
+
+    def test_feeds_of_visible_ips(self):
+        """Test the feeds of visible IPs are returned as JSON."""
+        self.client.force_login(StaffFactory())
+        with self.settings(TWITTER_API_URL=self.upstream.url):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'feeds': {
+            str(self.ip.pk): [{'id': 1, 'text': 'hello accra', 'created_at': 'now'}]}})
+        self.assertEqual(self.upstream.requests, ['accra'])
+
+    def test_invalid_ids(self):
+        """Test malformed ids are rejected."""
+        self.client.force_login(StaffFactory())
+        self.assertEqual(self.client.get(reverse('ip-twitter-feeds'), {'ids': 'x'}).status_code, 400)
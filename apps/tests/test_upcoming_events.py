@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.test.utils import CaptureQueriesContext
+from mock import patch
+
+from apps.apps import create_event_index
+from apps.models import IP
+from .base_testcases import BaseAppDjangoTest
+from .factories import IPFactory, StaffFactory
+
+
+class UpcomingEventsTest(BaseAppDjangoTest):
+    """Test upcoming events annotations and IP.valid_events."""
+
+    def setUp(self):
+        """Setup an IP with two managers."""
+        self.ip = IPFactory()
+        self.ip.managers.add(StaffFactory(), StaffFactory())
+
+    def test_valid_events_type(self):
+        """Test valid_events is a queryset, or the prefetched list."""
+        self.assertIsInstance(IP.objects.get(pk=self.ip.pk).valid_events, QuerySet)
+        self.assertIsInstance(IP.objects.with_upcoming_events().get(pk=self.ip.pk).valid_events, list)
+
+    def test_prefetched_valid_events_run_no_query(self):
+        """Test len, truth and iteration are served from the prefetch."""
+        ip = IP.objects.with_upcoming_events().get(pk=self.ip.pk)
+        with self.assertNumQueries(0):
+            events = ip.valid_events
+            self.assertEqual(len(events), 0)
+            self.assertFalse(events)
+            self.assertEqual(list(events), [])
+
+    def test_count_is_distinct(self):
+        """Test the count is not multiplied by other joins."""
+        queryset = IP.objects.filter(managers__is_staff=True).with_upcoming_events()
+        self.assertIn('COUNT(DISTINCT', str(queryset.query).upper())
+        self.assertEqual([ip.upcoming_event_count for ip in queryset], [0, 0])
+
+    @patch('apps.apps.router.allow_migrate_model', return_value=False)
+    def test_event_index_skipped_on_unmigrated_alias(self, allow_migrate_model):
+        """Test the event index is not created on an alias the events are not migrated to."""
+        with CaptureQueriesContext(connection) as queries:
+            create_event_index(sender=None, using='default')
+        self.assertEqual(queries.captured_queries, [])
@@ -0,0 +1,201 @@
+"""Stale-while-revalidate cache of IP twitter timelines.
+
+A feed entry stays fresh for `TWITTER_BLOCK_CACHE_EXPIRY` seconds and is kept
+for `TWITTER_FEED_STALE_EXPIRY` seconds. A stale entry is served as is while a
+background thread refreshes it. Only one worker refreshes an IP at a time,
+guarded by a cache lock. Failed and empty fetches are cached too, with an
+exponential backoff before the next attempt.
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .telemetry import external_call
+
+logger = logging.getLogger(settings.CUSTOM_LOGGER)
+
+FEED_KEY = 'twitter_feed_%s'
+LOCK_KEY = 'twitter_feed_lock_%s'
+
+TWEET_FIELDS = ('id', 'text', 'created_at')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class TwitterTimelineProvider(object):
+    """Timeline provider calling the Twitter API with a timeout."""
+
+    def get_user_timeline(self, username):
+        """Return the latest statuses of a twitter user."""
+        import twitter
+        with external_call('twitter'):
+            return twitter.Api(timeout=settings.TWITTER_FEED_TIMEOUT).GetUserTimeline(username)
+
+
+class HTTPTimelineProvider(object):
+    """Timeline provider calling the REST API at `TWITTER_API_URL` with the standard library."""
+
+    def __init__(self, base_url=None, bearer_token=None, timeout=None):
+        """Set up the API url, the token and the request timeout."""
+        self.base_url = base_url or settings.TWITTER_API_URL
+        self.bearer_token = bearer_token or settings.TWITTER_BEARER_TOKEN
+        self.timeout = timeout or settings.TWITTER_FEED_TIMEOUT
+
+    def get_user_timeline(self, username):
+        """Return the latest statuses of a twitter user as dicts."""
+        request = Request('%s/statuses/user_timeline.json?%s' % (self.base_url, urlencode({'screen_name': username})))
+        if self.bearer_token:
+            request.add_header('Authorization', 'Bearer %s' % self.bearer_token)
+        with external_call('twitter'):
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+
+
+class FakeTimelineProvider(object):
+    """Local timeline provider for tests, benchmarks and offline development."""
+
+    def __init__(self, timelines=None, failing=(), delay=0):
+        """Serve `timelines` by username and raise for usernames in `failing`."""
+        self.timelines = dict(timelines or {})
+        self.failing = set(failing)
+        self.delay = delay
+        self.calls = []
+
+    def get_user_timeline(self, username):
+        """Return the canned timeline of a user."""
+        self.calls.append(username)
+        if self.delay:
+            time.sleep(self.delay)
+        if username in self.failing:
+            raise IOError('Timeline of %s is unavailable' % username)
+        return list(self.timelines.get(username, []))
+
+
+def get_provider():
+    """Return the timeline provider configured by `TWITTER_TIMELINE_PROVIDER`."""
+    return import_string(settings.TWITTER_TIMELINE_PROVIDER)()
+
+
+def _get_executor():
+    """Return the process wide pool running background refreshes."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TWITTER_FEED_WORKERS)
+        return _executor
+
+
+def _backoff(failures):
+    """Return seconds before retrying a feed after `failures` negative results."""
+    return min(settings.TWITTER_FEED_BACKOFF * 2 ** (failures - 1), settings.TWITTER_FEED_MAX_BACKOFF)
+
+
+def refresh_feed(ip_id, username, provider=None):
+    """Fetch a timeline and store it; return the tweets to serve.
+
+    The caller must hold the refresh lock of the IP; it is released here.
+    """
+    key = FEED_KEY % ip_id
+    try:
+        previous = cache.get(key) or {}
+        try:
+            tweets = (provider or get_provider()).get_user_timeline(username)
+            tweets = list(tweets or [])[:settings.TWITTER_BLOCK_ITEMS] or None
+            failed = False
+        except Exception:
+            logger.warning('Could not fetch twitter timeline of %s', username, exc_info=True)
+            tweets = previous.get('tweets') if previous.get('username') == username else None
+            failed = True
+        if tweets and not failed:
+            failures, ttl = 0, settings.TWITTER_BLOCK_CACHE_EXPIRY
+        else:
+            failures = previous.get('failures', 0) + 1
+            ttl = _backoff(failures)
+        entry = {'username': username, 'tweets': tweets, 'failures': failures, 'fresh_until': time.time() + ttl}
+        cache.set(key, entry, max(ttl, settings.TWITTER_FEED_STALE_EXPIRY))
+        return tweets
+    finally:
+        cache.delete(LOCK_KEY % ip_id)
+
+
+def _acquire(ip_id):
+    """Take the single-flight refresh lock of an IP."""
+    return cache.add(LOCK_KEY % ip_id, 1, settings.TWITTER_FEED_TIMEOUT * 2)
+
+
+def _schedule_refresh(ip_id, username, provider=None):
+    """Refresh a feed in the background unless another worker already is."""
+    if _acquire(ip_id):
+        return _get_executor().submit(refresh_feed, ip_id, username, provider)
+    return None
+
+
+def _resolve(ip, entry, provider=None):
+    """Return `(tweets, future)` for an IP given its cached entry."""
+    if entry and entry.get('username') == ip.twitter_username:
+        if entry['fresh_until'] > time.time():
+            return entry['tweets'], None
+        # Stale entries, negative ones included, are served right away while the retry runs.
+        _schedule_refresh(ip.id, ip.twitter_username, provider)
+        return entry['tweets'], None
+    return None, _schedule_refresh(ip.id, ip.twitter_username, provider)
+
+
+def get_feed(ip, provider=None):
+    """Return the tweets of an IP, serving stale data while it refreshes."""
+    if not ip.twitter_username:
+        return None
+    tweets, future = _resolve(ip, cache.get(FEED_KEY % ip.id), provider)
+    if future is not None:
+        done, __ = wait([future], timeout=settings.TWITTER_FEED_TIMEOUT)
+        if done:
+            tweets = future.result()
+    return tweets
+
+
+def warm_feeds(ips, provider=None):
+    """Resolve the feeds of many IPs in one pass and memoize them on the instances.
+
+    Cached entries are read with a single multi-get; missing feeds are fetched
+    concurrently and awaited together for at most `TWITTER_FEED_TIMEOUT`
+    seconds, stale ones refresh in the background. Return a dict of tweets by
+    IP id.
+    """
+    ips = list(ips)
+    entries = cache.get_many([FEED_KEY % ip.id for ip in ips if ip.twitter_username])
+    feeds, pending = {}, {}
+    for ip in ips:
+        if not ip.twitter_username:
+            feeds[ip.id] = None
+            continue
+        feeds[ip.id], future = _resolve(ip, entries.get(FEED_KEY % ip.id), provider)
+        if future is not None:
+            pending[future] = ip.id
+    if pending:
+        done, not_done = wait(list(pending), timeout=settings.TWITTER_FEED_TIMEOUT)
+        for future in done:
+            feeds[pending[future]] = future.result()
+        for future in not_done:
+            # Fetches still queued are dropped; running ones are bounded by the provider timeout.
+            if future.cancel():
+                cache.delete(LOCK_KEY % pending[future])
+    for ip in ips:
+        ip._twitter_feed = feeds[ip.id]
+    return feeds
+
+
+def tweet_as_dict(tweet):
+    """Return the JSON serializable fields of a status, whichever provider fetched it."""
+    if isinstance(tweet, dict):
+        return dict((name, tweet.get(name)) for name in TWEET_FIELDS)
+    return dict((name, getattr(tweet, name, None)) for name in TWEET_FIELDS)
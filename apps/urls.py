@@ -22,4 +22,10 @@ urlpatterns = [
     path('plans/<int:plan_pk>/update', PlanUpdate.as_view(), name='plans-update'),
     path('plans/', PlanListView.as_view(), name='plans'),
     path('posts/', PostView.as_view(), name='posts'),
+    path('posts/graph-data', PostGraphDataView.as_view(), name='posts-graph-data'),
+    path('ips/twitter-feeds', IPTwitterFeedsView.as_view(), name='ip-twitter-feeds'),
+    path('ips/<int:ip_id>', IPDetailView.as_view(), name='ip_detail'),
+    path('select2/auto.json', AutocompleteView.as_view(), name='autocomplete'),
+    path('api/ips', IPAPIView.as_view(), name='api-ips'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,16 +1,31 @@
 """Demo code for the controllers."""
+import hmac
 import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import router
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+                         StreamingHttpResponse)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.generic import View
 from django.views.generic.detail import DetailView
 from django.contrib.auth.models import User
 from django.views.generic import TemplateView, ListView
 from django.views.generic.edit import CreateView, UpdateView
 from users.forms import UserPlanCreateForm
 from djstripe.models import Plan
-import stripe
-from django.conf import settings
+from django_select2.views import AutoResponseView
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
 from .decorators import administration_required
-from django.core.urlresolvers import reverse_lazy
+from . import api, graphs, telemetry, twitter_feeds
+from .autocomplete import CachedAutocompleteMixin
+from .ip_cache import IP_NAMESPACE
+from .models import IP
+from .page_cache import PLANS_NAMESPACE, ConditionalPageMixin
+from .portals import lazy_base_portal
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required
 
 
@@ -36,7 +51,7 @@ class PostDetailView(PlanBaseViewMixin, DetailView):
     def get_context_data(self, **kwargs):
         """Customize context data."""
         context = super(PostDetailView, self).get_context_data(**kwargs)
-        context['base_portal'] = self.request.user.profile.get_base_portal()
+        context['base_portal'] = lazy_base_portal(self.request.user)
         return context
 
 
@@ -49,14 +64,55 @@ class PostView(TemplateView):
     def get_context_data(self, **kwargs):
         """Customize context data."""
         context = super(PostView, self).get_context_data(**kwargs)
-        tracker_list = self.request.user.profile.get_graph_source_data()
-        context['base_portal'] = self.request.user.profile.get_base_portal()
-        context["tracker_list"] = json.dumps(tracker_list)
+        context['base_portal'] = lazy_base_portal(self.request.user)
+        context["graph_data_url"] = reverse('posts-graph-data')
 
         return context
 
 
-class PlanListView(ListView):
+class PostGraphDataView(View):
+    """Stream the tracker graph of the current user from pre-aggregated rollups."""
+
+    max_points = 1000
+    default_range = timedelta(days=30)
+
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        """Dispatch method."""
+        return super(PostGraphDataView, self).dispatch(request, *args, **kwargs)
+
+    def _parse_moment(self, value, default):
+        """Return a datetime from an ISO string or an epoch, or `default` when missing."""
+        if not value:
+            return default
+        moment = parse_datetime(value)
+        return graphs.as_datetime(moment if moment is not None else value)
+
+    def get(self, request, *args, **kwargs):
+        """Return the graph series as a streamed JSON object."""
+        try:
+            end = self._parse_moment(request.GET.get('end'), timezone.now())
+            start = self._parse_moment(request.GET.get('start'), end - self.default_range)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid start or end.')
+        resolution = request.GET.get('resolution') or graphs.pick_resolution(start, end, self.max_points)
+        if resolution not in graphs.RESOLUTIONS or start >= end:
+            return HttpResponseBadRequest('Invalid range or resolution.')
+        rows = graphs.iter_series(request.user, start, end, resolution)
+        return StreamingHttpResponse(self._stream(resolution, rows), content_type='application/json')
+
+    def _stream(self, resolution, rows):
+        """Yield the JSON document one row at a time."""
+        yield '{"resolution": %s, "columns": ["time", "avg", "min", "max", "count"], "data": [' % \
+            json.dumps(resolution)
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(row)
+            separator = ','
+        yield ']}'
+
+
+class PlanListView(ConditionalPageMixin, ListView):
     """Return the list of all plans."""
 
     template_name = "users/plan_list.html"
@@ -67,14 +123,31 @@ class PlanListView(ListView):
         context = super(PlanListView, self).get_context_data(**kwargs)
         return context
 
+    def get_cache_namespaces(self):
+        """The page changes with any plan."""
+        return [PLANS_NAMESPACE]
+
     def get_queryset(self):
-        """Customize queryset method."""
-        stripe.api_key = settings.STRIPE_TEST_SECRET_KEY
-        plan_list = stripe.Plan.list()
-        [Plan.sync_from_stripe_data(pl) for pl in plan_list['data']]
+        """Read plans from the database; `sync_stripe_plans` keeps them current."""
         return Plan.objects.all()
 
 
+class IPDetailView(ConditionalPageMixin, DetailView):
+    """Public page of a visible IP, reversed by `IP.get_absolute_url`."""
+
+    template_name = "ips/ip_detail.html"
+    context_object_name = "ip"
+    pk_url_kwarg = 'ip_id'
+
+    def get_cache_namespaces(self):
+        """The page changes with the IP; `invalidate_ips_cache` bumps its namespace."""
+        return [IP_NAMESPACE % self.kwargs['ip_id']]
+
+    def get_queryset(self):
+        """Only visible IPs have a public page."""
+        return IP.objects.visible()
+
+
 class PlanCreate(PlanBaseViewMixin, CreateView):
     """Plan view for creating an new object instance."""
 
@@ -116,3 +189,89 @@ class PlanUpdate(PlanBaseViewMixin, UpdateView):
         self.object.user = self.request.user
         response = super(PlanUpdate, self).form_valid(form)
         return response
+
+
+class MetricsView(View):
+    """Export the request telemetry of this process for Prometheus."""
+
+    def get(self, request, *args, **kwargs):
+        """Return the metrics, if the bearer token matches `TELEMETRY_METRICS_TOKEN`; deny when none is set."""
+        token = settings.TELEMETRY_METRICS_TOKEN
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not token or not hmac.compare_digest(authorization.encode('utf-8'),
+                                                ('Bearer %s' % token).encode('utf-8')):
+            return HttpResponseForbidden()
+        return HttpResponse(telemetry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AutocompleteView(AutoResponseView):
+    """Select2 autocomplete endpoint answering cached widgets from their projected rows."""
+
+    def get(self, request, *args, **kwargs):
+        """Return a page of `{id, text}` results."""
+        self.widget = self.get_widget_or_404()
+        dependent = getattr(self.widget, 'dependent_fields', None)
+        if not isinstance(self.widget, CachedAutocompleteMixin) or dependent:
+            return super(AutocompleteView, self).get(request, *args, **kwargs)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            raise Http404('Invalid page.')
+        results, more = self.widget.autocomplete_page(kwargs.get('term', request.GET.get('term', '')), page)
+        return JsonResponse({'results': [{'id': pk, 'text': label} for pk, label in results], 'more': more})
+
+
+class IPTwitterFeedsView(View):
+    """Return the twitter feeds of visible IPs, fetched concurrently with a timeout."""
+
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        """Dispatch method."""
+        return super(IPTwitterFeedsView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        """Return the feeds of the IPs listed in `ids` as JSON."""
+        try:
+            ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+        except ValueError:
+            return HttpResponseBadRequest('Invalid ids.')
+        ips = IP.objects.visible().filter(pk__in=ids[:settings.IP_LIST_PAGE_SIZE]).only('id', 'twitter_username')
+        feeds = twitter_feeds.warm_feeds(ips)
+        return JsonResponse({'feeds': dict(
+            (str(pk), [twitter_feeds.tweet_as_dict(tweet) for tweet in tweets] if tweets else [])
+            for pk, tweets in feeds.items())})
+
+
+class IPAPIView(View):
+    """JSON list of visible IPs with sparse fieldsets and cursor pagination.
+
+    Query parameters: `fields` (comma separated), `cursor`, `limit`,
+    `country`, and `mine=1` for the IPs the user may manage.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """Stream a page of IPs, compressed when the client accepts it."""
+        try:
+            fields = api.parse_fields(request.GET.get('fields'))
+            limit = int(request.GET['limit']) if request.GET.get('limit') else None
+            if limit is not None and limit < 1:
+                raise ValueError('Invalid limit.')
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        # The rows are read while the response streams, after the replica
+        # block of the middleware is closed, so the database is chosen now.
+        queryset = IP.objects.visible().using(router.db_for_read(IP))
+        if request.GET.get('country'):
+            queryset = queryset.by_country(request.GET['country'])
+        if request.GET.get('mine'):
+            if not request.user.is_authenticated:
+                return HttpResponseForbidden()
+            queryset = queryset.for_user(request.user)
+        chunks = api.stream_page(queryset, fields, request.GET.get('cursor'), limit)
+        encoding = api.negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        response = StreamingHttpResponse(api.compress_stream(chunks, encoding) if encoding else chunks,
+                                         content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding', 'Accept-Language', 'Cookie'))
+        return response
@@ -0,0 +1,18 @@
+"""
+ASGI config for demo_app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The views are synchronous; upstream calls run concurrently on thread pools
+with timeouts, so ASGI and WSGI servers serve them alike.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'demo_app.settings')
+
+application = get_asgi_application()
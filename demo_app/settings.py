@@ -41,15 +41,36 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.middleware.TelemetryMiddleware',
+    'apps.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.middleware.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Set CACHE_LOCATION to a memcached server shared by every process. Without it
+# each process has its own cache, and authorization data (permission sets,
+# principals) is not cached, so no process keeps granting revoked access.
+
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'apps.telemetry.TelemetryCache',
+        'OPTIONS': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_LOCATION,
+        } if CACHE_LOCATION else {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+}
+
 ROOT_URLCONF = 'demo_app.urls'
 
 TEMPLATES = [
@@ -74,13 +95,36 @@ WSGI_APPLICATION = 'demo_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# The replica is a second SQLite file refreshed by hand with
+# `manage.py sync_sqlite_replica`, so it is not listed in REPLICA_DATABASES;
+# point it at a real replica in production and list it there. Connections
+# persist for CONN_MAX_AGE seconds.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['apps.routers.ReplicaRouter']
+
+
+# Sessions created before ProfileModelBackend reference ModelBackend;
+# PrincipalMiddleware moves them to ProfileModelBackend.
+AUTHENTICATION_BACKENDS = [
+    'apps.backends.ProfileModelBackend',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -119,3 +163,183 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Stripe plan sync
+# Dotted path of the client used by apps.stripe_sync; point it at
+# 'apps.stripe_sync.LocalStripeStub' to run offline.
+
+STRIPE_PLAN_CLIENT = 'apps.stripe_sync.StripeAPIClient'
+
+STRIPE_SYNC_PAGE_SIZE = 100
+
+
+# Select2 autocomplete results
+# Up to AUTOCOMPLETE_MAX_CANDIDATES rows of a term are cached; longer terms are
+# filtered from the rows of a cached complete prefix of at least
+# AUTOCOMPLETE_MIN_PREFIX characters.
+
+AUTOCOMPLETE_MAX_CANDIDATES = 200
+
+AUTOCOMPLETE_MIN_PREFIX = 1
+
+AUTOCOMPLETE_CACHE_EXPIRY = 60
+
+
+# Cached IP permission sets
+
+PERMISSION_CACHE_EXPIRY = 60 * 60
+
+
+# Twitter feeds
+# Feeds are fresh for TWITTER_BLOCK_CACHE_EXPIRY seconds and served stale for up
+# to TWITTER_FEED_STALE_EXPIRY while they refresh. Failed or empty fetches are
+# retried after TWITTER_FEED_BACKOFF seconds, doubling up to TWITTER_FEED_MAX_BACKOFF.
+# HTTPTimelineProvider calls TWITTER_API_URL with TWITTER_BEARER_TOKEN.
+
+TWITTER_TIMELINE_PROVIDER = 'apps.twitter_feeds.TwitterTimelineProvider'
+
+TWITTER_FEED_TIMEOUT = 5
+
+TWITTER_FEED_WORKERS = 4
+
+TWITTER_FEED_STALE_EXPIRY = 24 * 60 * 60
+
+TWITTER_FEED_BACKOFF = 60
+
+TWITTER_FEED_MAX_BACKOFF = 60 * 60
+
+TWITTER_API_URL = 'https://api.twitter.com/1.1'
+
+TWITTER_BEARER_TOKEN = None
+
+
+# IP logo renditions
+# (width, height, format, quality) rendered eagerly for every uploaded logo.
+
+IP_LOGO_RENDITIONS = [
+    (180, 180, 'JPEG', 90),
+    (180, 180, 'WEBP', 85),
+    (360, 360, 'JPEG', 90),
+    (360, 360, 'WEBP', 85),
+]
+
+IP_LOGO_DEFAULT_RENDITION = '180x180.jpg'
+
+# Worker processes of `manage.py backfill_logo_renditions`; uploads render on a thread.
+IP_LOGO_RENDITION_WORKERS = 2
+
+
+# IP logo relocation
+
+LOGO_RELOCATION_CHUNK_SIZE = 1024 * 1024
+
+
+# IP listings
+
+IP_LIST_PAGE_SIZE = 25
+
+IP_SNAPSHOT_CACHE_EXPIRY = 24 * 60 * 60
+
+FEE_SCHEDULE_CACHE_EXPIRY = 24 * 60 * 60
+
+
+# IP read API
+# Responses stream API_STREAM_ROWS encoded rows at a time; brotli is used when
+# the client accepts it and the brotli package is installed, gzip otherwise.
+
+API_MAX_PAGE_SIZE = 100
+
+API_STREAM_ROWS = 64
+
+API_GZIP_LEVEL = 6
+
+API_BROTLI_QUALITY = 5
+
+
+# IP cache
+# Cache keys set for an IP outside its versioned namespace, with %s for the IP id;
+# they are deleted in one round trip whenever the IP is invalidated.
+
+IP_LEGACY_CACHE_KEYS = ['tweets_%s']
+
+
+# Conditional page caching
+# Rendered pages are kept this long under the versions of their content.
+
+PAGE_CACHE_EXPIRY = 60 * 60
+
+
+# Request principal
+
+PRINCIPAL_CACHE_EXPIRY = 60 * 60
+
+
+# Tracker graph rollups
+# New rows of TRACKER_POINT_MODEL ('app_label.Model') are folded into the rollups;
+# TRACKER_POINT_FIELDS names its user (or profile), timestamp and value fields.
+# While they are None, rollups are only built by `manage.py rebuild_tracker_rollups`.
+
+TRACKER_POINT_MODEL = None
+
+TRACKER_POINT_FIELDS = None
+
+
+# Base portal cache
+# BASE_PORTAL_RELATIONS names the profile relations `get_base_portal` follows;
+# changing or (un)assigning one of those portals drops the cached base portal
+# of the users linked to it. Saving or deleting any model listed in
+# BASE_PORTAL_INVALIDATION_MODELS drops every cached base portal. While
+# BASE_PORTAL_RELATIONS is None, base portals are resolved on every request.
+
+BASE_PORTAL_CACHE_EXPIRY = 60 * 60
+
+BASE_PORTAL_RELATIONS = None
+
+BASE_PORTAL_INVALIDATION_MODELS = []
+
+
+# Admin changelists
+
+PAGINATOR_COUNT_CACHE_EXPIRY = 5 * 60
+
+
+# IP import and export
+
+IP_TRANSFER_BATCH_SIZE = 1000
+
+
+# Request telemetry
+# A TELEMETRY_SAMPLE_RATE share of requests is measured. Histogram buckets are
+# in seconds. When TELEMETRY_FILE is set, every process writes its metrics to
+# it (%(pid)s is replaced) at most every TELEMETRY_FILE_INTERVAL seconds.
+# /metrics answers only requests bearing TELEMETRY_METRICS_TOKEN; it is closed
+# while no token is set.
+
+TELEMETRY_SAMPLE_RATE = 0.1
+
+TELEMETRY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+TELEMETRY_FILE = None
+
+TELEMETRY_FILE_INTERVAL = 60
+
+TELEMETRY_METRICS_TOKEN = None
+
+
+# Read replicas
+# Safe requests to REPLICA_READ_VIEWS (URL names) read from a healthy replica.
+# A client that wrote is kept on the primary for REPLICA_STICKY_SECONDS.
+# Replicas missing migrations of the primary are not read. Pages and autocomplete
+# rows stored in version-keyed caches are always computed on the primary, so the
+# plans and autocomplete views are not listed.
+
+REPLICA_DATABASES = []
+
+REPLICA_READ_VIEWS = ['posts-graph-data', 'django_select2-json', 'api-ips']
+
+REPLICA_STICKY_COOKIE = 'primary_pin'
+
+REPLICA_STICKY_SECONDS = 10
+
+REPLICA_HEALTH_CHECK_INTERVAL = 30